@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+东方财富K线解析微基准：逐行解析（旧实现） vs 批量解析 parse_eastmoney_klines
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from provider_client import KLINE_COLUMNS, KLINE_EXTRA_COLUMNS, parse_eastmoney_klines
+
+
+def parse_klines_loop(klines):
+    """旧实现：逐行 split 并调用 pd.to_datetime"""
+    df_data = []
+    for line in klines:
+        try:
+            parts = line.split(',')
+            if len(parts) >= 6:
+                df_data.append({
+                    'Date': pd.to_datetime(parts[0]),
+                    'Open': float(parts[1]),
+                    'Close': float(parts[2]),
+                    'High': float(parts[3]),
+                    'Low': float(parts[4]),
+                    'Volume': int(parts[5])
+                })
+        except (ValueError, IndexError):
+            continue  # 跳过无效数据行
+
+    df = pd.DataFrame(df_data)
+    df.set_index('Date', inplace=True)
+    return df
+
+
+def make_klines(n_bars, seed=0):
+    """生成 n_bars 条与东方财富格式一致的日K线字符串"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2000-01-04', periods=n_bars).strftime('%Y-%m-%d')
+    close = np.round(10 * np.exp(np.cumsum(rng.normal(0, 0.02, n_bars))), 2)
+    open_ = np.round(close * (1 + rng.normal(0, 0.01, n_bars)), 2)
+    high = np.maximum(open_, close) + 0.05
+    low = np.minimum(open_, close) - 0.05
+    volume = rng.integers(1000, 1000000, n_bars)
+    return [
+        f"{d},{o:.2f},{c:.2f},{h:.2f},{l:.2f},{v},{v * c:.1f},1.23,0.45,0.05,0.67"
+        for d, o, c, h, l, v in zip(dates, open_, close, high, low, volume)
+    ]
+
+
+def best_of(func, klines, repeat):
+    """返回 repeat 次运行中的最短耗时（秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(klines)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    """
+    主测试函数
+    """
+    print(f"{'K线条数':>10} {'逐行解析(ms)':>14} {'批量解析(ms)':>14} {'加速比':>8}")
+
+    for n_bars in [250, 5000, 60000]:
+        klines = make_klines(n_bars)
+
+        # 先确认两种实现结果一致
+        expected = parse_klines_loop(klines)
+        actual = parse_eastmoney_klines(klines)[KLINE_COLUMNS]
+        pd.testing.assert_frame_equal(expected, actual, check_dtype=False, check_index_type=False, check_freq=False)
+
+        # 所有行都缺少附加字段（只有前6个字段）时结果也应一致
+        short_klines = [line.rsplit(',', len(KLINE_EXTRA_COLUMNS))[0] for line in klines]
+        expected = parse_klines_loop(short_klines)
+        actual = parse_eastmoney_klines(short_klines)[KLINE_COLUMNS]
+        pd.testing.assert_frame_equal(expected, actual, check_dtype=False, check_index_type=False, check_freq=False)
+
+        repeat = 1 if n_bars > 10000 else 5
+        loop_time = best_of(parse_klines_loop, klines, repeat)
+        bulk_time = best_of(parse_eastmoney_klines, klines, repeat)
+        print(f"{n_bars:>10} {loop_time * 1000:>14.1f} {bulk_time * 1000:>14.1f} {loop_time / bulk_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生成 tdx_transaction_new.csv 格式的模拟交易文件，用于按生产规模压测
+
+列为 日期,股票代码,买卖类型,成交价,成交数量,成交额,手续费（带标题行，默认 GBK 编码，与转换脚本的输出一致）。
+输出路径以 .stxc 结尾时写为列式二进制文件。
+每只股票的交易笔数呈长尾分布，买卖大致交替，价格围绕每只股票的基准价随机游走。
+
+用法：
+    python benchmarks/generate_transactions.py --rows 1000000 --codes 2000 --output data/1m_tdx_transaction_new.csv
+    python benchmarks/generate_transactions.py --rows 1000000 --codes 2000 --output data/1m.stxc
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import transaction_columnar
+
+HEADER = ['日期', '股票代码', '买卖类型', '成交价', '成交数量', '成交额', '手续费']
+
+# 交易日期范围
+START_DATE = '2015-01-05'
+END_DATE = '2024-12-31'
+
+# 佣金费率和最低佣金
+FEE_RATE = 0.00025
+MIN_FEE = 5.0
+
+
+def make_stock_codes(n_codes, rng):
+    """生成 n_codes 个不重复的沪深A股代码（600xxx、000xxx、300xxx）"""
+    pool = np.concatenate([
+        np.arange(600000, 606000),
+        np.arange(1, 3000),
+        np.arange(300001, 301000)
+    ])
+    if n_codes > len(pool):
+        raise ValueError(f"最多支持 {len(pool)} 只股票")
+    return np.char.zfill(rng.choice(pool, size=n_codes, replace=False).astype(str), 6)
+
+
+def generate_transactions(n_rows, n_codes, seed=0):
+    """返回 n_rows 行、n_codes 只股票的交易 DataFrame，按日期和股票代码排序"""
+    if n_codes > n_rows:
+        raise ValueError("股票数量不能多于交易笔数")
+    rng = np.random.default_rng(seed)
+    codes = make_stock_codes(n_codes, rng)
+    trading_days = pd.bdate_range(START_DATE, END_DATE)
+
+    # 每只股票的交易笔数大致服从长尾分布，每只至少一笔
+    weights = rng.pareto(1.5, n_codes) + 1
+    counts = np.maximum(1, np.floor(weights / weights.sum() * n_rows)).astype(np.int64)
+    counts[np.argmax(counts)] += n_rows - counts.sum()
+    code_index = np.repeat(np.arange(n_codes), counts)
+
+    # 每只股票内部按日期排序（code_index 已分组连续，排序后保持不变）
+    day_index = rng.integers(0, len(trading_days), n_rows)
+    day_index = day_index[np.lexsort((day_index, code_index))]
+
+    # 买卖交替，随机打乱一部分；每只股票第一笔为买入
+    position_in_code = np.arange(n_rows) - np.repeat(np.cumsum(counts) - counts, counts)
+    direction = np.where(position_in_code % 2 == 0, 1, 2)
+    flip = rng.random(n_rows) < 0.2
+    direction = np.where(flip & (position_in_code > 0), 3 - direction, direction)
+
+    # 价格：每只股票基准价乘以随机游走
+    base_price = rng.uniform(3, 100, n_codes)[code_index]
+    steps = rng.normal(0, 0.02, n_rows)
+    walk = np.exp(pd.Series(steps).groupby(code_index).cumsum().to_numpy())
+    price = np.round(base_price * walk, 2)
+
+    quantity = rng.integers(1, 50, n_rows) * 100
+    amount = np.round(price * quantity, 2)
+    fee = np.round(np.maximum(amount * FEE_RATE, MIN_FEE), 2)
+
+    df = pd.DataFrame({
+        'date': trading_days[day_index].strftime('%Y%m%d').astype(np.int64),
+        'stock_code': codes[code_index],
+        'direction': direction,
+        'price': price,
+        'quantity': quantity,
+        'amount': amount,
+        'fee': fee
+    })
+    return df.sort_values(['date', 'stock_code'], kind='mergesort').reset_index(drop=True)
+
+
+def write_transactions(df, path, encoding='gbk'):
+    """以带标题行的 CSV 写出，路径以 .stxc 结尾时写为列式文件"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if path.endswith(transaction_columnar.SUFFIX):
+        transaction_columnar.write_transactions(df, path)
+    else:
+        df.to_csv(path, header=HEADER, index=False, encoding=encoding)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成模拟交易文件')
+    parser.add_argument('--rows', type=int, default=100000, help='交易笔数（10^3 - 10^7）')
+    parser.add_argument('--codes', type=int, default=500, help='股票数量（10 - 5000）')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--encoding', default='gbk', help='文件编码')
+    parser.add_argument('--output', default=None, help='输出文件路径，需以 tdx_transaction_new.csv 或 .stxc 结尾')
+    args = parser.parse_args()
+
+    output = args.output or f"{args.rows}x{args.codes}_tdx_transaction_new.csv"
+    df = generate_transactions(args.rows, args.codes, args.seed)
+    write_transactions(df, output, args.encoding)
+    print(f"已生成 {len(df)} 条交易记录（{df['stock_code'].nunique()} 只股票）: {output}")
+
+
+if __name__ == "__main__":
+    main()
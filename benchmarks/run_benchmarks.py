@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按阶段计时的基准测试
+
+用 generate_transactions.py 生成指定规模的交易文件，分别计时：
+    load_transactions   加载交易文件
+    trade_performance   所有股票的 calculate_trade_performance
+    stock_info          批量获取股票名称和板块
+    summary_table       生成交易概览表
+    kline_fetch         获取交易最多的几只股票的K线
+    build_figure        构建这几只股票的K线图
+行情数据来自进程内启动的替身服务器（provider_stub_server.py），不需要联网。
+结果保存在 benchmarks/results/ 下（与机器相关，不纳入版本库），并与本机上一次的结果对比，
+耗时增加超过 20% 的阶段会被标出。
+
+用法：
+    python benchmarks/run_benchmarks.py --sizes 1000x10 100000x500 1000000x2000
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import pandas as pd
+from streamlit import config as streamlit_config
+from streamlit import logger as streamlit_logger
+
+import provider_client
+import rate_limiter
+from generate_transactions import generate_transactions, write_transactions
+from kline_store import KlineStore
+from provider_stub_server import ProviderStubServer
+from shared_cache import clear_all
+import stock_trading_visualizer as app
+
+# 脱离 streamlit run 运行时界面调用会输出大量警告，只保留错误日志
+# （先加载配置，否则首次调用界面函数时日志级别会被配置重置）
+streamlit_config.get_option('logger.level')
+streamlit_logger.set_log_level('error')
+
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+# 生成的交易文件缓存目录，相同规模和种子的文件只生成一次
+DATA_DIR = os.path.join(tempfile.gettempdir(), 'stock_visualizer_bench')
+
+DEFAULT_SIZES = ['1000x10', '100000x500']
+
+# 耗时超过上次结果的该倍数时视为退化
+REGRESSION_THRESHOLD = 1.2
+
+STAGES = ['load_transactions', 'trade_performance', 'stock_info', 'summary_table', 'kline_fetch', 'build_figure']
+
+
+def parse_size(text):
+    """解析 "交易笔数x股票数量"，如 100000x500"""
+    rows, _, codes = text.lower().partition('x')
+    return int(float(rows)), int(float(codes))
+
+
+def git_label():
+    """返回当前提交的短哈希，有未提交修改时加 -dirty"""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, text=True).strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT_DIR, text=True).strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def transaction_file(rows, codes, seed):
+    """返回指定规模的交易文件路径，不存在时生成"""
+    path = os.path.join(DATA_DIR, f"{rows}x{codes}_seed{seed}_tdx_transaction_new.csv")
+    if not os.path.exists(path):
+        print(f"生成交易文件 {rows} 行 / {codes} 只股票 ...")
+        write_transactions(generate_transactions(rows, codes, seed), path)
+    return path
+
+
+def run_case(rows, codes, n_figures, seed, work_dir, repeat):
+    """运行一个规模的所有阶段 repeat 次，返回各阶段的最短耗时（秒）"""
+    path = transaction_file(rows, codes, seed)
+    runs = [run_stages(path, n_figures, os.path.join(work_dir, f"klines_{rows}x{codes}_{i}.sqlite"))
+            for i in range(repeat)]
+    stages = {stage: min(run[stage] for run in runs) for stage in STAGES}
+    return {'rows': rows, 'codes': codes, 'figures': n_figures, 'seed': seed, 'repeat': repeat, 'stages': stages}
+
+
+def run_stages(path, n_figures, store_path):
+    """从空缓存开始运行一遍所有阶段，返回各阶段耗时（秒）"""
+    clear_all()
+    app.get_default_scheduler().reset()
+
+    visualizer = app.StockTradingVisualizer()
+    visualizer.kline_store = KlineStore(store_path)
+    stages = {}
+
+    started = time.perf_counter()
+    if not visualizer.load_transactions(path):
+        raise RuntimeError(f"加载交易文件失败: {path}")
+    stages['load_transactions'] = time.perf_counter() - started
+
+    stock_codes = sorted(visualizer.transactions['stock_code'].unique())
+
+    started = time.perf_counter()
+    for stock_code in stock_codes:
+        visualizer.calculate_trade_performance(stock_code)
+    stages['trade_performance'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    stock_infos = visualizer.get_stock_info_many(stock_codes)
+    stages['stock_info'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    visualizer.build_summary_table(stock_infos)
+    stages['summary_table'] = time.perf_counter() - started
+
+    # 交易最多的几只股票最能体现图表构建的开销
+    busiest = visualizer.transactions['stock_code'].value_counts().index[:n_figures]
+    stages['kline_fetch'] = 0.0
+    stages['build_figure'] = 0.0
+    for stock_code in busiest:
+        stock_trades = visualizer.transactions[visualizer.transactions['stock_code'] == stock_code]
+        start_date = stock_trades['date'].min() - timedelta(days=30)
+        end_date = stock_trades['date'].max() + timedelta(days=30)
+
+        started = time.perf_counter()
+        stock_data = visualizer.get_stock_data(stock_code, start_date, end_date)
+        stages['kline_fetch'] += time.perf_counter() - started
+        if stock_data is None:
+            raise RuntimeError(f"获取K线失败: {stock_code}")
+
+        started = time.perf_counter()
+        visualizer.build_trade_figure(stock_code, stock_trades, stock_data)
+        stages['build_figure'] += time.perf_counter() - started
+
+    return stages
+
+
+def latest_result(exclude=None):
+    """返回 results 目录中最新的结果文件路径"""
+    paths = sorted(p for p in glob.glob(os.path.join(RESULTS_DIR, '*.json')) if p != exclude)
+    return paths[-1] if paths else None
+
+
+def compare(current, baseline):
+    """打印与基准结果的对比，返回退化的阶段列表"""
+    previous_cases = {(case['rows'], case['codes']): case for case in baseline['cases']}
+    regressions = []
+
+    print(f"\n与 {baseline['label']}（{baseline['created']}）对比：")
+    print(f"{'规模':>16} {'阶段':>18} {'本次(秒)':>10} {'上次(秒)':>10} {'比值':>7}")
+    for case in current['cases']:
+        previous = previous_cases.get((case['rows'], case['codes']))
+        if previous is None:
+            continue
+        size = f"{case['rows']}x{case['codes']}"
+        for stage in STAGES:
+            now = case['stages'].get(stage)
+            before = previous['stages'].get(stage)
+            if now is None or not before:
+                continue
+            ratio = now / before
+            flag = ''
+            if ratio > REGRESSION_THRESHOLD:
+                flag = ' ⚠️ 变慢'
+                regressions.append((size, stage, ratio))
+            print(f"{size:>16} {stage:>18} {now:>10.4f} {before:>10.4f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按阶段计时的基准测试')
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, help='规模列表，格式为 交易笔数x股票数量')
+    parser.add_argument('--figures', type=int, default=5, help='构建K线图的股票数')
+    parser.add_argument('--seed', type=int, default=0, help='生成交易文件的随机种子')
+    parser.add_argument('--repeat', type=int, default=3, help='每个规模运行的次数，取各阶段最短耗时')
+    parser.add_argument('--label', default=None, help='结果标签，默认为当前提交')
+    parser.add_argument('--baseline', default=None, help='对比的结果文件，默认为上一次的结果')
+    parser.add_argument('--no-save', action='store_true', help='不保存本次结果')
+    parser.add_argument('--fail-on-regression', action='store_true', help='有阶段退化时返回非零退出码')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='stock_visualizer_bench_')
+
+    # 行情请求全部发往进程内的替身服务器，并取消限流
+    server = ProviderStubServer(port=0).start()
+    provider_client.set_stub_url(server.url)
+    for host in rate_limiter.DEFAULT_RATE_LIMITS:
+        rate_limiter.configure(host, 1e6, 1_000_000)
+
+    created = datetime.now()
+    result = {
+        'label': args.label or git_label(),
+        'created': created.isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cases': []
+    }
+    try:
+        for size in args.sizes:
+            rows, codes = parse_size(size)
+            case = run_case(rows, codes, args.figures, args.seed, work_dir, args.repeat)
+            result['cases'].append(case)
+            timings = '  '.join(f"{stage}={case['stages'][stage]:.4f}s" for stage in STAGES)
+            print(f"{rows}x{codes}: {timings}")
+    finally:
+        server.stop()
+        provider_client.set_stub_url(None)
+
+    saved_path = None
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        saved_path = os.path.join(RESULTS_DIR, f"{created:%Y%m%d-%H%M%S}_{result['label']}.json")
+        with open(saved_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存: {saved_path}")
+
+    baseline_path = args.baseline or latest_result(exclude=saved_path)
+    regressions = []
+    if baseline_path:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            regressions = compare(result, json.load(f))
+    else:
+        print("\n没有可对比的历史结果")
+
+    if regressions:
+        print(f"\n{len(regressions)} 个阶段耗时增加超过 {REGRESSION_THRESHOLD - 1:.0%}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,14 @@ import pandas as pd
 import re
 import numpy as np
 
+import transaction_columnar
+
 # 读取CSV文件，跳过表头行
-# 使用明确的列索引提取所需数据(A列、D列、E列、H列)
-df = pd.read_csv('transaction.csv', header=None, skiprows=1, encoding='gbk', usecols=[0, 3, 4, 7])
+# 使用明确的列索引提取所需数据(A列、D列、E列、G列、H列、I列、M列)
+df = pd.read_csv('transaction.csv', header=None, skiprows=1, encoding='gbk', usecols=[0, 3, 4, 6, 7, 8, 12])
 
 # 设置列名
-df.columns = ['日期', '股票代码', '买卖类型', '成交价']
+df.columns = ['日期', '股票代码', '买卖类型', '成交数量', '成交价', '成交额', '手续费']
 
 # 转换股票代码格式（去除后缀如.XSHE或.XSHG）
 df['股票代码'] = df['股票代码'].str.extract(r'(\d+)\.')[0]
@@ -18,14 +20,26 @@ df['日期'] = pd.to_datetime(df['日期'], errors='coerce').dt.strftime('%Y%m%d
 # 将买卖类型转换为数字编码(买=1,卖=2)
 df['买卖类型'] = df['买卖类型'].apply(lambda x: 1 if str(x).strip() in ['买', 'B'] else 2)
 
-# 处理成交价(去除非数字字符、替换空字符串为NaN并转换为浮点数)
-df['成交价'] = df['成交价'].replace(r'[^\d.]', '', regex=True)
-df['成交价'] = df['成交价'].replace('', np.nan)
-df['成交价'] = pd.to_numeric(df['成交价'], errors='coerce')
+# 处理成交价、成交数量、成交额、手续费(去除非数字字符如"股"、替换空字符串为NaN并转换为数值)
+for column in ['成交价', '成交数量', '成交额', '手续费']:
+    df[column] = df[column].astype(str).replace(r'[^\d.]', '', regex=True)
+    df[column] = df[column].replace('', np.nan)
+    df[column] = pd.to_numeric(df[column], errors='coerce')
 
-# 过滤无效数据
+# 过滤无效数据（手续费缺失按0处理）
+df['手续费'] = df['手续费'].fillna(0)
 df = df.dropna()
+df['成交数量'] = df['成交数量'].astype(int)
+
+# 成交价保持在第4列，只读取前4列的工具仍可使用
+df = df[['日期', '股票代码', '买卖类型', '成交价', '成交数量', '成交额', '手续费']]
 
 # 保存为通达信要求的ANSI编码(gbk)CSV文件
 df.to_csv('tdx_transaction_new.csv', index=False, encoding='gbk')
-print('转换完成，生成文件: tdx_transaction_new.csv')
\ No newline at end of file
+print('转换完成，生成文件: tdx_transaction_new.csv')
+
+# 同时保存为列式二进制文件，可视化工具加载时无需解析文本
+columnar = df.copy()
+columnar.columns = ['date', 'stock_code', 'direction', 'price', 'quantity', 'amount', 'fee']
+transaction_columnar.write_transactions(columnar, 'tdx_transaction_new.stxc')
+print('生成列式文件: tdx_transaction_new.stxc')
@@ -0,0 +1,138 @@
+"""
+K线图和交易统计的缓存
+
+构建一只股票的K线图（plotly 校验各条曲线）和交易统计要几十到上百毫秒，切换回已看过的股票时
+不必重新计算。缓存键包含交易记录内容哈希和本地K线存储的版本号，加载了新的交易记录或存储中
+写入了新的K线后键随之变化，旧的条目不会再被命中，无需主动失效。
+
+条目先放在内存的共享缓存中，同时写入磁盘目录（每个条目一个 JSON 文件），内存中被淘汰或进程重启后
+仍可从磁盘读回；磁盘占用超过上限时删除最久未使用的文件。
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from shared_cache import MB, get_cache
+
+# 默认磁盘目录，可通过环境变量 FIGURE_CACHE_DIR 修改
+DEFAULT_CACHE_DIR = os.environ.get('FIGURE_CACHE_DIR', os.path.join('.kline_cache', 'figures'))
+
+# 磁盘占用上限
+DEFAULT_MAX_DISK_BYTES = 256 * MB
+
+
+class FigureCache:
+    """内存 + 磁盘两级缓存，值需能用 JSON 序列化"""
+
+    def __init__(self, memory, directory=DEFAULT_CACHE_DIR, max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        self.memory = memory
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_hits = 0
+        self.disk_errors = 0
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError:
+            # 只读文件系统等情况下只用内存缓存
+            self.directory = None
+
+    def _path(self, key):
+        digest = hashlib.sha1(json.dumps(key, default=str).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, key):
+        """读取缓存，内存中没有时从磁盘读回，都没有时返回 None"""
+        value = self.memory.get(key)
+        if value is not None or self.directory is None:
+            return value
+
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+            # 更新访问时间，清理磁盘时按最久未使用的顺序删除
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            self.disk_errors += 1
+            return None
+
+        self.disk_hits += 1
+        self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        """写入内存缓存和磁盘"""
+        self.memory.set(key, value)
+        if self.directory is None:
+            return
+
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            # 先写临时文件再替换，其他进程不会读到写了一半的文件
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError):
+            self.disk_errors += 1
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self._prune()
+
+    def _prune(self):
+        """磁盘占用超过上限时删除最久未使用的文件"""
+        with self._lock:
+            try:
+                entries = []
+                for entry in os.scandir(self.directory):
+                    if entry.name.endswith('.json'):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+            except OSError:
+                return
+
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_disk_bytes:
+                return
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= self.max_disk_bytes * 0.8:
+                    break
+
+    def clear(self):
+        """清空内存缓存和磁盘文件"""
+        self.memory.clear()
+        if self.directory is None:
+            return
+        with self._lock:
+            try:
+                for entry in os.scandir(self.directory):
+                    if entry.name.endswith('.json'):
+                        os.remove(entry.path)
+            except OSError:
+                pass
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_figure_cache():
+    """返回进程内共享的默认图表缓存"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = FigureCache(get_cache('figures', max_bytes=64 * MB))
+        return _default_cache
@@ -0,0 +1,100 @@
+"""
+K线批量预取
+
+交易文件加载后，用有并发上限的线程池把所有股票的K线一次性补齐到本地K线存储，
+支持进度回调和取消，之后切换股票时直接读取本地数据。
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import provider_client
+import rate_limiter
+from kline_store import get_default_store
+
+# 默认并发数，不超过 provider_client.POOL_MAXSIZE
+DEFAULT_MAX_WORKERS = 8
+
+
+class KlinePrefetcher:
+    """在后台线程池中批量预取K线"""
+
+    def __init__(self, store=None, fqt='1', max_workers=DEFAULT_MAX_WORKERS, fetcher=None):
+        self.store = store or get_default_store()
+        self.fqt = fqt
+        self.max_workers = min(max_workers, provider_client.POOL_MAXSIZE)
+        self.fetcher = fetcher or provider_client.fetch_eastmoney_klines
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.total = 0
+        self.done = 0
+        self.failed = {}  # 股票代码 -> 错误信息
+        self.finished = False
+
+    def start(self, ranges, on_progress=None):
+        """在后台线程中开始预取，ranges 为 [(股票代码, 开始日期, 结束日期), ...]"""
+        self._thread = threading.Thread(target=self.run, args=(ranges, on_progress), daemon=True)
+        self._thread.start()
+        return self
+
+    def run(self, ranges, on_progress=None):
+        """阻塞执行预取；on_progress(status, stock_code, error) 在每只股票完成后调用"""
+        ranges = list(ranges)
+        with self._lock:
+            self.total = len(ranges)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='kline-prefetch') as executor:
+                for stock_code, start_date, end_date in ranges:
+                    executor.submit(self._prefetch_one, stock_code, start_date, end_date, on_progress)
+        finally:
+            with self._lock:
+                self.finished = True
+
+    def _prefetch_one(self, stock_code, start_date, end_date, on_progress):
+        # 已取消的任务直接跳过
+        if self._cancel_event.is_set():
+            return
+
+        error = None
+        try:
+            # 批量预取以后台优先级排队，不挤占界面上的交互请求
+            with rate_limiter.priority(rate_limiter.BACKGROUND):
+                self.store.top_up(
+                    stock_code, self.fqt, start_date, end_date,
+                    lambda beg, end: self.fetcher(stock_code, beg, end, fqt=self.fqt)
+                )
+        except Exception as e:
+            error = str(e)
+
+        with self._lock:
+            self.done += 1
+            if error:
+                self.failed[stock_code] = error
+        if on_progress:
+            on_progress(self.status(), stock_code, error)
+
+    def cancel(self):
+        """取消尚未开始的预取任务，正在进行的请求会完成后退出"""
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def wait(self, timeout=None):
+        """等待后台预取结束"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.finished
+
+    def status(self):
+        """返回当前进度"""
+        with self._lock:
+            return {
+                'total': self.total,
+                'done': self.done,
+                'failed': len(self.failed),
+                'cancelled': self.cancelled,
+                'finished': self.finished
+            }
@@ -0,0 +1,321 @@
+"""
+K线本地存储
+
+按 (股票代码, 复权方式) 把日K线持久化到本地 SQLite 文件，并记录已经覆盖的日期区间。
+读取时只需向数据源补齐缺失的头部/尾部区间，已缓存的区间无需联网。
+前复权K线在除权除息后会整体变化，补齐时顺带核对一根已缓存的K线，价格基准变了就整体重新获取。
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+import pandas as pd
+
+from provider_client import KLINE_COLUMNS, KLINE_EXTRA_COLUMNS
+
+# 默认存储位置，可通过环境变量 KLINE_STORE_PATH 修改
+DEFAULT_STORE_PATH = os.environ.get('KLINE_STORE_PATH', os.path.join('.kline_cache', 'klines.sqlite'))
+
+# 未指定起始日期时使用的最早日期（早于A股开市）
+EARLIEST_DATE = date(1990, 1, 1)
+
+# 交易所所在时区（北京时间，无夏令时），判断K线是否已确定时按交易所时间计算，与服务器所在时区无关
+MARKET_TIMEZONE = timezone(timedelta(hours=8), 'Asia/Shanghai')
+
+# 收盘时间（小时），收盘后当天的K线才视为已确定
+MARKET_CLOSE_HOUR = 15
+
+# 开盘（9:30）后到这个时间（小时）数据源仍没有返回当天的K线时，当天视为非交易日（节假日或停牌）
+NO_BAR_SETTLED_HOUR = 10
+
+# 前复权的历史K线在每次除权除息后整体变化，补齐时需核对已缓存的K线是否仍是当前的价格基准
+REBASING_FQTS = frozenset(['1'])
+
+# 核对收盘价时允许的误差
+PRICE_TOLERANCE = 1e-6
+
+# 存储结构版本，结构变化时旧的缓存会被重建
+SCHEMA_VERSION = 2
+
+
+def to_date(value):
+    """把字符串、datetime、Timestamp 等统一转换为 date"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return pd.to_datetime(value).date()
+
+
+def market_now():
+    """返回交易所时间的当前时刻"""
+    return datetime.now(MARKET_TIMEZONE)
+
+
+def settled_date(now=None):
+    """返回K线已经确定（不会再变化）的最后一个日期（交易所时间），周末全天都已确定"""
+    now = now or market_now()
+    if now.hour >= MARKET_CLOSE_HOUR or now.weekday() >= 5:
+        return now.date()
+    return now.date() - timedelta(days=1)
+
+
+class KlineStore:
+    """基于 SQLite 的K线存储，记录每只股票已覆盖的日期区间"""
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _init_db(self):
+        with self._lock, self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                # 本地存储只是缓存，结构不一致时直接重建
+                conn.execute('DROP TABLE IF EXISTS klines')
+                conn.execute('DROP TABLE IF EXISTS coverage')
+                # 版本号表不删除：版本号继续递增，按旧版本号缓存的图表不会被误用
+                conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS klines (
+                    code TEXT NOT NULL,
+                    fqt TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    open REAL,
+                    close REAL,
+                    high REAL,
+                    low REAL,
+                    volume INTEGER,
+                    amount REAL,
+                    amplitude REAL,
+                    pct_change REAL,
+                    change REAL,
+                    turnover REAL,
+                    PRIMARY KEY (code, fqt, date)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS coverage (
+                    code TEXT NOT NULL,
+                    fqt TEXT NOT NULL,
+                    beg TEXT NOT NULL,
+                    end TEXT NOT NULL
+                )
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_coverage ON coverage (code, fqt)')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS versions (
+                    code TEXT NOT NULL,
+                    fqt TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    PRIMARY KEY (code, fqt)
+                )
+            """)
+
+    def covered_ranges(self, code, fqt):
+        """返回已覆盖的日期区间列表 [(beg, end), ...]，按起始日期排序"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT beg, end FROM coverage WHERE code = ? AND fqt = ? ORDER BY beg',
+                (code, fqt)
+            ).fetchall()
+        return [(date.fromisoformat(beg), date.fromisoformat(end)) for beg, end in rows]
+
+    def missing_ranges(self, code, fqt, start_date=None, end_date=None):
+        """计算 [start_date, end_date] 内尚未覆盖、需要向数据源请求的区间"""
+        today = market_now().date()
+        start = to_date(start_date) or EARLIEST_DATE
+        end = min(to_date(end_date) or today, today)
+
+        # 尚未确定的日期（如盘中的当天）不会登记为已覆盖，总是需要重新获取
+        missing = []
+        cursor = start
+        for beg, stop in self.covered_ranges(code, fqt):
+            if stop < cursor:
+                continue
+            if beg > end:
+                break
+            if beg > cursor:
+                missing.append((cursor, beg - timedelta(days=1)))
+            cursor = stop + timedelta(days=1)
+            if cursor > end:
+                break
+        if cursor <= end:
+            missing.append((cursor, end))
+        return missing
+
+    def version(self, code, fqt):
+        """返回K线版本号：每次写入或清除该股票的K线时加一，可作为由K线生成的数据的缓存键"""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT version FROM versions WHERE code = ? AND fqt = ?',
+                (code, fqt)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def _bump_version(self, conn, code, fqt):
+        conn.execute(
+            'INSERT INTO versions (code, fqt, version) VALUES (?, ?, 1) '
+            'ON CONFLICT (code, fqt) DO UPDATE SET version = version + 1',
+            (code, fqt)
+        )
+
+    def top_up(self, code, fqt, start_date, end_date, fetcher):
+        """
+        调用 fetcher(beg, end) 补齐 [start_date, end_date] 内缺失的区间并保存，返回请求的区间数
+
+        前复权（REBASING_FQTS）时每个请求多包含一根与缺失区间相邻的已缓存K线，其收盘价与缓存不一致
+        说明期间发生过除权除息、缓存的K线已是旧的价格基准，此时清除该股票的缓存并重新获取整个区间。
+        fetcher 抛出异常时已成功的区间会保留，未完成的区间下次再补
+        """
+        missing = self.missing_ranges(code, fqt, start_date, end_date)
+        for index, (beg, end) in enumerate(missing):
+            reference = self._reference_bar(code, fqt, beg, end) if fqt in REBASING_FQTS else None
+            if reference is None:
+                df = fetcher(beg, end)
+            else:
+                reference_date, reference_close = reference
+                df = fetcher(min(beg, reference_date), max(end, reference_date))
+                if self._rebased(df, reference_date, reference_close):
+                    self.clear(code, fqt)
+                    return index + 1 + self.top_up(code, fqt, start_date, end_date, fetcher)
+            self.save(code, fqt, df, beg, end)
+        return len(missing)
+
+    def _reference_bar(self, code, fqt, beg, end):
+        """返回与 [beg, end] 相邻的已确定K线 (日期, 收盘价)：优先取之前最近的一根，没有时取之后最近的一根"""
+        settled = settled_date().isoformat()
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT date, close FROM klines WHERE code = ? AND fqt = ? AND date < ? AND date <= ? '
+                'ORDER BY date DESC LIMIT 1',
+                (code, fqt, to_date(beg).isoformat(), settled)
+            ).fetchone()
+            if row is None:
+                row = conn.execute(
+                    'SELECT date, close FROM klines WHERE code = ? AND fqt = ? AND date > ? AND date <= ? '
+                    'ORDER BY date LIMIT 1',
+                    (code, fqt, to_date(end).isoformat(), settled)
+                ).fetchone()
+        if row is None or row[1] is None:
+            return None
+        return date.fromisoformat(row[0]), row[1]
+
+    @staticmethod
+    def _rebased(df, reference_date, reference_close):
+        """新获取的K线中参照日的收盘价是否与缓存不一致（没有返回参照日时视为一致）"""
+        if df is None or df.empty:
+            return False
+        closes = df.loc[df.index.normalize() == pd.Timestamp(reference_date), 'Close']
+        return not closes.empty and abs(float(closes.iloc[0]) - reference_close) > PRICE_TOLERANCE
+
+    def load(self, code, fqt, start_date=None, end_date=None):
+        """读取 [start_date, end_date] 内的K线，返回以 Date 为索引的 DataFrame"""
+        start = to_date(start_date) or EARLIEST_DATE
+        end = to_date(end_date) or market_now().date()
+        with self._connect() as conn:
+            df = pd.read_sql_query(
+                'SELECT date, open, close, high, low, volume, amount, amplitude, pct_change, change, turnover '
+                'FROM klines '
+                'WHERE code = ? AND fqt = ? AND date >= ? AND date <= ? ORDER BY date',
+                conn,
+                params=(code, fqt, start.isoformat(), end.isoformat())
+            )
+        df.columns = ['Date'] + KLINE_COLUMNS + KLINE_EXTRA_COLUMNS
+        df[KLINE_EXTRA_COLUMNS] = df[KLINE_EXTRA_COLUMNS].astype(float)
+        df['Date'] = pd.to_datetime(df['Date'], format='%Y-%m-%d')
+        df.set_index('Date', inplace=True)
+        return df
+
+    def save(self, code, fqt, df, beg, end):
+        """
+        保存一段K线，并把 [beg, end] 中已确定的部分登记为已覆盖
+
+        区间包含当天、已过开盘时间但数据源没有返回当天的K线时，当天是非交易日，也登记为已覆盖
+        """
+        beg = to_date(beg)
+        end = to_date(end)
+        now = market_now()
+        settled = settled_date(now)
+        today = now.date()
+        if settled < today <= end and now.hour >= NO_BAR_SETTLED_HOUR:
+            has_today = df is not None and not df.empty and (df.index.normalize() == pd.Timestamp(today)).any()
+            if not has_today:
+                settled = today
+        end = min(end, settled)
+
+        rows = []
+        if df is not None and not df.empty:
+            # 缺少的附加字段以NULL保存
+            values = df.reindex(columns=KLINE_COLUMNS + KLINE_EXTRA_COLUMNS).astype(object)
+            values = values.where(values.notna(), None)
+            values['Volume'] = df['Volume'].astype('int64').tolist()
+            dates = df.index.strftime('%Y-%m-%d')
+            rows = [(code, fqt, d) + row for d, row in zip(dates, values.itertuples(index=False, name=None))]
+
+        with self._lock, self._connect() as conn:
+            if rows:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO klines (code, fqt, date, open, close, high, low, volume, '
+                    'amount, amplitude, pct_change, change, turnover) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    rows
+                )
+                self._bump_version(conn, code, fqt)
+            if beg <= end:
+                self._merge_coverage(conn, code, fqt, beg, end)
+
+    def _merge_coverage(self, conn, code, fqt, beg, end):
+        """把新区间与相邻或重叠的已有区间合并"""
+        rows = conn.execute(
+            'SELECT rowid, beg, end FROM coverage WHERE code = ? AND fqt = ? AND beg <= ? AND end >= ?',
+            (code, fqt, (end + timedelta(days=1)).isoformat(), (beg - timedelta(days=1)).isoformat())
+        ).fetchall()
+        for rowid, old_beg, old_end in rows:
+            beg = min(beg, date.fromisoformat(old_beg))
+            end = max(end, date.fromisoformat(old_end))
+            conn.execute('DELETE FROM coverage WHERE rowid = ?', (rowid,))
+        conn.execute(
+            'INSERT INTO coverage (code, fqt, beg, end) VALUES (?, ?, ?, ?)',
+            (code, fqt, beg.isoformat(), end.isoformat())
+        )
+
+    def clear(self, code=None, fqt=None):
+        """清除某只股票（或全部）的缓存数据，指定 fqt 时只清除该复权方式"""
+        conditions = []
+        params = []
+        if code is not None:
+            conditions.append('code = ?')
+            params.append(code)
+        if fqt is not None:
+            conditions.append('fqt = ?')
+            params.append(fqt)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        with self._lock, self._connect() as conn:
+            conn.execute(f'DELETE FROM klines{where}', params)
+            conn.execute(f'DELETE FROM coverage{where}', params)
+            conn.execute(f'UPDATE versions SET version = version + 1{where}', params)
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    """返回进程内共享的默认K线存储"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = KlineStore()
+        return _default_store
@@ -0,0 +1,127 @@
+"""
+相邻股票的后台预热
+
+查看一只股票后，用户通常会在选择框中依次查看前后的股票。选中一只股票时按
+「后一只、前一只、后两只、前两只……」的顺序，再加上交易最多的几只股票，在后台线程中预先准备
+K线、股票信息和图表，切换过去时直接读取缓存。
+
+每次重新安排都会让代数（generation）加一：排队中的旧任务被丢弃，正在处理的旧任务在下一步之前放弃，
+选择跳到别处时不会继续为已经不相邻的股票请求数据。预热以后台优先级请求，不挤占界面上的交互请求。
+"""
+
+import threading
+from collections import deque
+
+import rate_limiter
+
+# 默认预热选中股票前后各几只
+DEFAULT_RADIUS = 3
+
+# 默认另外预热交易最多的几只股票
+DEFAULT_HOT_CODES = 5
+
+# 默认工作线程数，实际请求速率由限流器控制
+DEFAULT_MAX_WORKERS = 2
+
+
+def neighbour_order(stock_codes, selected, radius=DEFAULT_RADIUS, hot_codes=()):
+    """
+    返回需要预热的股票代码：选中股票之后和之前的 radius 只股票交替排列（越近越先），
+    然后是 hot_codes 中的其他股票；不含选中的股票本身
+    """
+    stock_codes = list(stock_codes)
+    order = []
+    if selected in stock_codes:
+        position = stock_codes.index(selected)
+        for distance in range(1, radius + 1):
+            for index in (position + distance, position - distance):
+                if 0 <= index < len(stock_codes):
+                    order.append(stock_codes[index])
+    order.extend(hot_codes)
+    return [code for code in dict.fromkeys(order) if code != selected]
+
+
+class NeighbourWarmer:
+    """
+    按代数取消的后台预热队列
+
+    warm_one(股票代码, is_stale, *args) 准备一只股票，is_stale() 返回 True 时应尽快返回
+    """
+
+    def __init__(self, warm_one, max_workers=DEFAULT_MAX_WORKERS):
+        self.warm_one = warm_one
+        self.max_workers = max_workers
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._args = ()
+        self._workers = 0
+        self.warmed = 0
+        self.skipped = 0
+        self.failed = {}  # 股票代码 -> 错误信息
+        self.in_progress = set()
+
+    def schedule(self, stock_codes, *args):
+        """替换预热队列（丢弃旧的任务），返回新的代数；args 传给 warm_one"""
+        with self._lock:
+            self.generation += 1
+            self._pending = deque(stock_codes)
+            self._args = args
+            start = max(min(self.max_workers, len(self._pending)) - self._workers, 0)
+            self._workers += start
+            generation = self.generation
+
+        for _ in range(start):
+            threading.Thread(target=self._run, daemon=True, name='neighbour-warmer').start()
+        return generation
+
+    def cancel(self):
+        """丢弃所有排队中的任务，正在处理的任务在下一步之前放弃"""
+        with self._lock:
+            self.generation += 1
+            self._pending.clear()
+
+    def is_current(self, generation):
+        return self.generation == generation
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._workers -= 1
+                    return
+                stock_code = self._pending.popleft()
+                if stock_code in self.in_progress:
+                    # 另一个线程正在处理同一只股票
+                    continue
+                generation = self.generation
+                args = self._args
+                self.in_progress.add(stock_code)
+
+            try:
+                with rate_limiter.priority(rate_limiter.BACKGROUND):
+                    self.warm_one(stock_code, lambda: not self.is_current(generation), *args)
+            except Exception as e:
+                with self._lock:
+                    self.failed[stock_code] = str(e)
+            else:
+                with self._lock:
+                    if self.is_current(generation):
+                        self.warmed += 1
+                    else:
+                        self.skipped += 1
+            finally:
+                with self._lock:
+                    self.in_progress.discard(stock_code)
+
+    def status(self):
+        """返回 {'generation', 'pending', 'in_progress', 'warmed', 'skipped', 'failed'}"""
+        with self._lock:
+            return {
+                'generation': self.generation,
+                'pending': len(self._pending),
+                'in_progress': sorted(self.in_progress),
+                'warmed': self.warmed,
+                'skipped': self.skipped,
+                'failed': len(self.failed)
+            }
@@ -0,0 +1,69 @@
+"""
+K线降采样
+
+历史很长时把日K线按周、月、季、年聚合为较少的K线再发送给浏览器：
+开盘价取周期内第一根、收盘价取最后一根，最高/最低价和成交量用 numpy 的 reduceat 按周期一次性计算。
+自动模式下选择能让K线数不超过 max_bars 的最短周期，使每根K线在图表上仍有几个像素宽。
+"""
+
+import numpy as np
+import pandas as pd
+
+# 图表区域约 1200-1500 像素宽，每根K线至少 3 像素
+DEFAULT_MAX_BARS = 400
+
+# 可选的聚合周期（pandas Period 频率）及显示名称
+PERIOD_LABELS = {
+    'W': '周K',
+    'M': '月K',
+    'Q': '季K',
+    'Y': '年K'
+}
+
+# 自动模式依次尝试的周期
+AUTO_PERIODS = ['W', 'M', 'Q', 'Y']
+
+
+def aggregate_ohlc(df, period):
+    """
+    把按日期升序的K线按 period（'W'、'M'、'Q'、'Y'）聚合
+
+    返回的 DataFrame 含 Open/High/Low/Close（有 Volume 列时还有 Volume），索引为每个周期第一根K线的日期
+    """
+    if df.empty:
+        return df
+
+    codes = df.index.to_period(period).asi8
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], len(df)] - 1
+
+    result = pd.DataFrame({
+        'Open': df['Open'].to_numpy()[starts],
+        'High': np.maximum.reduceat(df['High'].to_numpy(), starts),
+        'Low': np.minimum.reduceat(df['Low'].to_numpy(), starts),
+        'Close': df['Close'].to_numpy()[ends]
+    }, index=df.index[starts])
+    if 'Volume' in df.columns:
+        result['Volume'] = np.add.reduceat(df['Volume'].to_numpy(), starts)
+    return result
+
+
+def downsample_ohlc(df, max_bars=DEFAULT_MAX_BARS, period='auto'):
+    """
+    返回 (K线, 周期)
+
+    period 为 'auto' 时K线数不超过 max_bars 则原样返回（周期为 None），否则依次尝试周、月、季、年；
+    为 None 时不聚合；为 'W'/'M'/'Q'/'Y' 时按指定周期聚合
+    """
+    if period is None:
+        return df, None
+    if period != 'auto':
+        return aggregate_ohlc(df, period), period
+    if len(df) <= max_bars:
+        return df, None
+
+    for candidate in AUTO_PERIODS:
+        bars = aggregate_ohlc(df, candidate)
+        if len(bars) <= max_bars:
+            break
+    return bars, candidate
@@ -0,0 +1,265 @@
+"""
+轻量的分阶段耗时追踪
+
+每次脚本重新运行（rerun）开始时调用 start_trace() 创建一个追踪，之后代码中的 span() 记录各阶段的
+开始时间和耗时，count() 累计计数（如下载字节数），结束时 finish() 记录这次运行期间各共享缓存的命中情况。
+没有正在进行的追踪时（如后台预取线程、命令行工具）span() 和 count() 什么都不做，开销可以忽略。
+页面中单独重新运行的片段用 trace_scope() 在整页运行之外记录自己的追踪。
+
+追踪结束后以一行 JSON 写入 logging（logger 名为 perf_trace），设置环境变量 PERF_TRACE_LOG 时
+还会追加写入该文件（JSON Lines），便于接入监控。
+"""
+
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from shared_cache import all_cache_stats
+
+logger = logging.getLogger('perf_trace')
+
+# 追踪结束后追加写入的 JSON Lines 文件
+LOG_PATH = os.environ.get('PERF_TRACE_LOG') or None
+
+# 保留最近的追踪条数
+RECENT_TRACE_LIMIT = 20
+
+_current_trace = contextvars.ContextVar('perf_trace', default=None)
+_current_span = contextvars.ContextVar('perf_span', default=None)
+_recent = deque(maxlen=RECENT_TRACE_LIMIT)
+_recent_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+
+class Span:
+    """一个阶段：名称、相对追踪开始的起止时间、所在线程和附加属性"""
+
+    def __init__(self, span_id, name, parent, start, attrs):
+        self.id = span_id
+        self.name = name
+        self.parent = parent
+        self.start = start
+        self.end = None
+        self.thread = threading.current_thread().name
+        self.attrs = attrs
+        self.error = None
+
+    def set(self, **attrs):
+        """补充属性，如解析出的行数"""
+        self.attrs.update(attrs)
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else self.start) - self.start
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'parent': self.parent,
+            'start': self.start,
+            'duration': self.duration,
+            'thread': self.thread,
+            'error': self.error,
+            'attrs': self.attrs
+        }
+
+
+class _NullSpan:
+    """没有追踪时 span() 返回的占位对象"""
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _cache_counts():
+    return {stats['name']: (stats['hits'], stats['misses']) for stats in all_cache_stats()}
+
+
+class Trace:
+    """一次运行的所有阶段和计数，可在多个线程中同时记录"""
+
+    def __init__(self, label, **attrs):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.attrs = attrs
+        self.created = datetime.now()
+        self.spans = []
+        self.counters = {}
+        self.caches = []
+        self.elapsed = None
+        self._started = time.perf_counter()
+        self._cache_before = _cache_counts()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def now(self):
+        """距追踪开始的秒数"""
+        return time.perf_counter() - self._started
+
+    def open_span(self, name, parent, attrs):
+        span = Span(next(self._ids), name, parent, self.now(), attrs)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    @property
+    def active(self):
+        return self.elapsed is None
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self):
+        """结束追踪：计算总耗时和缓存命中增量，写日志并加入最近追踪列表"""
+        if self.elapsed is not None:
+            return self
+        self.elapsed = self.now()
+        for name, (hits, misses) in _cache_counts().items():
+            before_hits, before_misses = self._cache_before.get(name, (0, 0))
+            hits -= before_hits
+            misses -= before_misses
+            if hits or misses:
+                self.caches.append({
+                    'name': name,
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_rate': hits / (hits + misses)
+                })
+
+        with _recent_lock:
+            _recent.append(self)
+        _emit(self)
+        return self
+
+    def to_dict(self):
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+            counters = dict(self.counters)
+        return {
+            'id': self.id,
+            'label': self.label,
+            'created': self.created.isoformat(timespec='milliseconds'),
+            'elapsed': self.elapsed,
+            'attrs': self.attrs,
+            'counters': counters,
+            'caches': list(self.caches),
+            'spans': spans
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), ensure_ascii=False, default=str, **kwargs)
+
+
+def _emit(trace):
+    """以一行 JSON 输出追踪结果"""
+    line = trace.to_json()
+    logger.info(line)
+    if LOG_PATH:
+        try:
+            with _log_lock, open(LOG_PATH, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except OSError as e:
+            logger.warning(f"写入追踪日志失败: {str(e)}")
+
+
+def start_trace(label, **attrs):
+    """在当前线程开始一个新的追踪，并作为之后 span() 的记录对象"""
+    trace = Trace(label, **attrs)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def current_trace():
+    """返回当前线程正在进行的追踪，没有或已结束时返回 None"""
+    trace = _current_trace.get()
+    return trace if trace is not None and trace.active else None
+
+
+@contextmanager
+def trace_scope(label, **attrs):
+    """
+    在已有的追踪中运行 with 块；没有正在进行的追踪时（如片段单独重新运行）
+    为这个块新建一个追踪，块结束时结束它
+    """
+    trace = current_trace()
+    if trace is not None:
+        with span(label):
+            yield trace
+        return
+
+    trace = start_trace(label, **attrs)
+    try:
+        yield trace
+    finally:
+        trace.finish()
+
+
+def capture():
+    """返回当前的追踪和所在阶段，传给工作线程中的 attach()"""
+    return _current_trace.get(), _current_span.get()
+
+
+def attach(captured):
+    """在工作线程中继续记录 capture() 时的追踪，新阶段挂在当时所在的阶段下"""
+    trace, parent = captured
+    _current_trace.set(trace)
+    _current_span.set(parent)
+
+
+@contextmanager
+def span(name, **attrs):
+    """记录 with 块的耗时；块内抛出的异常会记录在阶段上并继续抛出"""
+    trace = current_trace()
+    if trace is None:
+        yield _NULL_SPAN
+        return
+
+    current = trace.open_span(name, _current_span.get(), attrs)
+    token = _current_span.set(current.id)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.end = trace.now()
+        _current_span.reset(token)
+
+
+def traced(name):
+    """把整个函数调用记录为一个阶段的装饰器"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    """累计当前追踪的计数"""
+    trace = current_trace()
+    if trace is not None:
+        trace.count(name, value)
+
+
+def recent_traces():
+    """返回最近结束的追踪，最新的在最后"""
+    with _recent_lock:
+        return list(_recent)
@@ -0,0 +1,429 @@
+"""
+行情数据源客户端
+
+为每个行情主机维护一个带连接池的 requests.Session（保持长连接），
+统一请求头和重试/退避策略，两个可视化工具共用。
+"""
+
+import io
+import os
+import threading
+import time
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+import perf_trace
+import rate_limiter
+from single_flight import get_default_single_flight
+
+# 行情主机
+EASTMONEY_KLINE_HOST = 'push2his.eastmoney.com'  # 东方财富K线
+EASTMONEY_QUOTE_HOST = 'push2.eastmoney.com'     # 东方财富个股信息
+TENCENT_HOST = 'qt.gtimg.cn'                     # 腾讯实时行情
+YAHOO_HOST = 'query2.finance.yahoo.com'          # Yahoo Finance（由 yfinance 访问，这里只用于限流）
+
+# 设置后所有请求发往该地址（如本地替身服务器 http://127.0.0.1:8765），用于离线压测
+STUB_URL = os.environ.get('MARKET_DATA_STUB_URL', '').rstrip('/') or None
+
+# 各主机的默认请求头
+HOST_HEADERS = {
+    EASTMONEY_KLINE_HOST: {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        'Referer': 'http://quote.eastmoney.com/',
+        'Accept': 'application/json, text/plain, */*',
+        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
+    },
+    EASTMONEY_QUOTE_HOST: {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+        'Referer': 'http://quote.eastmoney.com/'
+    },
+    TENCENT_HOST: {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+        'Referer': 'http://qt.gtimg.cn/'
+    }
+}
+
+# 东方财富接口公共参数
+EASTMONEY_UT = 'fa5fd1943c7b386f172d6893dbfba10b'
+
+# 东方财富K线字段（f51-f56：日期、开、收、高、低、成交量）
+KLINE_COLUMNS = ['Open', 'Close', 'High', 'Low', 'Volume']
+
+# 附加字段（f57-f61：成交额、振幅、涨跌幅、涨跌额、换手率），旧数据或部分行可能缺失
+KLINE_EXTRA_COLUMNS = ['Amount', 'Amplitude', 'PctChange', 'Change', 'Turnover']
+
+# 批量查询个股信息时每次请求的股票数，避免 URL 过长
+EASTMONEY_INFO_BATCH_SIZE = 100
+TENCENT_BATCH_SIZE = 60
+
+# 每个主机连接池的最大连接数，需不小于批量预取的并发数
+POOL_MAXSIZE = 32
+
+# 连接失败和限流、服务端错误时的重试次数（不含第一次请求），重试在 get() 中进行，等待时间计入总时限
+MAX_RETRIES = 2
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+# 指数退避的基数（秒）：第 n 次重试前等待 BACKOFF_FACTOR * 2 ** (n - 1) 秒
+BACKOFF_FACTOR = 0.5
+
+# 服务端返回 Retry-After 时最多等待的秒数，超过时不再重试
+MAX_RETRY_AFTER = 10
+
+
+class ProviderError(Exception):
+    """数据源请求或解析失败"""
+
+
+class DeadlineExceeded(ProviderError):
+    """整个获取流程超过了总时限"""
+
+
+class Deadline:
+    """
+    一次数据获取的总时限，沿数据源回退链传递
+
+    每次请求的超时取自身超时与剩余时间中的较小值，时限用完后不再发起新的请求
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        """剩余秒数，不小于0"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, default):
+        """返回本次请求可用的超时时间，时限已用完时抛出 DeadlineExceeded"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"数据获取已超过总时限 {self.seconds} 秒")
+        return min(default, remaining)
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(host):
+    """返回指定主机共用的 Session，首次调用时创建"""
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(HOST_HEADERS.get(host, {}))
+            # 连接池本身不重试：适配器内部的重试和 Retry-After 等待不受总时限约束
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[host] = session
+        return session
+
+
+def _retry_delay(attempt, response=None):
+    """第 attempt 次重试（从1开始）前等待的秒数，服务端返回了 Retry-After 秒数时以其为准"""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+    return BACKOFF_FACTOR * 2 ** (attempt - 1)
+
+
+def _can_retry(attempt, delay, deadline):
+    """是否还能进行第 attempt 次重试：未超过重试次数，且等待后总时限还有剩余"""
+    if attempt > MAX_RETRIES or delay > MAX_RETRY_AFTER:
+        return False
+    return deadline is None or delay < deadline.remaining()
+
+
+def get(host, path, params=None, timeout=10, deadline=None):
+    """
+    通过主机对应的 Session 发送 GET 请求
+
+    连接失败或状态码在 RETRY_STATUSES 中时按指数退避（或服务端的 Retry-After）重试，最多 MAX_RETRIES 次；
+    传入 deadline 时每次请求的超时不超过剩余时间，重试前的等待会用完剩余时间时不再重试，
+    返回最后一次的响应（连接失败时抛出原异常）。
+    每次发送（包括重试）前都先从主机的令牌桶取令牌，排队时间计入该次的 timeout；
+    超时仍未取到令牌时抛出 ProviderError。
+    请求耗时、重试次数、限流等待和下载字节数记录到当前的性能追踪中
+    """
+    with perf_trace.span('http', host=host, path=path) as span:
+        url = f"{base_url(host)}{path}"
+        session = get_session(host)
+        attempt = 0
+        waited = 0.0
+        while True:
+            request_timeout = deadline.timeout(timeout) if deadline else timeout
+            try:
+                attempt_waited = rate_limiter.acquire(host, timeout=request_timeout)
+            except rate_limiter.RateLimitTimeout as e:
+                raise ProviderError(str(e))
+            waited += attempt_waited
+            try:
+                response = session.get(url, params=params, timeout=max(request_timeout - attempt_waited, 0.1))
+            except requests.exceptions.ConnectionError:
+                delay = _retry_delay(attempt + 1)
+                if not _can_retry(attempt + 1, delay, deadline):
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    break
+                delay = _retry_delay(attempt + 1, response)
+                if not _can_retry(attempt + 1, delay, deadline):
+                    break
+                response.close()
+            attempt += 1
+            time.sleep(delay)
+
+        size = len(response.content)
+        span.set(status=response.status_code, bytes=size, rate_limit_wait=waited, retries=attempt)
+        perf_trace.count('http_requests', attempt + 1)
+        perf_trace.count('bytes_downloaded', size)
+        return response
+
+
+def base_url(host):
+    """返回主机的请求地址，设置了替身服务器时返回替身服务器地址"""
+    return STUB_URL or f"http://{host}"
+
+
+def set_stub_url(url):
+    """在进程内切换到替身服务器（url 为空时恢复真实接口）"""
+    global STUB_URL
+    STUB_URL = url.rstrip('/') if url else None
+
+
+def close_sessions():
+    """关闭所有 Session 及其连接池"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def eastmoney_secid(stock_code):
+    """转换为东方财富的 secid（1=上海，0=深圳）"""
+    if stock_code.startswith('6'):
+        return f"1.{stock_code}"
+    elif stock_code.startswith('0') or stock_code.startswith('3'):
+        return f"0.{stock_code}"
+    return stock_code
+
+
+def tencent_code(stock_code):
+    """转换为腾讯行情代码（sh/sz 前缀）"""
+    if stock_code.startswith('6'):
+        return f"sh{stock_code}"
+    elif stock_code.startswith('0') or stock_code.startswith('3'):
+        return f"sz{stock_code}"
+    return stock_code
+
+
+def chunked(items, size):
+    """把列表按 size 切分为多个批次"""
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _request(host, path, params, timeout, source, deadline=None):
+    """发送请求并把网络异常和非200状态统一转换为 ProviderError"""
+    try:
+        response = get(host, path, params=params, timeout=timeout, deadline=deadline)
+    except requests.exceptions.Timeout:
+        raise ProviderError(f"{source}接口请求超时")
+    except requests.exceptions.ConnectionError:
+        raise ProviderError(f"{source}接口连接失败")
+    except requests.exceptions.RequestException as e:
+        raise ProviderError(f"{source}接口异常: {str(e)}")
+
+    if response.status_code != 200:
+        raise ProviderError(f"{source}接口请求失败，状态码: {response.status_code}")
+    return response
+
+
+def coalesce(key, fn, timeout, source):
+    """
+    合并同时进行的相同请求，只有第一个调用者真正请求，其余等待同一结果
+
+    等待超过 timeout 秒时抛出 ProviderError
+    """
+    try:
+        return get_default_single_flight().do(key, fn, timeout=timeout)
+    except TimeoutError:
+        raise ProviderError(f"{source}接口请求超时")
+
+
+def fetch_eastmoney_klines(stock_code, beg, end, fqt='1', timeout=15, deadline=None):
+    """
+    请求东方财富 [beg, end] 区间的日K线
+
+    区间内没有交易日（如周末或尚未上市）时返回空 DataFrame，请求或解析失败抛出 ProviderError。
+    传入 deadline 时请求和重试都不超过剩余时间，用完时抛出 DeadlineExceeded。
+    股票代码、区间和复权方式都相同的并发请求只发送一次，返回的 DataFrame 由各调用方共享
+    """
+    if deadline:
+        timeout = deadline.timeout(timeout)
+    params = {
+        'secid': eastmoney_secid(stock_code),
+        'ut': EASTMONEY_UT,
+        'fields1': 'f1,f2,f3,f4,f5,f6',
+        'fields2': 'f51,f52,f53,f54,f55,f56,f57,f58,f59,f60,f61',
+        'klt': '101',  # 日K线
+        'fqt': fqt,
+        'beg': beg.strftime('%Y%m%d'),
+        'end': end.strftime('%Y%m%d')
+    }
+    key = ('eastmoney_kline', stock_code, fqt, params['beg'], params['end'])
+    return coalesce(key, lambda: _fetch_eastmoney_klines(params, timeout, deadline), timeout, '东方财富')
+
+
+def _fetch_eastmoney_klines(params, timeout, deadline=None):
+    response = _request(EASTMONEY_KLINE_HOST, '/api/qt/stock/kline/get', params, timeout, '东方财富', deadline)
+
+    try:
+        data = response.json()
+    except ValueError as e:
+        raise ProviderError(f"东方财富接口返回数据解析失败: {str(e)}")
+
+    if not data.get('data'):
+        raise ProviderError("东方财富接口返回数据格式异常")
+
+    klines = data['data'].get('klines') or []
+    if not klines:
+        return pd.DataFrame(columns=KLINE_COLUMNS + KLINE_EXTRA_COLUMNS, index=pd.DatetimeIndex([], name='Date'))
+
+    with perf_trace.span('parse_klines', lines=len(klines)) as span:
+        df = parse_eastmoney_klines(klines)
+        span.set(rows=len(df))
+    if df.empty:
+        raise ProviderError("东方财富数据解析失败，数据格式可能有问题")
+    return df
+
+
+def parse_eastmoney_klines(klines):
+    """
+    把东方财富返回的 klines 字符串列表一次性解析为 DataFrame
+
+    每行格式为 "日期,开,收,高,低,成交量,成交额,振幅,涨跌幅,涨跌额,换手率"，缺少后5个字段的行
+    对应列为 NaN，多出的字段被忽略；字段不足6个或日期/价格/成交量无法解析的行会被跳过，
+    文本无法解析时抛出 ProviderError
+    """
+    names = ['Date'] + KLINE_COLUMNS + KLINE_EXTRA_COLUMNS
+    # 按最长一行的字段数建列，字段少的行补 NaN，不会因为所有行都缺少附加字段而出错
+    width = max(len(names), max((line.count(',') + 1 for line in klines), default=0))
+    try:
+        df = pd.read_csv(
+            io.StringIO('\n'.join(klines)),
+            header=None,
+            names=range(width),
+            index_col=False,
+            dtype={0: str},
+            skip_blank_lines=True
+        )
+    except (pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+        raise ProviderError(f"东方财富K线数据解析失败: {str(e)}")
+    df = df.iloc[:, :len(names)]
+    df.columns = names
+
+    # 无法解析的值转为NaN，再丢弃缺少必需字段的行
+    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+    for column in KLINE_COLUMNS + KLINE_EXTRA_COLUMNS:
+        if not pd.api.types.is_numeric_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+    df = df.dropna(subset=['Date'] + KLINE_COLUMNS)
+    df = df[df['Volume'] == df['Volume'].round()]
+    df['Volume'] = df['Volume'].astype('int64')
+
+    df.set_index('Date', inplace=True)
+    return df
+
+
+def _info_value(value, default):
+    """东方财富对缺失字段返回 "-" 或空值，统一替换为默认值"""
+    if value is None or value == '' or value == '-':
+        return default
+    return str(value)
+
+
+def fetch_eastmoney_stock_info(stock_codes, timeout=10):
+    """
+    一次请求东方财富多只股票的基本信息，返回 {股票代码: {'name', 'sector', 'industry'}}
+
+    每批不超过 EASTMONEY_INFO_BATCH_SIZE 只，接口没有返回的股票不在结果中；
+    同一批股票的并发请求只发送一次
+    """
+    stock_codes = tuple(stock_codes)
+    return coalesce(
+        ('eastmoney_info', stock_codes),
+        lambda: _fetch_eastmoney_stock_info(stock_codes, timeout),
+        timeout, '东方财富'
+    )
+
+
+def _fetch_eastmoney_stock_info(stock_codes, timeout):
+    params = {
+        'ut': EASTMONEY_UT,
+        'invt': '2',
+        'fltt': '2',
+        'fields': 'f12,f14,f127,f116',
+        'secids': ','.join(eastmoney_secid(code) for code in stock_codes)
+    }
+    response = _request(EASTMONEY_QUOTE_HOST, '/api/qt/ulist.np/get', params, timeout, '东方财富')
+
+    try:
+        data = response.json()
+    except ValueError as e:
+        raise ProviderError(f"东方财富接口返回数据解析失败: {str(e)}")
+
+    diff = (data.get('data') or {}).get('diff') or []
+    if isinstance(diff, dict):
+        diff = list(diff.values())
+
+    infos = {}
+    for item in diff:
+        code = str(item.get('f12', ''))
+        name = _info_value(item.get('f14'), None)
+        if code and name:
+            infos[code] = {
+                'name': name,
+                'sector': _info_value(item.get('f127'), '未知板块'),
+                'industry': _info_value(item.get('f116'), '未知行业')
+            }
+    return infos
+
+
+def fetch_tencent_stock_names(stock_codes, timeout=10):
+    """
+    一次请求腾讯行情多只股票的名称，返回 {股票代码: 名称}
+
+    腾讯接口支持逗号分隔的多个代码，每只股票返回一行 v_sh600000="1~名称~代码~...";
+    同一批股票的并发请求只发送一次
+    """
+    stock_codes = tuple(stock_codes)
+    return coalesce(
+        ('tencent_names', stock_codes),
+        lambda: _fetch_tencent_stock_names(stock_codes, timeout),
+        timeout, '腾讯'
+    )
+
+
+def _fetch_tencent_stock_names(stock_codes, timeout):
+    path = '/q=' + ','.join(tencent_code(code) for code in stock_codes)
+    response = _request(TENCENT_HOST, path, None, timeout, '腾讯')
+
+    names = {}
+    for line in response.text.split(';'):
+        if '="' not in line or '~' not in line:
+            continue
+        fields = line.split('="', 1)[1].rstrip('"').split('~')
+        if len(fields) >= 3 and fields[1]:
+            names[fields[2]] = fields[1]
+    return names
@@ -0,0 +1,308 @@
+"""
+数据源调度
+
+为每个数据源记录最近若干次请求的耗时和错误率，按健康状况和耗时排序选择数据源：
+- 连续失败的数据源触发熔断，冷却期内不再请求，冷却结束后放行一次试探请求
+- 主数据源超过其 p95 耗时仍未返回时，可以向下一个数据源发出对冲请求，取先返回的有效结果
+所有会话共用同一个调度器，统计信息可在界面上查看以了解某个数据源被选中的原因。
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+import provider_client
+
+# 每个数据源保留的最近请求数
+WINDOW_SIZE = 50
+
+# 样本数达到该值后才按耗时排序和对冲
+MIN_SAMPLES = 3
+
+# 连续失败次数达到该值时熔断
+FAILURE_THRESHOLD = 5
+
+# 熔断后的冷却时间（秒）
+COOLDOWN_SECONDS = 60
+
+# 错误率超过该值的数据源视为不健康，排在健康数据源之后
+UNHEALTHY_ERROR_RATE = 0.5
+
+# 对冲请求的最短等待时间（秒），避免极快的 p95 导致每次都对冲
+MIN_HEDGE_DELAY = 0.2
+
+# 熔断器状态
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+BREAKER_LABELS = {CLOSED: '正常', OPEN: '熔断', HALF_OPEN: '试探'}
+
+
+class ProviderStats:
+    """单个数据源的滚动统计和熔断器"""
+
+    def __init__(self, name, window=WINDOW_SIZE):
+        self.name = name
+        self.samples = deque(maxlen=window)  # (耗时, 是否出错)
+        self.calls = 0
+        self.errors = 0
+        self.misses = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self.last_error = None
+
+    def latencies(self):
+        return [latency for latency, failed in self.samples if not failed]
+
+    def p50(self):
+        latencies = self.latencies()
+        return float(np.percentile(latencies, 50)) if latencies else None
+
+    def p95(self):
+        latencies = self.latencies()
+        return float(np.percentile(latencies, 95)) if len(latencies) >= MIN_SAMPLES else None
+
+    def error_rate(self):
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, failed in self.samples if failed) / len(self.samples)
+
+
+class ProviderScheduler:
+    """按滚动耗时和错误率选择数据源，带熔断和对冲请求"""
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN_SECONDS, hedge=True):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.hedge = hedge
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _get_stats(self, name):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = ProviderStats(name)
+            self._stats[name] = stats
+        return stats
+
+    def _available(self, stats, now):
+        """熔断器是否放行请求；冷却结束后转为试探状态，只放行一次"""
+        if stats.state == OPEN and now >= stats.open_until:
+            stats.state = HALF_OPEN
+            stats.trial_in_flight = False
+        if stats.state == HALF_OPEN:
+            return not stats.trial_in_flight
+        return stats.state == CLOSED
+
+    def rank(self, names):
+        """
+        返回 (排序后的数据源列表, {被跳过的数据源: 原因})
+
+        熔断中的数据源被跳过；健康的数据源在前，其中样本足够的按中位耗时排序，
+        样本不足的保持传入顺序排在后面。这里只是预判，不占用试探名额，发出请求前 execute() 会再检查
+        """
+        now = time.monotonic()
+        ranked = []
+        skipped = {}
+        with self._lock:
+            for index, name in enumerate(names):
+                stats = self._get_stats(name)
+                if not self._available(stats, now):
+                    if stats.state == OPEN:
+                        skipped[name] = f"熔断中，{stats.open_until - now:.0f} 秒后重试"
+                    else:
+                        skipped[name] = "试探请求进行中"
+                    continue
+                p50 = stats.p50() if len(stats.latencies()) >= MIN_SAMPLES else None
+                unhealthy = stats.error_rate() > UNHEALTHY_ERROR_RATE
+                ranked.append(((unhealthy, p50 is None, p50 or 0.0, index), name))
+        ranked.sort()
+        return [name for _, name in ranked], skipped
+
+    def record(self, name, latency, outcome, error=None):
+        """记录一次请求结果，outcome 为 'ok'、'miss'（无数据）或 'error'"""
+        with self._lock:
+            stats = self._get_stats(name)
+            stats.calls += 1
+            failed = outcome == 'error'
+            stats.samples.append((latency, failed))
+            if outcome == 'miss':
+                stats.misses += 1
+
+            if failed:
+                stats.errors += 1
+                stats.last_error = error
+                stats.consecutive_failures += 1
+                if stats.state == HALF_OPEN or stats.consecutive_failures >= self.failure_threshold:
+                    stats.state = OPEN
+                    stats.open_until = time.monotonic() + self.cooldown
+            else:
+                stats.consecutive_failures = 0
+                stats.state = CLOSED
+            stats.trial_in_flight = False
+
+    def _reserve(self, name):
+        """
+        熔断器放行时返回 True；试探状态下同时占用唯一的试探名额
+
+        判断和占用在同一次加锁内完成，并发的请求不会同时发出多个试探请求
+        """
+        with self._lock:
+            stats = self._get_stats(name)
+            if not self._available(stats, time.monotonic()):
+                return False
+            if stats.state == HALF_OPEN:
+                stats.trial_in_flight = True
+            return True
+
+    def _call(self, name, fetch):
+        """执行一次请求并记录结果；返回 None 或空数据视为无数据"""
+        started = time.monotonic()
+        try:
+            data = fetch()
+        except provider_client.DeadlineExceeded:
+            # 总时限用完不代表数据源出错，不计入统计，但要释放试探名额，下次可以重新试探
+            with self._lock:
+                self._get_stats(name).trial_in_flight = False
+            raise
+        except Exception as e:
+            self.record(name, time.monotonic() - started, 'error', str(e))
+            raise
+        empty = data is None or getattr(data, 'empty', False)
+        self.record(name, time.monotonic() - started, 'miss' if empty else 'ok')
+        return None if empty else data
+
+    def _hedge_delay(self, name, started):
+        """主请求发出后等待多久发出对冲请求，无法对冲时返回 None"""
+        with self._lock:
+            p95 = self._get_stats(name).p95()
+        if p95 is None:
+            return None
+        return max(MIN_HEDGE_DELAY, p95) - (time.monotonic() - started)
+
+    def execute(self, candidates, deadline=None, initializer=None):
+        """
+        按顺序尝试 candidates（[(数据源, 无参获取函数), ...]），返回结果字典
+
+        当前请求超过其 p95 耗时时向下一个数据源发出对冲请求，取先返回的有效数据；
+        请求失败或无数据时继续下一个。发出请求前再检查一次熔断器，此时已熔断或试探名额已被占用的
+        数据源记入 skipped。initializer 在每个工作线程启动时调用。
+        返回 {'provider', 'data', 'hedged', 'tried', 'skipped', 'elapsed'}，都失败时 provider 和 data 为 None
+        """
+        result = {'provider': None, 'data': None, 'hedged': False, 'tried': [], 'skipped': [], 'elapsed': 0.0}
+        if not candidates:
+            return result
+
+        started = time.monotonic()
+        executor = ThreadPoolExecutor(
+            max_workers=len(candidates), thread_name_prefix='provider', initializer=initializer
+        )
+        pending = {}
+        next_index = 0
+
+        def launch():
+            """发出下一个熔断器放行的请求，没有可发出的请求时返回 False"""
+            nonlocal next_index
+            while next_index < len(candidates):
+                name, fetch = candidates[next_index]
+                next_index += 1
+                if not self._reserve(name):
+                    result['skipped'].append(name)
+                    continue
+                result['tried'].append(name)
+                pending[executor.submit(self._call, name, fetch)] = (name, time.monotonic())
+                return True
+            return False
+
+        try:
+            launch()
+            while pending:
+                timeout = deadline.remaining() if deadline else None
+                can_hedge = self.hedge and len(pending) == 1 and next_index < len(candidates)
+                if can_hedge:
+                    (name, launched_at), = pending.values()
+                    delay = self._hedge_delay(name, launched_at)
+                    if delay is not None:
+                        timeout = delay if timeout is None else min(timeout, delay)
+
+                done, _ = wait(list(pending), timeout=max(timeout, 0) if timeout is not None else None,
+                               return_when=FIRST_COMPLETED)
+                if not done:
+                    if deadline and deadline.expired:
+                        break
+                    # 主请求慢于 p95，发出对冲请求
+                    (primary, _), = pending.values()
+                    if launch():
+                        with self._lock:
+                            self._get_stats(primary).hedges += 1
+                        result['hedged'] = True
+                    continue
+
+                for future in done:
+                    name, _ = pending.pop(future)
+                    try:
+                        data = future.result()
+                    except Exception:
+                        data = None
+                    if data is not None:
+                        if result['hedged'] and name != result['tried'][0]:
+                            with self._lock:
+                                self._get_stats(result['tried'][0]).hedge_wins += 1
+                        result['provider'] = name
+                        result['data'] = data
+                        return result
+
+                if not pending and next_index < len(candidates) and not (deadline and deadline.expired):
+                    launch()
+            return result
+        finally:
+            result['elapsed'] = time.monotonic() - started
+            # 不等待落后的请求，它们完成后仍会记录统计
+            executor.shutdown(wait=False)
+
+    def stats(self):
+        """返回各数据源的统计信息列表"""
+        now = time.monotonic()
+        with self._lock:
+            rows = []
+            for stats in self._stats.values():
+                self._available(stats, now)
+                rows.append({
+                    'name': stats.name,
+                    'state': BREAKER_LABELS[stats.state],
+                    'calls': stats.calls,
+                    'error_rate': stats.error_rate(),
+                    'misses': stats.misses,
+                    'p50': stats.p50(),
+                    'p95': stats.p95(),
+                    'hedges': stats.hedges,
+                    'hedge_wins': stats.hedge_wins,
+                    'last_error': stats.last_error
+                })
+            return rows
+
+    def reset(self):
+        """清空所有统计并关闭熔断"""
+        with self._lock:
+            self._stats.clear()
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_default_scheduler():
+    """返回进程内共享的默认调度器"""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = ProviderScheduler()
+        return _default_scheduler
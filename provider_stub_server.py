@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地行情数据源替身服务器
+
+以与真实接口相同的格式返回东方财富K线、个股信息（stock/get、ulist.np/get）和腾讯实时行情，
+数据为按股票代码确定性生成的模拟K线，或 --replay-dir 中录制的响应。
+可配置延迟、错误率和限流（429），用于在单机上离线压测吞吐量和数据源回退行为。
+
+启动后设置环境变量 MARKET_DATA_STUB_URL=http://127.0.0.1:8765 再运行任一可视化工具，
+所有经过 provider_client 的请求都会发往本服务器（Yahoo Finance 由 yfinance 直接访问，不受影响）。
+以 9 开头的股票代码视为不存在，用于测试回退逻辑。
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+import requests
+
+DEFAULT_PORT = 8765
+
+# 模拟K线的起始日期
+SYNTHETIC_START = date(2000, 1, 1)
+
+SYNTHETIC_SECTORS = ['银行', '证券', '半导体', '医药生物', '食品饮料', '汽车', '电力设备', '房地产']
+
+# 各接口路径对应的真实主机，录制模式下用于转发
+UPSTREAM_HOSTS = {
+    '/api/qt/stock/kline/get': 'push2his.eastmoney.com',
+    '/api/qt/stock/get': 'push2.eastmoney.com',
+    '/api/qt/ulist.np/get': 'push2.eastmoney.com',
+    '/q=': 'qt.gtimg.cn'
+}
+
+
+def parse_code(value):
+    """从 secid（1.600000）或腾讯代码（sh600000）中取出6位股票代码"""
+    value = value.strip()
+    if '.' in value:
+        return value.split('.', 1)[1]
+    if value[:2] in ('sh', 'sz', 'bj'):
+        return value[2:]
+    return value
+
+
+def parse_day(text, default):
+    """解析 YYYYMMDD 日期，'0' 或无法解析的值（如 20500000）返回默认值"""
+    try:
+        return datetime.strptime(text, '%Y%m%d').date()
+    except (TypeError, ValueError):
+        return default
+
+
+def is_unknown(stock_code):
+    """以 9 开头或不是6位数字的代码视为不存在"""
+    return len(stock_code) != 6 or not stock_code.isdigit() or stock_code.startswith('9')
+
+
+class SyntheticMarket:
+    """按股票代码确定性生成的模拟行情，同一日期的K线在不同区间请求中保持一致"""
+
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+        # 交易日历只生成一次，bdate_range 本身较慢
+        self.dates = pd.bdate_range(SYNTHETIC_START, date.today())
+
+    def series(self, stock_code):
+        with self._lock:
+            df = self._series.get(stock_code)
+            if df is None:
+                df = self._generate(stock_code)
+                self._series[stock_code] = df
+            return df
+
+    def _generate(self, stock_code):
+        dates = self.dates
+        rng = np.random.default_rng(int(stock_code))
+        n = len(dates)
+        close = np.round(5 + 20 * rng.random() * np.exp(np.cumsum(rng.normal(0, 0.02, n))), 2)
+        open_ = np.round(close * (1 + rng.normal(0, 0.01, n)), 2)
+        high = np.round(np.maximum(open_, close) * (1 + rng.random(n) * 0.02), 2)
+        low = np.round(np.minimum(open_, close) * (1 - rng.random(n) * 0.02), 2)
+        volume = rng.integers(10_000, 5_000_000, n)
+        prev_close = np.concatenate([[open_[0]], close[:-1]])
+        change = np.round(close - prev_close, 2)
+        return pd.DataFrame({
+            'open': open_,
+            'close': close,
+            'high': high,
+            'low': low,
+            'volume': volume,
+            'amount': np.round(volume * close * 100, 2),
+            'amplitude': np.round((high - low) / prev_close * 100, 2),
+            'pct_change': np.round(change / prev_close * 100, 2),
+            'change': change,
+            'turnover': np.round(rng.random(n) * 5, 2)
+        }, index=dates)
+
+    def name(self, stock_code):
+        return f"模拟{stock_code}"
+
+    def sector(self, stock_code):
+        return SYNTHETIC_SECTORS[int(stock_code) % len(SYNTHETIC_SECTORS)]
+
+    def klines(self, stock_code, beg, end):
+        """返回东方财富格式的 klines 字符串列表"""
+        df = self.series(stock_code)
+        df = df[(df.index >= pd.Timestamp(beg)) & (df.index <= pd.Timestamp(end))]
+        dates = df.index.strftime('%Y-%m-%d')
+        return [
+            f"{d},{r.open:.2f},{r.close:.2f},{r.high:.2f},{r.low:.2f},{r.volume},{r.amount:.2f},"
+            f"{r.amplitude:.2f},{r.pct_change:.2f},{r.change:.2f},{r.turnover:.2f}"
+            for d, r in zip(dates, df.itertuples(index=False))
+        ]
+
+    def last_quote(self, stock_code):
+        """返回 (最新价, 昨收)"""
+        df = self.series(stock_code)
+        return float(df['close'].iloc[-1]), float(df['close'].iloc[-2])
+
+
+class StubConfig:
+    """故障注入配置"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, max_rps=None, replay_dir=None, record=False):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_rps = max_rps
+        self.replay_dir = replay_dir
+        self.record = record
+
+
+class StubStats:
+    """请求计数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def add(self, key):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """按路径分发到各接口的模拟实现"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # 压测时不逐条输出访问日志
+        pass
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        path = parts.path
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+
+        if path == '/__stats':
+            return self._send(200, json.dumps(server.stats.snapshot()), 'application/json')
+
+        route = '/q=' if path.startswith('/q=') else path
+        server.stats.add(route)
+
+        config = server.config
+        delay = config.latency + (random.uniform(0, config.jitter) if config.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+        if not server.allow_request():
+            server.stats.add('429')
+            return self._send(429, 'Too Many Requests', 'text/plain', {'Retry-After': '1'})
+        if config.error_rate and random.random() < config.error_rate:
+            server.stats.add('500')
+            return self._send(500, 'Internal Server Error', 'text/plain')
+
+        replayed = server.replay(route, self.path)
+        if replayed is not None:
+            status, body, content_type = replayed
+            return self._send(status, body, content_type)
+
+        if route == '/api/qt/stock/kline/get':
+            body = self._kline(query)
+        elif route == '/api/qt/stock/get':
+            body = self._stock_get(query)
+        elif route == '/api/qt/ulist.np/get':
+            body = self._ulist(query)
+        elif route == '/q=':
+            return self._send(200, self._tencent(path[len('/q='):]), 'text/plain; charset=GBK', encoding='gbk')
+        else:
+            return self._send(404, 'Not Found', 'text/plain')
+        return self._send(200, json.dumps(body, ensure_ascii=False), 'application/json; charset=utf-8')
+
+    def _kline(self, query):
+        stock_code = parse_code(query.get('secid', ''))
+        if is_unknown(stock_code):
+            return {'rc': 0, 'data': None}
+        beg = parse_day(query.get('beg'), SYNTHETIC_START)
+        end = parse_day(query.get('end'), date.today())
+        market = self.server.market
+        return {
+            'rc': 0,
+            'data': {
+                'code': stock_code,
+                'market': 1 if stock_code.startswith('6') else 0,
+                'name': market.name(stock_code),
+                'klines': market.klines(stock_code, beg, end)
+            }
+        }
+
+    def _stock_info(self, stock_code):
+        market = self.server.market
+        return {
+            'f12': stock_code,
+            'f14': market.name(stock_code),
+            'f58': market.name(stock_code),
+            'f127': market.sector(stock_code),
+            'f116': round(market.last_quote(stock_code)[0] * 1e8, 2)
+        }
+
+    def _stock_get(self, query):
+        stock_code = parse_code(query.get('secid', ''))
+        if is_unknown(stock_code):
+            return {'rc': 0, 'data': None}
+        return {'rc': 0, 'data': self._stock_info(stock_code)}
+
+    def _ulist(self, query):
+        codes = [parse_code(secid) for secid in query.get('secids', '').split(',') if secid]
+        diff = [self._stock_info(code) for code in codes if not is_unknown(code)]
+        return {'rc': 0, 'data': {'total': len(diff), 'diff': diff}}
+
+    def _tencent(self, codes_text):
+        market = self.server.market
+        lines = []
+        for item in codes_text.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            stock_code = parse_code(item)
+            if is_unknown(stock_code):
+                lines.append('v_pv_none_match="1";')
+                continue
+            price, prev_close = market.last_quote(stock_code)
+            fields = ['1', market.name(stock_code), stock_code, f"{price:.2f}", f"{prev_close:.2f}", f"{prev_close:.2f}"]
+            lines.append(f'v_{item}="{"~".join(fields)}";')
+        return '\n'.join(lines) + '\n'
+
+    def _send(self, status, body, content_type, headers=None, encoding='utf-8'):
+        data = body.encode(encoding) if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class ProviderStubServer(ThreadingHTTPServer):
+    """替身服务器，可在后台线程中运行，供压测脚本在进程内使用"""
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, config=None):
+        super().__init__((host, port), StubHandler)
+        self.config = config or StubConfig()
+        self.market = SyntheticMarket()
+        self.stats = StubStats()
+        self._rate_lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def allow_request(self):
+        """按每秒请求数限流，超出时返回 False"""
+        if not self.config.max_rps:
+            return True
+        with self._rate_lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1:
+                self._window_start = now
+                self._window_count = 0
+            self._window_count += 1
+            return self._window_count <= self.config.max_rps
+
+    def _replay_path(self, request_path):
+        digest = hashlib.sha1(request_path.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.config.replay_dir, f"{digest}.json")
+
+    def replay(self, route, request_path):
+        """
+        返回录制的 (状态码, 响应体, Content-Type)，没有录制时返回 None
+
+        录制模式下没有录制的请求会转发给真实接口并保存
+        """
+        if not self.config.replay_dir or route not in UPSTREAM_HOSTS:
+            return None
+        path = self._replay_path(request_path)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                recorded = json.load(f)
+            return recorded['status'], recorded['body'].encode(recorded['encoding']), recorded['content_type']
+        if not self.config.record:
+            return None
+
+        response = requests.get(f"http://{UPSTREAM_HOSTS[route]}{request_path}", timeout=15,
+                                headers={'User-Agent': 'Mozilla/5.0', 'Referer': 'http://quote.eastmoney.com/'})
+        encoding = response.encoding or 'utf-8'
+        recorded = {
+            'request': request_path,
+            'status': response.status_code,
+            'content_type': response.headers.get('Content-Type', 'text/plain'),
+            'encoding': encoding,
+            'body': response.content.decode(encoding, errors='replace')
+        }
+        os.makedirs(self.config.replay_dir, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(recorded, f, ensure_ascii=False)
+        return recorded['status'], response.content, recorded['content_type']
+
+    def start(self):
+        """在后台线程中运行，返回自身"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地行情数据源替身服务器')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='监听端口')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的固定延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='额外的随机延迟上限（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回500错误的比例（0-1）')
+    parser.add_argument('--max-rps', type=int, default=None, help='每秒最多处理的请求数，超出返回429')
+    parser.add_argument('--replay-dir', default=None, help='录制响应所在目录，存在录制时优先返回')
+    parser.add_argument('--record', action='store_true', help='没有录制的请求转发给真实接口并保存到 --replay-dir')
+    args = parser.parse_args()
+
+    if args.record and not args.replay_dir:
+        parser.error('--record 需要同时指定 --replay-dir')
+
+    config = StubConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        max_rps=args.max_rps,
+        replay_dir=args.replay_dir,
+        record=args.record
+    )
+    server = ProviderStubServer(args.host, args.port, config)
+    print(f"行情替身服务器已启动: {server.url}")
+    print(f"使用方法: 设置环境变量 MARKET_DATA_STUB_URL={server.url} 后启动可视化工具")
+    print(f"请求统计: {server.url}/__stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n已停止")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
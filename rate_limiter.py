@@ -0,0 +1,200 @@
+"""
+上游接口限流
+
+每个行情主机一个进程内共享的令牌桶，所有请求（K线、股票信息、实时行情）发送前先取令牌，
+主动控制请求速率，避免被数据源封禁。等待取令牌的请求按优先级排队，同一优先级先到先得：
+界面上的点击为交互优先级，批量预取为后台优先级，后台任务不会挤占交互请求。
+"""
+
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# 请求优先级，数值越小越优先
+INTERACTIVE = 0
+BACKGROUND = 1
+
+PRIORITY_LABELS = {INTERACTIVE: '交互', BACKGROUND: '后台'}
+
+# 各主机默认限额：(每秒请求数, 突发容量)
+DEFAULT_RATE_LIMITS = {
+    'push2his.eastmoney.com': (5.0, 10),
+    'push2.eastmoney.com': (5.0, 10),
+    'qt.gtimg.cn': (10.0, 20),
+    'query2.finance.yahoo.com': (1.0, 2)
+}
+
+_priority = contextvars.ContextVar('rate_limit_priority', default=INTERACTIVE)
+
+
+class RateLimitTimeout(Exception):
+    """在超时时间内没有取到令牌"""
+
+
+@contextmanager
+def priority(level):
+    """在 with 块内以指定优先级发送请求（线程池中的任务需在任务内部设置）"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+def parse_rate_limits(text):
+    """
+    解析限额配置，格式为 "主机=每秒请求数:突发容量"，多个主机用逗号分隔，
+    例如 "push2his.eastmoney.com=3:6,qt.gtimg.cn=10:20"
+    """
+    limits = {}
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, value = item.partition('=')
+        rate, _, burst = value.partition(':')
+        rate = float(rate)
+        limits[host.strip()] = (rate, int(burst) if burst else max(1, int(rate)))
+    return limits
+
+
+class TokenBucket:
+    """令牌桶，等待者按 (优先级, 到达顺序) 排队"""
+
+    def __init__(self, host, rate, burst):
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._queue = []  # 堆：(优先级, 序号)
+        self._sequence = itertools.count()
+        self._recent_waits = deque(maxlen=100)
+        self.acquired = 0
+        self.timeouts = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, level=None, timeout=None):
+        """
+        取一个令牌，返回等待的秒数
+
+        只有排在队首的请求可以取令牌；超过 timeout 秒仍未取到时抛出 RateLimitTimeout
+        """
+        level = current_priority() if level is None else level
+        ticket = (level, next(self._sequence))
+        started = time.monotonic()
+        expires_at = started + timeout if timeout is not None else None
+
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    is_head = self._queue[0] == ticket
+                    if is_head and self.tokens >= 1:
+                        heapq.heappop(self._queue)
+                        self.tokens -= 1
+                        break
+
+                    # 队首等待下一个令牌生成，其他请求等待被唤醒
+                    delay = (1 - self.tokens) / self.rate if is_head else None
+                    if expires_at is not None:
+                        remaining = expires_at - now
+                        if remaining <= 0:
+                            self.timeouts += 1
+                            raise RateLimitTimeout(f"{self.host} 限流等待超过 {timeout:.1f} 秒")
+                        delay = remaining if delay is None else min(delay, remaining)
+                    self._cond.wait(delay)
+            except BaseException:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                raise
+            finally:
+                # 队首变化后唤醒其他等待者
+                self._cond.notify_all()
+
+            waited = time.monotonic() - started
+            self.acquired += 1
+            self._recent_waits.append(waited)
+        return waited
+
+    def estimated_wait(self, level=INTERACTIVE):
+        """以指定优先级现在排队时预计需要等待的秒数"""
+        with self._cond:
+            self._refill(time.monotonic())
+            ahead = sum(1 for ticket in self._queue if ticket[0] <= level)
+            return max(0.0, (ahead + 1 - self.tokens) / self.rate)
+
+    def stats(self):
+        """返回限流状态"""
+        interactive_wait = self.estimated_wait(INTERACTIVE)
+        background_wait = self.estimated_wait(BACKGROUND)
+        with self._cond:
+            waits = list(self._recent_waits)
+            return {
+                'host': self.host,
+                'rate': self.rate,
+                'burst': self.burst,
+                'tokens': self.tokens,
+                'queued_interactive': sum(1 for ticket in self._queue if ticket[0] == INTERACTIVE),
+                'queued_background': sum(1 for ticket in self._queue if ticket[0] == BACKGROUND),
+                'interactive_wait': interactive_wait,
+                'background_wait': background_wait,
+                'avg_wait': sum(waits) / len(waits) if waits else 0.0,
+                'acquired': self.acquired,
+                'timeouts': self.timeouts
+            }
+
+
+_limits = dict(DEFAULT_RATE_LIMITS)
+_limits.update(parse_rate_limits(os.environ.get('MARKET_DATA_RATE_LIMITS', '')))
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def configure(host, rate, burst):
+    """修改某个主机的限额，已创建的令牌桶会被替换"""
+    with _buckets_lock:
+        _limits[host] = (rate, burst)
+        _buckets.pop(host, None)
+
+
+def get_limiter(host):
+    """返回主机共用的令牌桶，没有配置限额的主机返回 None"""
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        if bucket is None and host in _limits:
+            rate, burst = _limits[host]
+            bucket = TokenBucket(host, rate, burst)
+            _buckets[host] = bucket
+        return bucket
+
+
+def acquire(host, timeout=None):
+    """按当前优先级为主机取一个令牌，返回等待秒数；未配置限额时立即返回 0"""
+    bucket = get_limiter(host)
+    if bucket is None:
+        return 0.0
+    return bucket.acquire(timeout=timeout)
+
+
+def all_limiter_stats():
+    """返回所有已创建令牌桶的状态列表"""
+    with _buckets_lock:
+        buckets = list(_buckets.values())
+    return [bucket.stats() for bucket in buckets]
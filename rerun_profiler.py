@@ -0,0 +1,97 @@
+"""
+按需分析一次运行的耗时
+
+用 cProfile（确定性分析器）运行一次函数调用（通常是一次完整的 main()），汇总耗时最多的函数，
+并导出原始分析数据（与 cProfile.Profile.dump_stats 的格式相同，可用 pstats、snakeviz 等工具打开）。
+Python 3.11 及以前 cProfile 只分析调用它的线程，工作线程中的耗时只体现为主线程的等待；
+3.12 起 cProfile 改用 sys.monitoring，分析期间其他线程中的调用也会计入同一份结果。
+Streamlit 的 st.rerun()、st.stop() 以异常结束本次运行，这时分析结果同样会保存。
+"""
+
+import cProfile
+import marshal
+import os
+import pstats
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# 本项目代码所在目录，用于区分项目代码和第三方库
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SORT_KEYS = {
+    'cumulative': 'cumulative_time',
+    'tottime': 'self_time',
+    'calls': 'calls'
+}
+
+
+class ProfileReport:
+    """一次分析的结果"""
+
+    def __init__(self, profiler, elapsed):
+        profiler.create_stats()
+        self.created = datetime.now()
+        self.elapsed = elapsed
+        self.raw = marshal.dumps(profiler.stats)
+        self.rows = _function_rows(pstats.Stats(profiler))
+
+    @property
+    def file_name(self):
+        return f"profile_{self.created:%Y%m%d-%H%M%S}.prof"
+
+    def top_functions(self, limit=30, sort='cumulative', project_only=False):
+        """返回耗时最多的 limit 个函数，sort 为 cumulative（含子调用）、tottime（自身）或 calls"""
+        rows = self.rows
+        if project_only:
+            rows = [row for row in rows if row['project']]
+        key = SORT_KEYS[sort]
+        return sorted(rows, key=lambda row: row[key], reverse=True)[:limit]
+
+
+def _function_rows(stats):
+    rows = []
+    for (filename, line, name), (primitive_calls, calls, self_time, cumulative_time, _) in stats.stats.items():
+        if filename == '~':
+            # 内置函数
+            location = name
+        else:
+            location = f"{_short_path(filename)}:{line}"
+        rows.append({
+            'function': name,
+            'location': location,
+            'calls': calls,
+            'primitive_calls': primitive_calls,
+            'self_time': self_time,
+            'cumulative_time': cumulative_time,
+            'per_call': cumulative_time / calls if calls else 0.0,
+            'project': filename.startswith(PROJECT_DIR)
+        })
+    return rows
+
+
+def _short_path(filename):
+    """项目内的文件显示相对路径，第三方库只显示 site-packages 之后的部分"""
+    if filename.startswith(PROJECT_DIR):
+        return os.path.relpath(filename, PROJECT_DIR)
+    marker = 'site-packages' + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    return filename
+
+
+@contextmanager
+def profiling(save):
+    """
+    在 cProfile 下运行 with 语句块，结束时把 ProfileReport 传给 save(report)
+
+    语句块抛出异常（包括 Streamlit 重新运行、停止运行的异常）时也会先保存分析结果，异常继续抛出
+    """
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        save(ProfileReport(profiler, time.perf_counter() - started))
@@ -0,0 +1,150 @@
+"""
+进程内共享缓存
+
+Streamlit 每个浏览器会话都会重新执行主脚本，但导入的模块在进程内只加载一次，
+因此放在这里的缓存被所有会话共享：多个用户查看同一只股票只需向上游请求一次。
+每个缓存有独立的过期时间（TTL）和内存上限，超出上限时按最近最少使用（LRU）淘汰。
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+MB = 1024 * 1024
+
+
+def estimate_size(value):
+    """粗略估算对象占用的内存字节数"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    if hasattr(value, 'cache_size'):
+        return value.cache_size()
+    return sys.getsizeof(value)
+
+
+class SharedCache:
+    """线程安全的 LRU 缓存，支持过期时间和内存上限"""
+
+    def __init__(self, name, ttl=None, max_bytes=64 * MB):
+        self.name = name
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """读取缓存，不存在或已过期时返回 default"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """写入缓存，ttl 为空时使用缓存默认的过期时间"""
+        size = estimate_size(value)
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                # 单个对象超过上限时不缓存
+                return
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def __contains__(self, key):
+        """是否有未过期的条目；不计入命中统计，也不改变 LRU 顺序"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            expires_at = entry[2]
+            return expires_at is None or expires_at > time.monotonic()
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        """清空缓存（保留命中统计）"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """返回缓存状态"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'entries': len(self._entries),
+                'size_mb': self._bytes / MB,
+                'max_mb': self.max_bytes / MB,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name, ttl=None, max_bytes=64 * MB):
+    """返回指定名称的共享缓存，首次调用时按给定参数创建"""
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = SharedCache(name, ttl=ttl, max_bytes=max_bytes)
+            _caches[name] = cache
+        return cache
+
+
+def all_cache_stats():
+    """返回所有共享缓存的状态列表"""
+    with _caches_lock:
+        caches = list(_caches.values())
+    return [cache.stats() for cache in caches]
+
+
+def clear_all():
+    """清空所有共享缓存"""
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        cache.clear()
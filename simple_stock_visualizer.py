@@ -5,17 +5,30 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import time
 import random
-import requests
-import json
 from datetime import datetime
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from datetime import timedelta
 import numpy as np
 
+import provider_client
+import rate_limiter
+from kline_store import get_default_store
+from kline_prefetch import KlinePrefetcher
+
+# 东方财富复权方式：1=前复权
+EASTMONEY_FQT = '1'
+
+# 交易文件各列：日期、股票代码、方向、成交价、成交数量、成交额、手续费（后四列可选）
+TRANSACTION_COLUMNS = ['date', 'stock_code', 'direction', 'price', 'quantity', 'amount', 'fee']
+
+# K线图在首笔/末笔交易前后额外显示的天数
+KLINE_PADDING_DAYS = 30
+
 class SimpleStockVisualizer:
     def __init__(self):
         self.transactions = None
+        self.kline_store = get_default_store()  # 本地K线存储
         
     def load_transactions(self, file_path):
         """加载交易数据"""
@@ -26,9 +39,12 @@ class SimpleStockVisualizer:
             for encoding in encodings:
                 try:
                     if 'new' in file_path:
-                        # 包含价格的文件
+                        # 包含价格的文件，新版转换结果还带有成交数量、成交额和手续费
+                        with open(file_path, 'r', encoding=encoding) as f:
+                            first_line = f.readline().strip()
+                        names = TRANSACTION_COLUMNS[:max(4, len(first_line.split(',')))]
                         df = pd.read_csv(file_path, encoding=encoding, header=None, 
-                                       names=['date', 'stock_code', 'direction', 'price'])
+                                       names=names)
                     else:
                         # 不包含价格的文件
                         df = pd.read_csv(file_path, encoding=encoding, header=None,
@@ -57,108 +73,33 @@ class SimpleStockVisualizer:
     
     def get_stock_data_eastmoney(self, stock_code, start_date=None, end_date=None):
         """
-        使用东方财富免费接口获取股票K线数据
+        使用东方财富免费接口获取股票K线数据（优先读取本地K线存储，只补齐缺失的区间）
         """
-        try:
-            # 确保stock_code是字符串
-            stock_code = str(stock_code)
-            
-            # 处理股票代码格式
-            if stock_code.startswith('6'):
-                # 上海股票
-                market_code = f"1.{stock_code}"
-            elif stock_code.startswith('0') or stock_code.startswith('3'):
-                # 深圳股票
-                market_code = f"0.{stock_code}"
-            else:
-                market_code = stock_code
-            
-            # 东方财富K线数据接口
-            url = "http://push2his.eastmoney.com/api/qt/stock/kline/get"
-            params = {
-                'secid': market_code,
-                'ut': 'fa5fd1943c7b386f172d6893dbfba10b',
-                'fields1': 'f1,f2,f3,f4,f5,f6',
-                'fields2': 'f51,f52,f53,f54,f55,f56,f57,f58,f59,f60,f61',
-                'klt': '101',  # 日K线
-                'fqt': '1',    # 前复权
-                'beg': '0',
-                'end': '20500000'
-            }
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Referer': 'http://quote.eastmoney.com/',
-                'Accept': 'application/json, text/plain, */*',
-                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
-            }
-            
+        # 确保stock_code是字符串
+        stock_code = str(stock_code)
+        
+        missing_ranges = self.kline_store.missing_ranges(stock_code, EASTMONEY_FQT, start_date, end_date)
+        if missing_ranges:
             print(f"正在从东方财富获取股票 {stock_code} 的数据...")
-            response = requests.get(url, params=params, headers=headers, timeout=15)
-            
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    
-                    if data.get('data') and data['data'].get('klines'):
-                        klines = data['data']['klines']
-                        
-                        if not klines:
-                            print(f"东方财富返回空数据，股票代码 {stock_code} 可能不存在")
-                            return None
-                        
-                        # 解析K线数据
-                        df_data = []
-                        for line in klines:
-                            try:
-                                parts = line.split(',')
-                                if len(parts) >= 6:
-                                    df_data.append({
-                                        'Date': pd.to_datetime(parts[0]),
-                                        'Open': float(parts[1]),
-                                        'Close': float(parts[2]),
-                                        'High': float(parts[3]),
-                                        'Low': float(parts[4]),
-                                        'Volume': int(parts[5])
-                                    })
-                            except (ValueError, IndexError):
-                                continue  # 跳过无效数据行
-                        
-                        if df_data:
-                            df = pd.DataFrame(df_data)
-                            df.set_index('Date', inplace=True)
-                            
-                            # 过滤日期范围
-                            if start_date:
-                                start_dt = pd.to_datetime(start_date)
-                                df = df[df.index >= start_dt]
-                            if end_date:
-                                end_dt = pd.to_datetime(end_date)
-                                df = df[df.index <= end_dt]
-                            
-                            print(f"✅ 东方财富接口成功获取 {len(df)} 条K线数据")
-                            return df
-                        else:
-                            print("东方财富数据解析失败，数据格式可能有问题")
-                    else:
-                        print("东方财富接口返回数据格式异常")
-                        
-                except json.JSONDecodeError as e:
-                    print(f"东方财富接口返回数据解析失败: {str(e)}")
-            else:
-                print(f"东方财富接口请求失败，状态码: {response.status_code}")
-            
-            return None
-            
-        except requests.exceptions.Timeout:
-            print("东方财富接口请求超时")
-            return None
-        except requests.exceptions.ConnectionError:
-            print("东方财富接口连接失败")
-            return None
-        except Exception as e:
-            print(f"东方财富接口异常: {str(e)}")
+            try:
+                self.kline_store.top_up(
+                    stock_code, EASTMONEY_FQT, start_date, end_date,
+                    lambda beg, end: provider_client.fetch_eastmoney_klines(stock_code, beg, end, fqt=EASTMONEY_FQT)
+                )
+            except provider_client.ProviderError as e:
+                # 请求失败的区间不登记为已覆盖，下次再补
+                print(str(e))
+        
+        df = self.kline_store.load(stock_code, EASTMONEY_FQT, start_date, end_date)
+        if df.empty:
+            print(f"东方财富返回空数据，股票代码 {stock_code} 可能不存在")
             return None
+        
+        if missing_ranges:
+            print(f"✅ 东方财富接口成功获取 {len(df)} 条K线数据")
+        else:
+            print(f"✅ 从本地K线缓存读取 {len(df)} 条K线数据")
+        return df
     
     def get_stock_data_yahoo(self, stock_code, start_date, end_date, max_retries=3):
         """使用Yahoo Finance获取股票K线数据（备用方案）"""
@@ -183,9 +124,10 @@ class SimpleStockVisualizer:
                     print(f"正在重试获取股票数据，等待 {delay:.1f} 秒...")
                     time.sleep(delay)
                 
-                # 获取股票数据
+                # 获取股票数据；yfinance 不经过 provider_client，在这里单独取令牌
+                waited = rate_limiter.acquire(provider_client.YAHOO_HOST, timeout=10)
                 stock = yf.Ticker(symbol)
-                data = stock.history(start=start_date, end=end_date)
+                data = stock.history(start=start_date, end=end_date, timeout=max(10 - waited, 0.1))
                 
                 if data.empty:
                     print(f"无法获取股票 {stock_code} 的数据，可能该股票不存在或已退市")
@@ -227,15 +169,10 @@ class SimpleStockVisualizer:
                 tencent_code = stock_code
             
             # 腾讯股票接口
-            url = f"http://qt.gtimg.cn/q={tencent_code}"
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Referer': 'http://qt.gtimg.cn/'
-            }
+            path = f"/q={tencent_code}"
             
             print(f"正在从腾讯接口获取股票 {stock_code} 的数据...")
-            response = requests.get(url, headers=headers, timeout=10)
+            response = provider_client.get(provider_client.TENCENT_HOST, path, timeout=10)
             
             if response.status_code == 200:
                 content = response.text.strip()
@@ -300,6 +237,35 @@ class SimpleStockVisualizer:
         print("腾讯接口也失败，尝试Yahoo Finance...")
         return self.get_stock_data_yahoo(stock_code, start_date, end_date, max_retries)
     
+    def get_kline_ranges(self):
+        """返回每只股票K线图需要的日期范围 [(股票代码, 开始日期, 结束日期), ...]"""
+        if self.transactions is None:
+            return []
+        
+        dates = self.transactions.groupby('stock_code')['date'].agg(['min', 'max'])
+        padding = timedelta(days=KLINE_PADDING_DAYS)
+        return [(code, row['min'] - padding, row['max'] + padding) for code, row in dates.iterrows()]
+    
+    def prefetch_all_klines(self, max_workers=8):
+        """并发预取所有股票的K线到本地存储，Ctrl+C 可取消"""
+        prefetcher = KlinePrefetcher(self.kline_store, fqt=EASTMONEY_FQT, max_workers=max_workers)
+        
+        def on_progress(status, stock_code, error):
+            state = f"失败: {error}" if error else "完成"
+            print(f"[{status['done']}/{status['total']}] {stock_code} {state}")
+        
+        prefetcher.start(self.get_kline_ranges(), on_progress)
+        try:
+            while not prefetcher.wait(0.5):
+                pass
+        except KeyboardInterrupt:
+            print("正在取消预取...")
+            prefetcher.cancel()
+            prefetcher.wait()
+        
+        status = prefetcher.status()
+        print(f"K线预取结束：完成 {status['done']}/{status['total']}，失败 {status['failed']}")
+    
     def plot_stock_with_trades(self, stock_code, save_plot=False):
         """绘制带交易标记的K线图"""
         if self.transactions is None:
@@ -314,8 +280,8 @@ class SimpleStockVisualizer:
             return
         
         # 确定日期范围
-        start_date = stock_trades['date'].min() - timedelta(days=30)
-        end_date = stock_trades['date'].max() + timedelta(days=30)
+        start_date = stock_trades['date'].min() - timedelta(days=KLINE_PADDING_DAYS)
+        end_date = stock_trades['date'].max() + timedelta(days=KLINE_PADDING_DAYS)
         
         # 获取股票数据
         stock_data = self.get_stock_data(stock_code, start_date, end_date)
@@ -489,6 +455,10 @@ def main():
     if not visualizer.load_transactions(file_path):
         return
     
+    prefetch_option = input("是否预取所有股票的K线数据? (y/n): ").strip().lower()
+    if prefetch_option == 'y':
+        visualizer.prefetch_all_klines()
+    
     while True:
         print("\n" + "="*50)
         print("请选择操作:")
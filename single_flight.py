@@ -0,0 +1,78 @@
+"""
+相同请求合并（single-flight）
+
+多个会话或预取线程同时请求同一数据时（以 (数据源, 股票代码, 日期范围, 复权方式) 等为键），
+只有第一个调用者真正发出请求，其余调用者等待同一个结果，避免收盘时大量会话同时打开页面
+造成对上游接口的突发请求。结果对象被所有等待者共享，调用方不应修改它。
+"""
+
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+
+class SingleFlight:
+    """按键合并同时进行的相同调用"""
+
+    def __init__(self):
+        self._calls = {}  # key -> Future
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, timeout=None):
+        """
+        执行 fn() 并返回结果；同一 key 已有调用在进行时等待其结果
+
+        fn 抛出的异常会传给所有等待者；等待超过 timeout 秒抛出 TimeoutError，正在进行的调用不受影响
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            try:
+                return future.result(timeout)
+            except FutureTimeoutError:
+                # Python 3.11 之前 concurrent.futures.TimeoutError 不是内置的 TimeoutError
+                raise TimeoutError(f"等待相同请求的结果超过 {timeout} 秒")
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self):
+        """正在进行的调用数"""
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        """返回执行次数和被合并的调用次数"""
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'executed': self.executed,
+                'coalesced': self.coalesced
+            }
+
+
+_default_flight = SingleFlight()
+
+
+def get_default_single_flight():
+    """返回进程内共享的默认实例"""
+    return _default_flight
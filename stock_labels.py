@@ -0,0 +1,108 @@
+"""
+股票选择框的显示文本
+
+选择框的 format_func 会对每个选项调用一次，逐个请求股票信息时页面要等所有请求完成才能显示。
+这里按交易记录版本一次性生成所有股票的显示文本：先用股票代码和已缓存的信息、交易表现生成，
+缺少名称的股票在后台线程中获取，每批返回后立即更新对应股票的文本，选择框从一开始就可以使用。
+"""
+
+import sys
+import threading
+import time
+
+import rate_limiter
+
+
+def format_performance(performance_table):
+    """返回 {股票代码: "胜率:xx% (盈利笔数/总笔数)"}"""
+    if performance_table is None or performance_table.empty:
+        return {}
+    win_rates = performance_table['win_rate'].to_numpy()
+    profitable = performance_table['profitable_trades'].to_numpy()
+    total = performance_table['total_trades'].to_numpy()
+    return {
+        code: f"胜率:{rate:.1f}% ({int(wins)}/{int(count)})"
+        for code, rate, wins, count in zip(performance_table.index, win_rates, profitable, total)
+    }
+
+
+class StockLabels:
+    """
+    一份交易记录中所有股票的选择框显示文本
+
+    iter_info(codes) 逐批返回 {股票代码: 信息字典}，cached_info(codes) 只返回已缓存的部分
+    """
+
+    def __init__(self, stock_codes, performance_table, iter_info, cached_info):
+        self.stock_codes = list(stock_codes)
+        self.iter_info = iter_info
+        self._performance = format_performance(performance_table)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.labels = {}
+        self.updated_at = time.monotonic()
+        self.finished = False
+
+        infos = cached_info(self.stock_codes)
+        for code in self.stock_codes:
+            self.labels[code] = self._format(code, infos.get(code))
+        self.pending = [code for code in self.stock_codes if code not in infos]
+        self.loaded = len(self.stock_codes) - len(self.pending)
+        if not self.pending:
+            self.finished = True
+
+    def _format(self, code, info):
+        performance = self._performance.get(code, "胜率:无价格数据 (--)")
+        if info is None:
+            return f"{code} | {performance}"
+        return f"{code} | {info['name']} | {info['sector']} | {performance}"
+
+    def label(self, code):
+        """选择框的 format_func"""
+        return self.labels.get(code, code)
+
+    def start(self):
+        """在后台线程中获取缺少的股票信息，已启动或无需获取时直接返回"""
+        with self._lock:
+            if self.finished or self._thread is not None:
+                return self
+            self._thread = threading.Thread(target=self.run, daemon=True, name='stock-labels')
+        self._thread.start()
+        return self
+
+    def run(self):
+        """获取缺少的股票信息，以后台优先级请求"""
+        try:
+            with rate_limiter.priority(rate_limiter.BACKGROUND):
+                for infos in self.iter_info(self.pending):
+                    with self._lock:
+                        for code, info in infos.items():
+                            self.labels[code] = self._format(code, info)
+                        self.loaded += len(infos)
+                        self.updated_at = time.monotonic()
+        except Exception:
+            # 获取失败的股票保持只有代码的文本
+            pass
+        finally:
+            with self._lock:
+                self.finished = True
+                self.updated_at = time.monotonic()
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.finished
+
+    def status(self):
+        """返回 {'total', 'loaded', 'finished', 'updated_at'}"""
+        with self._lock:
+            return {
+                'total': len(self.stock_codes),
+                'loaded': self.loaded,
+                'finished': self.finished,
+                'updated_at': self.updated_at
+            }
+
+    def cache_size(self):
+        """占用内存字节数，供共享缓存统计"""
+        return sys.getsizeof(self.labels) + sum(sys.getsizeof(text) for text in self.labels.values())
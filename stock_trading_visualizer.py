@@ -3,200 +3,163 @@ import yfinance as yf
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import streamlit as st
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import numpy as np
 import time
 import random
-import requests
 import json
+import hashlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import perf_trace
+import provider_client
+import rate_limiter
+import rerun_profiler
+import transaction_loader
+from figure_cache import get_default_figure_cache
+from kline_store import get_default_store, to_date
+from kline_prefetch import KlinePrefetcher
+from neighbour_warmer import DEFAULT_HOT_CODES, DEFAULT_RADIUS, NeighbourWarmer, neighbour_order
+from ohlc_downsample import DEFAULT_MAX_BARS, PERIOD_LABELS, downsample_ohlc
+from provider_scheduler import get_default_scheduler
+from single_flight import get_default_single_flight
+from stock_labels import StockLabels
+from trade_performance import TradePerformance
+from shared_cache import MB, all_cache_stats, clear_all, get_cache
+
+# 东方财富复权方式：1=前复权
+EASTMONEY_FQT = '1'
+
+# K线图在首笔/末笔交易前后额外显示的天数
+KLINE_PADDING_DAYS = 30
+
+# K线图的周期选项：自动按显示区间长度聚合、原始日K或指定周期
+CHART_PERIOD_OPTIONS = ['auto', None, 'W', 'M']
+CHART_PERIOD_LABELS = {'auto': '自动', None: '日K', **PERIOD_LABELS}
+
+# 所有会话共享的缓存（K线、股票信息、交易表现）
+KLINE_CACHE = get_cache('klines', ttl=600, max_bytes=256 * MB)
+STOCK_INFO_CACHE = get_cache('stock_info', ttl=24 * 3600, max_bytes=16 * MB)
+PERFORMANCE_CACHE = get_cache('performance', ttl=3600, max_bytes=128 * MB)
+STOCK_LABEL_CACHE = get_cache('stock_labels', ttl=600, max_bytes=16 * MB)
+
+# 后台获取股票信息时，选择框文本最多每隔多少秒刷新一次
+LABEL_REFRESH_SECONDS = 5
+
+# 股票信息获取失败时默认值的缓存时间（秒），便于稍后重试
+STOCK_INFO_FAILURE_TTL = 300
+
+# 并发获取股票信息的批次数
+STOCK_INFO_WORKERS = 4
+
+# 交易概览表可能含有获取失败的默认信息，与其同时过期
+SUMMARY_CACHE = get_cache('summary', ttl=STOCK_INFO_FAILURE_TTL, max_bytes=64 * MB)
+
+# 数据源获取某只股票K线失败后，在这段时间（秒）内直接跳过该数据源
+PROVIDER_FAILURE_TTL = 600
+PROVIDER_FAILURE_CACHE = get_cache('provider_failures', ttl=PROVIDER_FAILURE_TTL, max_bytes=1 * MB)
+
+# 一次K线获取（含所有备用数据源）的总时限（秒）
+FETCH_DEADLINE_SECONDS = 20
+
+# 数据源名称；有历史K线的数据源由调度器排序，腾讯接口只有实时行情，仅在最后兜底
+PROVIDER_LABELS = {'eastmoney': '东方财富', 'yahoo': 'Yahoo Finance', 'tencent': '腾讯'}
+HISTORY_PROVIDERS = ['eastmoney', 'yahoo']
+REALTIME_PROVIDERS = ['tencent']
+
+# 在数据源工作线程中运行时，提示信息记录到这个列表中，由脚本线程统一显示
+_status_messages = contextvars.ContextVar('status_messages', default=None)
+
+def show_status(level, text):
+    """显示提示信息（level 为 'info'、'success'、'warning' 或 'error'）；在数据源工作线程中只记录到列表"""
+    messages = _status_messages.get()
+    if messages is None:
+        getattr(st, level)(text)
+    else:
+        messages.append((level, text))
 
 class StockTradingVisualizer:
     def __init__(self):
         self.transactions = None
-        self.stock_info_cache = {}  # 缓存股票基本信息
+        self.stock_info_cache = STOCK_INFO_CACHE  # 缓存股票基本信息（所有会话共享）
+        self.kline_store = get_default_store()  # 本地K线存储
+        self.figure_cache = get_default_figure_cache()  # 已构建的K线图和交易统计
+        self.warmer = NeighbourWarmer(self.warm_stock)  # 在后台预热相邻的股票
+        self._warm_request = None
+        self._transactions_version = None  # 交易记录内容哈希
+        self._transactions_version_source = None
+        self._derived = {}  # 由交易记录派生、只需计算一次的数据
+        self._derived_source = None
         
+    @perf_trace.traced('load_transactions')
     def load_transactions(self, file_path):
-        """加载交易数据"""
+        """加载交易数据（列格式、编码和标题行按文件内容判断）"""
         try:
-            # 尝试不同的编码方式
-            encodings = ['utf-8', 'gbk', 'gb2312', 'utf-8-sig']
-            
-            for encoding in encodings:
-                try:
-                    # 先读取文件检查是否有标题行
-                    with open(file_path, 'r', encoding=encoding) as f:
-                        first_line = f.readline().strip()
-                    
-                    # 检查第一行是否包含非数字字符（可能是标题行）
-                    has_header = not first_line.split(',')[0].isdigit()
-                    
-                    if file_path.endswith('tdx_transaction_new.csv'):
-                        # 包含价格的文件
-                        if has_header:
-                            df = pd.read_csv(file_path, encoding=encoding, skiprows=1, header=None, 
-                                           names=['date', 'stock_code', 'direction', 'price'])
-                        else:
-                            df = pd.read_csv(file_path, encoding=encoding, header=None, 
-                                           names=['date', 'stock_code', 'direction', 'price'])
-                    else:
-                        # 不包含价格的文件
-                        if has_header:
-                            df = pd.read_csv(file_path, encoding=encoding, skiprows=1, header=None,
-                                           names=['date', 'stock_code', 'direction'])
-                        else:
-                            df = pd.read_csv(file_path, encoding=encoding, header=None,
-                                           names=['date', 'stock_code', 'direction'])
-                        df['price'] = None
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                st.error("无法读取文件，请检查文件编码")
-                return False
-                
-            # 数据处理
-            # 过滤掉可能的无效行
-            df = df.dropna(subset=['date', 'stock_code', 'direction'])
-            
-            # 尝试多种日期格式解析
-            try:
-                # 首先尝试标准格式
-                df['date'] = pd.to_datetime(df['date'], format='%Y%m%d')
-            except ValueError:
-                try:
-                    # 尝试其他可能的格式
-                    df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
-                except ValueError:
-                    try:
-                        # 让pandas自动推断格式
-                        df['date'] = pd.to_datetime(df['date'])
-                    except ValueError as e:
-                        st.error(f"日期格式解析失败: {str(e)}")
-                        return False
-            
-            # 确保股票代码保持为字符串格式，避免前导零被截断
-            df['stock_code'] = df['stock_code'].astype(str).str.zfill(6)
-            df['action'] = df['direction'].map({1: '买入', 2: '卖出'})
-            
-            # 过滤掉无效的交易记录
-            df = df[df['action'].notna()]
-            
-            if len(df) == 0:
-                st.error("文件中没有有效的交易记录")
-                return False
-            
-            self.transactions = df
-            st.success(f"成功加载 {len(df)} 条交易记录")
-            return True
-            
+            df = transaction_loader.load_transactions(file_path)
+        except transaction_loader.TransactionFormatError as e:
+            st.error(str(e))
+            return False
         except Exception as e:
             st.error(f"加载文件时出错: {str(e)}")
             return False
+        
+        if len(df) == 0:
+            st.error("文件中没有有效的交易记录")
+            return False
+        
+        self.transactions = df
+        st.success(f"成功加载 {len(df)} 条交易记录")
+        return True
     
-    def get_stock_data_eastmoney(self, stock_code, start_date, end_date):
-        """使用东方财富免费接口获取股票K线数据"""
-        try:
-            # 确保stock_code是字符串
-            stock_code = str(stock_code)
-            
-            # 处理股票代码格式
-            if stock_code.startswith('6'):
-                # 上海股票
-                market_code = f"1.{stock_code}"
-            elif stock_code.startswith('0') or stock_code.startswith('3'):
-                # 深圳股票
-                market_code = f"0.{stock_code}"
-            else:
-                market_code = stock_code
-            
-            # 东方财富K线数据接口
-            url = "http://push2his.eastmoney.com/api/qt/stock/kline/get"
-            params = {
-                'secid': market_code,
-                'ut': 'fa5fd1943c7b386f172d6893dbfba10b',
-                'fields1': 'f1,f2,f3,f4,f5,f6',
-                'fields2': 'f51,f52,f53,f54,f55,f56,f57,f58,f59,f60,f61',
-                'klt': '101',  # 日K线
-                'fqt': '1',    # 前复权
-                'beg': '0',
-                'end': '20500000'
-            }
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Referer': 'http://quote.eastmoney.com/',
-                'Accept': 'application/json, text/plain, */*',
-                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
-            }
-            
-            st.info(f"正在从东方财富获取股票 {stock_code} 的数据...")
-            response = requests.get(url, params=params, headers=headers, timeout=15)
-            
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    
-                    if data.get('data') and data['data'].get('klines'):
-                        klines = data['data']['klines']
-                        
-                        if not klines:
-                            st.warning(f"东方财富返回空数据，股票代码 {stock_code} 可能不存在")
-                            return None
-                        
-                        # 解析K线数据
-                        df_data = []
-                        for line in klines:
-                            try:
-                                parts = line.split(',')
-                                if len(parts) >= 6:
-                                    df_data.append({
-                                        'Date': pd.to_datetime(parts[0]),
-                                        'Open': float(parts[1]),
-                                        'Close': float(parts[2]),
-                                        'High': float(parts[3]),
-                                        'Low': float(parts[4]),
-                                        'Volume': int(parts[5])
-                                    })
-                            except (ValueError, IndexError) as e:
-                                continue  # 跳过无效数据行
-                        
-                        if df_data:
-                            df = pd.DataFrame(df_data)
-                            df.set_index('Date', inplace=True)
-                            
-                            # 过滤日期范围
-                            if start_date:
-                                start_dt = pd.to_datetime(start_date)
-                                df = df[df.index >= start_dt]
-                            if end_date:
-                                end_dt = pd.to_datetime(end_date)
-                                df = df[df.index <= end_dt]
-                            
-                            st.success(f"✅ 东方财富接口成功获取 {len(df)} 条K线数据")
-                            return df
-                        else:
-                            st.warning("东方财富数据解析失败，数据格式可能有问题")
-                    else:
-                        st.warning("东方财富接口返回数据格式异常")
-                        
-                except Exception as e:
-                    st.warning(f"东方财富接口返回数据解析失败: {str(e)}")
-            else:
-                st.warning(f"东方财富接口请求失败，状态码: {response.status_code}")
-            
-            return None
-            
-        except requests.exceptions.Timeout:
-            st.warning("东方财富接口请求超时")
-            return None
-        except requests.exceptions.ConnectionError:
-            st.warning("东方财富接口连接失败")
-            return None
-        except Exception as e:
-            st.warning(f"东方财富接口异常: {str(e)}")
+    def get_stock_data_eastmoney(self, stock_code, start_date, end_date, deadline=None):
+        """使用东方财富免费接口获取股票K线数据（优先读取本地K线存储，只补齐缺失的区间）"""
+        # 确保stock_code是字符串
+        stock_code = str(stock_code)
+        
+        # 先查所有会话共享的内存缓存
+        cache_key = (stock_code, EASTMONEY_FQT, to_date(start_date), to_date(end_date))
+        df = KLINE_CACHE.get(cache_key)
+        if df is not None:
+            show_status('success', f"✅ 从共享缓存读取 {len(df)} 条K线数据")
+            return df
+        
+        missing_ranges = self.kline_store.missing_ranges(stock_code, EASTMONEY_FQT, start_date, end_date)
+        error = None
+        if missing_ranges:
+            show_status('info', f"正在从东方财富获取股票 {stock_code} 的数据...")
+            try:
+                self.kline_store.top_up(
+                    stock_code, EASTMONEY_FQT, start_date, end_date,
+                    lambda beg, end: provider_client.fetch_eastmoney_klines(
+                        stock_code, beg, end, fqt=EASTMONEY_FQT, deadline=deadline
+                    )
+                )
+            except provider_client.ProviderError as e:
+                # 请求失败的区间不登记为已覆盖，下次再补
+                show_status('warning', str(e))
+                error = e
+        
+        df = self.kline_store.load(stock_code, EASTMONEY_FQT, start_date, end_date)
+        if df.empty:
+            if error is not None:
+                raise error
+            show_status('warning', f"东方财富返回空数据，股票代码 {stock_code} 可能不存在")
             return None
+        
+        if error is not None:
+            # 只补齐了一部分：返回已有的K线，但不放入共享缓存，下次仍会补齐缺失的区间
+            show_status('warning', f"东方财富数据不完整，暂时显示本地已有的 {len(df)} 条K线数据")
+            return df
+        
+        KLINE_CACHE.set(cache_key, df)
+        if missing_ranges:
+            show_status('success', f"✅ 东方财富接口成功获取 {len(df)} 条K线数据")
+        else:
+            show_status('success', f"✅ 从本地K线缓存读取 {len(df)} 条K线数据")
+        return df
     
-    def get_stock_data_yahoo(self, stock_code, start_date, end_date, max_retries=3):
+    def get_stock_data_yahoo(self, stock_code, start_date, end_date, max_retries=3, deadline=None):
         """使用Yahoo Finance获取股票K线数据（备用方案）"""
         # 确保股票代码是字符串类型
         stock_code = str(stock_code)
@@ -214,176 +177,224 @@ class StockTradingVisualizer:
                 # 添加随机延迟以避免频率限制
                 if attempt > 0:
                     delay = random.uniform(2, 5) * (attempt + 1)
-                    st.info(f"正在重试获取股票数据，等待 {delay:.1f} 秒...")
+                    if deadline and delay >= deadline.remaining():
+                        show_status('warning', "已达到数据获取总时限，停止重试")
+                        raise provider_client.DeadlineExceeded("Yahoo Finance 重试超过总时限")
+                    show_status('info', f"正在重试获取股票数据，等待 {delay:.1f} 秒...")
                     time.sleep(delay)
                 
                 # 获取股票数据
-                stock = yf.Ticker(symbol)
-                data = stock.history(start=start_date, end=end_date)
+                timeout = deadline.timeout(10) if deadline else 10
+                
+                def fetch_history():
+                    # yfinance 不经过 provider_client，在这里单独取令牌
+                    waited = rate_limiter.acquire(provider_client.YAHOO_HOST, timeout=timeout)
+                    return yf.Ticker(symbol).history(start=start_date, end=end_date, timeout=max(timeout - waited, 0.1))
+                
+                # 多个会话同时请求同一股票时只请求一次
+                data = provider_client.coalesce(
+                    ('yahoo', symbol, str(start_date), str(end_date)),
+                    fetch_history, timeout, 'Yahoo Finance'
+                )
                 
                 if data.empty:
-                    st.warning(f"无法获取股票 {stock_code} 的数据，可能该股票不存在或已退市")
+                    show_status('warning', f"无法获取股票 {stock_code} 的数据，可能该股票不存在或已退市")
                     return None
                     
                 return data
                 
+            except provider_client.DeadlineExceeded:
+                raise
             except Exception as e:
                 error_msg = str(e).lower()
                 if "rate limit" in error_msg or "too many requests" in error_msg:
                     if attempt < max_retries - 1:
-                        st.warning(f"API频率限制，正在重试... (尝试 {attempt + 1}/{max_retries})")
+                        show_status('warning', f"API频率限制，正在重试... (尝试 {attempt + 1}/{max_retries})")
                         continue
                     else:
-                        st.error("API频率限制，请稍后再试。建议：\n1. 等待几分钟后重试\n2. 或者尝试查看其他股票")
-                        return None
+                        show_status('error', "API频率限制，请稍后再试。建议：\n1. 等待几分钟后重试\n2. 或者尝试查看其他股票")
+                        raise provider_client.ProviderError("Yahoo Finance 频率限制")
                 else:
-                    st.error(f"获取股票数据时出错: {str(e)}")
-                    return None
+                    show_status('error', f"获取股票数据时出错: {str(e)}")
+                    raise provider_client.ProviderError(f"Yahoo Finance 异常: {str(e)}")
         
         return None
     
     def get_stock_info(self, stock_code):
         """获取股票基本信息（名称、板块等）"""
-        if stock_code in self.stock_info_cache:
-            return self.stock_info_cache[stock_code]
+        return self.get_stock_info_many([stock_code])[stock_code]
+    
+    @perf_trace.traced('get_stock_info')
+    def get_stock_info_many(self, stock_codes):
+        """批量获取多只股票的基本信息，返回 {股票代码: 信息字典}"""
+        result = {}
+        for infos in self.iter_stock_info(stock_codes):
+            result.update(infos)
+        return result
+    
+    def iter_stock_info(self, stock_codes, max_workers=STOCK_INFO_WORKERS):
+        """
+        逐批返回股票基本信息 {股票代码: 信息字典}
+        
+        先返回缓存中已有的股票，其余按批并发请求（每批先请求东方财富，缺名称的再请求腾讯接口），
+        每批完成后立即返回该批结果，调用方可以边获取边显示
+        """
+        stock_codes = list(dict.fromkeys(str(code) for code in stock_codes))
+        cached = self.get_cached_stock_info(stock_codes)
+        if cached:
+            yield cached
         
+        missing = [code for code in stock_codes if code not in cached]
+        batches = provider_client.chunked(missing, provider_client.EASTMONEY_INFO_BATCH_SIZE)
+        if not batches:
+            return
+        
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches)), thread_name_prefix='stock-info') as executor:
+            # 每个任务在提交时上下文的副本中运行，沿用调用方的限流优先级和性能追踪
+            futures = [
+                executor.submit(contextvars.copy_context().run, self._fetch_stock_info_batch, batch)
+                for batch in batches
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+    
+    def _fetch_stock_info_batch(self, batch):
+        """请求一批股票的基本信息并写入缓存，获取失败的股票使用默认值"""
+        # 东方财富批量接口：名称、板块、行业
+        fetched = {}
         try:
-            # 使用东方财富接口获取股票基本信息
-            stock_code = str(stock_code)
-            
-            if stock_code.startswith('6'):
-                market_code = f"1.{stock_code}"
-            elif stock_code.startswith('0') or stock_code.startswith('3'):
-                market_code = f"0.{stock_code}"
-            else:
-                market_code = stock_code
-            
-            # 尝试第一个接口获取完整信息
-            url1 = "http://push2.eastmoney.com/api/qt/stock/get"
-            params1 = {
-                'ut': 'fa5fd1943c7b386f172d6893dbfba10b',
-                'invt': '2',
-                'fltt': '2',
-                'fields': 'f12,f14,f58,f127,f116',  # 增加更多字段
-                'secid': market_code
-            }
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Referer': 'http://quote.eastmoney.com/'
-            }
-            
-            response = requests.get(url1, params=params1, headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('data'):
-                    stock_data = data['data']
-                    name = stock_data.get('f14') or stock_data.get('f58')
-                    if name:
-                        info = {
-                            'name': name,
-                            'sector': stock_data.get('f127', '未知板块'),
-                            'industry': str(stock_data.get('f116', '未知行业'))
-                        }
-                        self.stock_info_cache[stock_code] = info
-                        return info
-            
-            # 如果第一个接口没有获取到名称，尝试第二个接口
-            url2 = "http://qt.gtimg.cn/q=s_sh000001,s_sz000001"
-            if stock_code.startswith('6'):
-                tencent_code = f"sh{stock_code}"
-            elif stock_code.startswith('0') or stock_code.startswith('3'):
-                tencent_code = f"sz{stock_code}"
-            else:
-                tencent_code = stock_code
-            
-            url2 = f"http://qt.gtimg.cn/q={tencent_code}"
-            response2 = requests.get(url2, headers=headers, timeout=10)
-            
-            if response2.status_code == 200:
-                content = response2.text.strip()
-                if content and '~' in content:
-                    try:
-                        # 解析腾讯接口返回的数据
-                        data_part = content.split('="')[1].rstrip('";')
-                        fields = data_part.split('~')
-                        if len(fields) >= 2:
-                            name = fields[1]  # 第二个字段是股票名称
-                            info = {
-                                'name': name,
-                                'sector': '未知板块',
-                                'industry': '未知行业'
-                            }
-                            self.stock_info_cache[stock_code] = info
-                            return info
-                    except Exception:
-                        pass
-                        
-        except Exception as e:
+            fetched.update(provider_client.fetch_eastmoney_stock_info(batch))
+        except Exception:
             pass
         
-        # 如果获取失败，返回默认值
-        default_info = {
-            'name': f'股票{stock_code}',
-            'sector': '未知板块',
-            'industry': '未知行业'
-        }
-        self.stock_info_cache[stock_code] = default_info
-        return default_info
+        # 腾讯批量接口：只能补齐名称
+        remaining = [code for code in batch if code not in fetched]
+        for tencent_batch in provider_client.chunked(remaining, provider_client.TENCENT_BATCH_SIZE):
+            try:
+                names = provider_client.fetch_tencent_stock_names(tencent_batch)
+            except Exception:
+                continue
+            for code, name in names.items():
+                if code in tencent_batch:
+                    fetched[code] = {'name': name, 'sector': '未知板块', 'industry': '未知行业'}
+        
+        result = {}
+        for stock_code in batch:
+            info = fetched.get(stock_code)
+            if info is not None:
+                self.stock_info_cache.set(stock_code, info)
+            else:
+                # 如果获取失败，返回默认值
+                info = {
+                    'name': f'股票{stock_code}',
+                    'sector': '未知板块',
+                    'industry': '未知行业'
+                }
+                self.stock_info_cache.set(stock_code, info, ttl=STOCK_INFO_FAILURE_TTL)
+            result[stock_code] = info
+        return result
     
-    def calculate_trade_performance(self, stock_code):
-        """计算股票交易表现"""
-        if self.transactions is None:
-            return None
+    def get_cached_stock_info(self, stock_codes):
+        """只返回缓存中已有的股票信息，不发起请求"""
+        result = {}
+        for stock_code in stock_codes:
+            info = self.stock_info_cache.get(str(stock_code))
+            if info is not None:
+                result[stock_code] = info
+        return result
+    
+    def get_stock_labels(self):
+        """
+        返回股票选择框的显示文本（按交易记录内容在所有会话间共享）
         
-        stock_trades = self.transactions[self.transactions['stock_code'] == stock_code].copy()
-        if len(stock_trades) == 0 or stock_trades['price'].isna().all():
+        首次调用时用股票代码和已缓存的信息生成，缺少的股票信息在后台按批获取后逐步补齐
+        """
+        if self.transactions is None:
             return None
         
-        # 按日期排序
-        stock_trades = stock_trades.sort_values('date')
-        
-        # 计算每次买卖的盈亏
-        trades_with_profit = []
-        buy_stack = []  # 买入栈
-        
-        for _, trade in stock_trades.iterrows():
-            if trade['direction'] == 1:  # 买入
-                buy_stack.append(trade)
-            elif trade['direction'] == 2 and buy_stack:  # 卖出且有买入记录
-                buy_trade = buy_stack.pop(0)  # FIFO
-                profit_pct = (trade['price'] - buy_trade['price']) / buy_trade['price'] * 100
-                trades_with_profit.append({
-                    'buy_date': buy_trade['date'],
-                    'sell_date': trade['date'],
-                    'buy_price': buy_trade['price'],
-                    'sell_price': trade['price'],
-                    'profit_pct': profit_pct,
-                    'is_profit': profit_pct > 0
-                })
-        
-        if not trades_with_profit:
+        version = self.get_transactions_version()
+        labels = STOCK_LABEL_CACHE.get(version)
+        if labels is None:
+            with perf_trace.span('build_stock_labels'):
+                labels = StockLabels(
+                    self.get_stock_codes(),
+                    self.get_performance().summary,
+                    self.iter_stock_info,
+                    self.get_cached_stock_info
+                )
+            STOCK_LABEL_CACHE.set(version, labels)
+        return labels.start()
+    
+    def get_transactions_version(self):
+        """返回交易记录内容的哈希，内容相同的文件在各会话间得到相同的值"""
+        if self.transactions is None:
             return None
         
-        # 计算统计数据
-        total_trades = len(trades_with_profit)
-        profitable_trades = sum(1 for t in trades_with_profit if t['is_profit'])
-        win_rate = profitable_trades / total_trades * 100 if total_trades > 0 else 0
+        if self._transactions_version_source is not self.transactions:
+            hashed = pd.util.hash_pandas_object(self.transactions, index=False).to_numpy()
+            self._transactions_version = hashlib.sha1(hashed.tobytes()).hexdigest()
+            self._transactions_version_source = self.transactions
+        return self._transactions_version
+    
+    def _derived_value(self, name, compute):
+        """返回由当前交易记录派生的数据，交易记录更换后重新计算"""
+        if self._derived_source is not self.transactions:
+            self._derived = {}
+            self._derived_source = self.transactions
+        if name not in self._derived:
+            self._derived[name] = compute()
+        return self._derived[name]
+    
+    def get_stock_codes(self):
+        """返回排好序的股票代码列表"""
+        if self.transactions is None:
+            return []
+        return self._derived_value('stock_codes', lambda: sorted(self.transactions['stock_code'].unique()))
+    
+    def get_preview(self):
+        """返回侧边栏交易数据预览的统计信息和数据表"""
+        def compute():
+            transactions = self.transactions
+            table = transactions[['date', 'stock_code', 'action', 'price']].copy()
+            table['date'] = table['date'].dt.strftime('%Y-%m-%d')
+            table = table.rename(columns={
+                'date': '日期',
+                'stock_code': '股票代码', 
+                'action': '操作',
+                'price': '价格'
+            })
+            return {
+                'total_records': len(transactions),
+                'unique_stocks': transactions['stock_code'].nunique(),
+                'date_range': f"{transactions['date'].min().strftime('%Y-%m-%d')} 至 {transactions['date'].max().strftime('%Y-%m-%d')}",
+                'table': table
+            }
         
-        total_profit = sum(t['profit_pct'] for t in trades_with_profit if t['is_profit'])
-        total_loss = abs(sum(t['profit_pct'] for t in trades_with_profit if not t['is_profit']))
-        profit_loss_ratio = total_profit / total_loss if total_loss > 0 else float('inf')
+        if self.transactions is None:
+            return None
+        return self._derived_value('preview', compute)
+    
+    def get_performance(self):
+        """返回所有股票的交易表现（按交易记录内容在所有会话间共享）"""
+        if self.transactions is None:
+            return None
         
-        return {
-            'total_trades': total_trades,
-            'profitable_trades': profitable_trades,
-            'win_rate': win_rate,
-            'profit_loss_ratio': profit_loss_ratio,
-            'trades_detail': trades_with_profit
-        }
+        version = self.get_transactions_version()
+        performance = PERFORMANCE_CACHE.get(version)
+        if performance is None:
+            with perf_trace.span('calculate_trade_performance', rows=len(self.transactions)):
+                performance = TradePerformance(self.transactions)
+            PERFORMANCE_CACHE.set(version, performance)
+        return performance
     
-    def get_stock_data_tencent(self, stock_code, start_date=None, end_date=None):
+    def calculate_trade_performance(self, stock_code):
+        """计算股票交易表现"""
+        performance = self.get_performance()
+        if performance is None:
+            return None
+        return performance.get(stock_code)
+    
+    def get_stock_data_tencent(self, stock_code, start_date=None, end_date=None, deadline=None):
         """
         使用腾讯股票接口获取实时数据（备用方案）
         """
@@ -400,15 +411,15 @@ class StockTradingVisualizer:
                 tencent_code = stock_code
             
             # 腾讯股票接口
-            url = f"http://qt.gtimg.cn/q={tencent_code}"
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Referer': 'http://qt.gtimg.cn/'
-            }
+            path = f"/q={tencent_code}"
             
-            st.info(f"正在从腾讯接口获取股票 {stock_code} 的数据...")
-            response = requests.get(url, headers=headers, timeout=10)
+            show_status('info', f"正在从腾讯接口获取股票 {stock_code} 的数据...")
+            timeout = deadline.timeout(10) if deadline else 10
+            response = provider_client.coalesce(
+                ('tencent_quote', tencent_code),
+                lambda: provider_client.get(provider_client.TENCENT_HOST, path, timeout=timeout, deadline=deadline),
+                timeout, '腾讯'
+            )
             
             if response.status_code == 200:
                 content = response.text.strip()
@@ -440,38 +451,283 @@ class StockTradingVisualizer:
                             df = pd.DataFrame(df_data)
                             df.set_index('Date', inplace=True)
                             
-                            st.success(f"✅ 腾讯接口获取到实时数据")
+                            show_status('success', f"✅ 腾讯接口获取到实时数据")
                             return df
                     except (ValueError, IndexError) as e:
-                        st.warning(f"腾讯接口数据解析失败: {str(e)}")
+                        show_status('warning', f"腾讯接口数据解析失败: {str(e)}")
                 else:
-                    st.warning("腾讯接口返回数据格式异常")
+                    show_status('warning', "腾讯接口返回数据格式异常")
             else:
-                st.warning(f"腾讯接口请求失败，状态码: {response.status_code}")
+                show_status('warning', f"腾讯接口请求失败，状态码: {response.status_code}")
+                raise provider_client.ProviderError(f"腾讯接口请求失败，状态码: {response.status_code}")
             
             return None
             
+        except provider_client.ProviderError:
+            raise
         except Exception as e:
-            st.warning(f"腾讯接口异常: {str(e)}")
+            show_status('warning', f"腾讯接口异常: {str(e)}")
+            raise provider_client.ProviderError(f"腾讯接口异常: {str(e)}")
+    
+    @perf_trace.traced('get_stock_data')
+    def get_stock_data(self, stock_code, start_date, end_date, max_retries=3, deadline=None):
+        """
+        获取股票K线数据
+        
+        有历史K线的数据源由调度器按最近的耗时和错误率排序（熔断中的跳过，慢于 p95 时发出对冲请求），
+        都失败时再用只有实时行情的腾讯接口兜底。所有数据源共用一个总时限；
+        某个数据源获取该股票失败后会被记录，PROVIDER_FAILURE_TTL 秒内再次请求时直接跳过
+        """
+        stock_code = str(stock_code)
+        deadline = deadline or provider_client.Deadline(FETCH_DEADLINE_SECONDS)
+        
+        # 本地K线存储已完整覆盖时直接读取，无需调度
+        cache_key = (stock_code, EASTMONEY_FQT, to_date(start_date), to_date(end_date))
+        if cache_key in KLINE_CACHE or not self.kline_store.missing_ranges(stock_code, EASTMONEY_FQT, start_date, end_date):
+            with perf_trace.span('kline_cache', stock=stock_code):
+                data = self.get_stock_data_eastmoney(stock_code, start_date, end_date, deadline)
+            if data is not None:
+                return data
+        
+        fetchers = {
+            'eastmoney': lambda: self.get_stock_data_eastmoney(stock_code, start_date, end_date, deadline),
+            'yahoo': lambda: self.get_stock_data_yahoo(stock_code, start_date, end_date, max_retries, deadline),
+            'tencent': lambda: self.get_stock_data_tencent(stock_code, start_date, end_date, deadline)
+        }
+        
+        # 各数据源的提示信息，工作线程只记录，由脚本线程显示
+        messages = {provider: [] for provider in fetchers}
+        
+        def remember_failure(provider):
+            # 记录该数据源获取这只股票失败（总时限用完不算）
+            def fetch():
+                token = _status_messages.set(messages[provider])
+                try:
+                    with perf_trace.span(f'provider:{provider}', stock=stock_code) as span:
+                        try:
+                            data = fetchers[provider]()
+                        except provider_client.DeadlineExceeded:
+                            raise
+                        except Exception:
+                            PROVIDER_FAILURE_CACHE.set((provider, stock_code), True)
+                            raise
+                        if data is None or data.empty:
+                            PROVIDER_FAILURE_CACHE.set((provider, stock_code), True)
+                        span.set(rows=0 if data is None else len(data))
+                        return data
+                finally:
+                    _status_messages.reset(token)
+            return fetch
+        
+        # 工作线程不绑定脚本上下文：对冲落败或超过总时限后仍在运行的请求不会再向页面输出，
+        # 只继续记录到当前的性能追踪
+        captured = perf_trace.capture()
+        
+        def initializer():
+            perf_trace.attach(captured)
+        scheduler = get_default_scheduler()
+        
+        for group in (HISTORY_PROVIDERS, REALTIME_PROVIDERS):
+            names = []
+            for provider in group:
+                if (provider, stock_code) in PROVIDER_FAILURE_CACHE:
+                    st.info(f"{PROVIDER_LABELS[provider]}接口近期获取股票 {stock_code} 失败，已跳过")
+                else:
+                    names.append(provider)
+            
+            order, skipped = scheduler.rank(names)
+            for provider, reason in skipped.items():
+                st.info(f"{PROVIDER_LABELS[provider]}接口{reason}，已跳过")
+            if not order:
+                continue
+            if deadline.expired:
+                st.warning(f"获取股票 {stock_code} 的数据已超过总时限 {FETCH_DEADLINE_SECONDS} 秒，已停止尝试")
+                return None
+            
+            result = scheduler.execute(
+                [(provider, remember_failure(provider)) for provider in order],
+                deadline=deadline,
+                initializer=initializer
+            )
+            for provider in result['skipped']:
+                st.info(f"{PROVIDER_LABELS[provider]}接口熔断中或已有试探请求，已跳过")
+            # 显示返回前已记录的提示信息，之后落后的请求记录的不再显示
+            for provider in result['tried']:
+                for level, text in list(messages[provider]):
+                    getattr(st, level)(text)
+            if result['data'] is not None:
+                tried = ' → '.join(PROVIDER_LABELS[provider] for provider in result['tried'])
+                hedged = '，已发出对冲请求' if result['hedged'] else ''
+                st.caption(f"数据来源：{PROVIDER_LABELS[result['provider']]}（尝试顺序：{tried}{hedged}，"
+                           f"耗时 {result['elapsed']:.1f} 秒）")
+                return result['data']
+        
+        if deadline.expired:
+            st.warning(f"获取股票 {stock_code} 的数据已超过总时限 {FETCH_DEADLINE_SECONDS} 秒，已停止尝试")
+        else:
+            st.warning(f"所有数据源均未能获取股票 {stock_code} 的数据，{PROVIDER_FAILURE_TTL // 60} 分钟内不再重试")
+        return None
+    
+    def get_kline_ranges(self):
+        """返回每只股票K线图需要的日期范围 [(股票代码, 开始日期, 结束日期), ...]"""
+        if self.transactions is None:
+            return []
+        
+        dates = self.transactions.groupby('stock_code')['date'].agg(['min', 'max'])
+        padding = timedelta(days=KLINE_PADDING_DAYS)
+        return [(code, row['min'] - padding, row['max'] + padding) for code, row in dates.iterrows()]
+    
+    def start_prefetch(self, max_workers=8):
+        """在后台批量预取所有股票的K线到本地存储"""
+        prefetcher = KlinePrefetcher(self.kline_store, fqt=EASTMONEY_FQT, max_workers=max_workers)
+        return prefetcher.start(self.get_kline_ranges())
+    
+    def get_hot_codes(self, limit=DEFAULT_HOT_CODES):
+        """返回交易笔数最多的 limit 只股票"""
+        if self.transactions is None:
+            return []
+        hot_codes = self._derived_value('hot_codes', lambda: self.transactions['stock_code'].value_counts().index.tolist())
+        return hot_codes[:limit]
+    
+    def warm_neighbours(self, selected_stock, period='auto', radius=DEFAULT_RADIUS):
+        """在后台预热选择框中 selected_stock 前后各 radius 只股票和交易最多的股票，选中的股票或周期变化时重新安排"""
+        request = (self.get_transactions_version(), selected_stock, period)
+        if request == self._warm_request:
+            return
+        self._warm_request = request
+        codes = neighbour_order(self.get_stock_codes(), selected_stock, radius, self.get_hot_codes())
+        self.warmer.schedule(codes, period)
+    
+    def cancel_warming(self):
+        """取消后台预热（如加载了新的交易记录）"""
+        self._warm_request = None
+        self.warmer.cancel()
+    
+    def warm_stock(self, stock_code, is_stale, period='auto'):
+        """
+        为一只股票补齐K线、获取股票信息并构建默认显示区间的图表，之后切换到这只股票时直接读取缓存
+        
+        在预热线程中运行，不调用界面函数；is_stale() 返回 True 时在下一步之前放弃
+        """
+        transactions = self.transactions
+        if transactions is None:
+            return
+        stock_trades = transactions[transactions['stock_code'] == stock_code].copy()
+        if stock_trades.empty:
+            return
+        start_date, end_date = chart_date_range(stock_trades)
+        
+        # K线：只补齐本地存储缺失的区间，失败时留给界面上的正常获取流程
+        if self.kline_store.missing_ranges(stock_code, EASTMONEY_FQT, start_date, end_date):
+            self.kline_store.top_up(
+                stock_code, EASTMONEY_FQT, start_date, end_date,
+                lambda beg, end: provider_client.fetch_eastmoney_klines(stock_code, beg, end, fqt=EASTMONEY_FQT)
+            )
+        if is_stale():
+            return
+        
+        # 股票名称和板块
+        self.get_stock_info_many([stock_code])
+        if is_stale():
+            return
+        
+        # 图表：含未收盘K线等不能缓存的情况下跳过
+        chart_key = self.get_chart_key(stock_code, start_date, end_date)
+        if chart_key is None:
+            return
+        stock_data = None
+        chart = self.figure_cache.get(('chart',) + chart_key)
+        if chart is None:
+            stock_data = self.kline_store.load(stock_code, EASTMONEY_FQT, start_date, end_date)
+            if stock_data.empty:
+                return
+            chart = self.build_chart(stock_code, stock_trades, stock_data)
+            self.figure_cache.set(('chart',) + chart_key, chart)
+        
+        # 与界面的默认显示区间（完整区间）一致
+        first_day, last_day = chart_days(chart)
+        date_range = (first_day, last_day) if first_day < last_day else None
+        figure_key = figure_cache_key(chart_key, date_range, period)
+        if is_stale() or self.figure_cache.get(figure_key) is not None:
+            return
+        if stock_data is None:
+            stock_data = self.kline_store.load(stock_code, EASTMONEY_FQT, start_date, end_date)
+        fig = self.build_trade_figure(stock_code, stock_trades, stock_data, date_range=date_range, period=period)
+        self.figure_cache.set(figure_key, fig.to_json())
+    
+    def get_summary_table(self, on_update=None):
+        """
+        返回所有股票的交易概览表（按交易记录内容在所有会话间共享）
+        
+        需要获取股票信息时，每获取一批调用一次 on_update(当前的概览表, 已获取数, 总数)，
+        尚未获取到的股票名称显示为"加载中..."
+        """
+        if self.transactions is None:
             return None
+        
+        version = self.get_transactions_version()
+        summary = SUMMARY_CACHE.get(version)
+        if summary is not None:
+            return summary
+        
+        stock_codes = self.get_stock_codes()
+        stock_infos = {}
+        for infos in self.iter_stock_info(stock_codes):
+            stock_infos.update(infos)
+            if on_update and len(stock_infos) < len(stock_codes):
+                on_update(self.build_summary_table(stock_infos), len(stock_infos), len(stock_codes))
+        
+        summary = self.build_summary_table(stock_infos)
+        SUMMARY_CACHE.set(version, summary)
+        return summary
     
-    def get_stock_data(self, stock_code, start_date, end_date, max_retries=3):
-        """获取股票K线数据 - 优先使用国内数据源"""
-        # 首先尝试东方财富接口
-        data = self.get_stock_data_eastmoney(stock_code, start_date, end_date)
-        if data is not None and not data.empty:
-            return data
+    def get_summary_base(self):
+        """按股票汇总的交易次数、首末交易日期和交易表现（一次分组计算，不含股票信息）"""
+        def compute():
+            transactions = self.transactions
+            grouped = transactions.assign(
+                is_buy=transactions['direction'] == 1,
+                is_sell=transactions['direction'] == 2
+            ).groupby('stock_code')
+            base = pd.DataFrame({
+                '总交易次数': grouped.size(),
+                '买入次数': grouped['is_buy'].sum(),
+                '卖出次数': grouped['is_sell'].sum(),
+                '首次交易': grouped['date'].min().dt.strftime('%Y-%m-%d'),
+                '最后交易': grouped['date'].max().dt.strftime('%Y-%m-%d')
+            })
+            
+            performance = self.get_performance().summary.reindex(base.index)
+            priced = performance['win_rate'].notna()
+            ratio = performance['profit_loss_ratio']
+            base['胜率'] = performance['win_rate'].map(lambda rate: f"{rate:.1f}%").where(priced, "无价格数据")
+            base['盈亏率'] = ratio.map(lambda value: f"{value:.2f}").where(ratio != float('inf'), "∞").where(priced, "--")
+            if 'realized_pnl' in performance.columns:
+                base['已实现盈亏'] = performance['realized_pnl'].map(lambda pnl: f"{pnl:+,.2f}").where(priced, "--")
+            else:
+                base['已实现盈亏'] = "--"
+            return base
+        
+        return self._derived_value('summary_base', compute)
+    
+    @perf_trace.traced('build_summary_table')
+    def build_summary_table(self, stock_infos):
+        """
+        生成所有股票的交易概览表
         
-        # 如果失败，尝试腾讯接口
-        st.info("东方财富接口获取失败，尝试腾讯接口...")
-        data = self.get_stock_data_tencent(stock_code, start_date, end_date)
-        if data is not None and not data.empty:
-            return data
+        stock_infos 为 {股票代码: 信息字典}（如 get_stock_info_many 的结果），缺少的股票名称和板块显示为"加载中..."
+        """
+        base = self.get_summary_base()
+        codes = base.index
+        names = pd.Series([stock_infos[code]['name'] if code in stock_infos else "加载中..." for code in codes], index=codes)
+        sectors = pd.Series([stock_infos[code]['sector'] if code in stock_infos else "加载中..." for code in codes], index=codes)
         
-        # 最后尝试Yahoo Finance
-        st.info("腾讯接口也失败，尝试Yahoo Finance...")
-        return self.get_stock_data_yahoo(stock_code, start_date, end_date, max_retries)
+        summary = base.assign(股票名称=names, 所属板块=sectors)
+        summary.index.name = '股票代码'
+        columns = ['股票名称', '所属板块', '总交易次数', '买入次数', '卖出次数', '胜率', '盈亏率', '已实现盈亏', '首次交易', '最后交易']
+        return summary[columns].reset_index()
     
+    @perf_trace.traced('plot_stock_with_trades')
     def plot_stock_with_trades(self, stock_code):
         """绘制带交易标记的K线图"""
         if self.transactions is None:
@@ -486,33 +742,172 @@ class StockTradingVisualizer:
             return
         
         # 确定日期范围
-        start_date = stock_trades['date'].min() - timedelta(days=30)
-        end_date = stock_trades['date'].max() + timedelta(days=30)
+        start_date, end_date = chart_date_range(stock_trades)
         
-        # 获取股票数据
-        stock_data = self.get_stock_data(stock_code, start_date, end_date)
+        # 本地存储完整覆盖时按 (股票代码, 交易记录版本, K线版本) 读取缓存的统计和已构建的图表，
+        # 无需读取K线；加载新的交易记录或写入新的K线后缓存键随之变化
+        chart_key = self.get_chart_key(stock_code, start_date, end_date)
+        chart = self.figure_cache.get(('chart',) + chart_key) if chart_key else None
         
-        if stock_data is None:
-            return
+        stock_data = None
+        if chart is None:
+            # 获取股票数据
+            stock_data = self.get_stock_data(stock_code, start_date, end_date)
+            
+            if stock_data is None:
+                return
+            
+            chart = self.build_chart(stock_code, stock_trades, stock_data)
+            # 数据来自其他数据源或含未收盘的K线时不缓存
+            chart_key = self.get_chart_key(stock_code, start_date, end_date)
+            if chart_key is not None:
+                self.figure_cache.set(('chart',) + chart_key, chart)
         
-        # 创建子图布局 - K线图和成交量图
-        from plotly.subplots import make_subplots
+        # 显示区间和K线周期：区间较长时在服务端聚合为周K/月K，缩小区间后恢复日K
+        date_range = None
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            first_day, last_day = chart_days(chart)
+            if first_day < last_day:
+                date_range = st.slider(
+                    "显示区间",
+                    min_value=first_day,
+                    max_value=last_day,
+                    value=(first_day, last_day),
+                    format="YYYY-MM-DD",
+                    key=f"chart_range_{stock_code}"
+                )
+        with col2:
+            period = st.selectbox("K线周期", CHART_PERIOD_OPTIONS, format_func=CHART_PERIOD_LABELS.get,
+                                  key="chart_period")
+        
+        figure_key = figure_cache_key(chart_key, date_range, period) if chart_key else None
+        cached_figure = self.figure_cache.get(figure_key) if figure_key else None
+        
+        if cached_figure is not None:
+            fig = json.loads(cached_figure)
+        else:
+            if stock_data is None:
+                stock_data = self.get_stock_data(stock_code, start_date, end_date)
+                if stock_data is None:
+                    return
+            fig = self.build_trade_figure(stock_code, stock_trades, stock_data, date_range=date_range, period=period)
+            if figure_key is not None:
+                self.figure_cache.set(figure_key, fig.to_json())
+        
+        # 使用全宽度显示图表
+        with perf_trace.span('render_chart', cached=cached_figure is not None):
+            st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': True})
+        
+        show_trade_stats(stock_code, chart['stats'])
+    
+    def get_chart_key(self, stock_code, start_date, end_date):
+        """
+        返回图表缓存键 (股票代码, 交易记录版本, K线版本)
+        
+        本地存储未完整覆盖 [start_date, end_date] 时K线来自其他数据源或含未收盘的K线，
+        由它生成的图表不能按版本号缓存，返回 None
+        """
+        if self.kline_store.missing_ranges(stock_code, EASTMONEY_FQT, start_date, end_date):
+            return None
+        return (stock_code, self.get_transactions_version(), self.kline_store.version(stock_code, EASTMONEY_FQT))
+    
+    def build_chart(self, stock_code, stock_trades, stock_data):
+        """返回图表缓存中按 (股票代码, 交易记录版本, K线版本) 保存的内容：K线的起止日期和交易统计"""
+        return {
+            'first_day': stock_data.index.min().date().isoformat(),
+            'last_day': stock_data.index.max().date().isoformat(),
+            'stats': self.build_trade_stats(stock_code, stock_trades)
+        }
+    
+    def build_trade_stats(self, stock_code, stock_trades):
+        """生成交易统计和明细表的显示数据（可用 JSON 序列化，供图表缓存保存）"""
+        stats = {
+            'total': len(stock_trades),
+            'buys': int((stock_trades['direction'] == 1).sum()),
+            'sells': int((stock_trades['direction'] == 2).sum()),
+            'performance': None,
+            'detail': None
+        }
+        
+        # 获取交易表现数据
+        performance = self.calculate_trade_performance(stock_code)
+        if performance:
+            stats['performance'] = {
+                'win_rate': float(performance['win_rate']),
+                'profit_loss_ratio': float(performance['profit_loss_ratio'])
+            }
+            if 'realized_pnl' in performance:
+                stats['performance']['realized_pnl'] = float(performance['realized_pnl'])
+            if performance['trades_detail']:
+                stats['detail'] = format_trades_detail(performance['trades_detail']).to_dict(orient='list')
+        
+        # 所有交易记录
+        display_trades = stock_trades[['date', 'action', 'price']].copy()
+        display_trades['date'] = display_trades['date'].dt.strftime('%Y-%m-%d')
+        
+        # 重命名列
+        display_trades = display_trades.rename(columns={
+            'date': '交易日期',
+            'action': '操作类型',
+            'price': '交易价格'
+        })
+        
+        # 格式化价格显示
+        if not display_trades['交易价格'].isna().all():
+            display_trades['交易价格'] = display_trades['交易价格'].apply(
+                lambda x: f"{x:.2f}" if pd.notna(x) else "无价格数据"
+            )
+        
+        stats['trades'] = display_trades.to_dict(orient='list')
+        return stats
+    
+    @perf_trace.traced('build_trade_figure')
+    def build_trade_figure(self, stock_code, stock_trades, stock_data, date_range=None, period='auto',
+                           max_bars=DEFAULT_MAX_BARS):
+        """
+        构建带交易标记的K线图和成交量图（不依赖界面，可单独测试耗时）
+        
+        date_range 为 (开始日期, 结束日期) 时只画该区间；period 为 'auto' 时区间内K线超过 max_bars 根
+        就按周/月等周期聚合，None 为不聚合，'W'/'M' 为指定周期
+        """
+        # 标记价格按K线日期二分查找，要求K线按日期升序
+        if not stock_data.index.is_monotonic_increasing:
+            stock_data = stock_data.sort_index()
+        
+        # 交易标记的价格按原始日K计算，不受聚合影响
+        buy_trades = stock_trades[stock_trades['direction'] == 1]
+        sell_trades = stock_trades[stock_trades['direction'] == 2]
+        buy_prices = marker_prices(buy_trades, stock_data, 'Low')
+        sell_prices = marker_prices(sell_trades, stock_data, 'High')
+        
+        if date_range is not None:
+            start, end = pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1])
+            stock_data = stock_data.loc[start:end]
+            buy_visible = ((buy_trades['date'] >= start) & (buy_trades['date'] <= end)).to_numpy()
+            sell_visible = ((sell_trades['date'] >= start) & (sell_trades['date'] <= end)).to_numpy()
+            buy_trades, buy_prices = buy_trades[buy_visible], buy_prices[buy_visible]
+            sell_trades, sell_prices = sell_trades[sell_visible], sell_prices[sell_visible]
+        
+        bars, bar_period = downsample_ohlc(stock_data, max_bars=max_bars, period=period)
+        period_label = PERIOD_LABELS.get(bar_period, '日K')
         
+        # 创建子图布局 - K线图和成交量图
         fig = make_subplots(
             rows=2, cols=1,
             shared_xaxes=True,
             vertical_spacing=0.1,
-            subplot_titles=(f'股票 {stock_code} K线图', '成交量'),
+            subplot_titles=(f'股票 {stock_code} {period_label}', '成交量'),
             row_heights=[0.8, 0.2]  # K线图占80%，成交量图占20%
         )
         
         # 添加K线 - 设置为红涨绿跌
         fig.add_trace(go.Candlestick(
-            x=stock_data.index,
-            open=stock_data['Open'],
-            high=stock_data['High'],
-            low=stock_data['Low'],
-            close=stock_data['Close'],
+            x=bars.index,
+            open=bars['Open'],
+            high=bars['High'],
+            low=bars['Low'],
+            close=bars['Close'],
             name=f'{stock_code} K线',
             increasing_line_color='red',  # 上涨为红色
             decreasing_line_color='green',  # 下跌为绿色
@@ -520,77 +915,46 @@ class StockTradingVisualizer:
             decreasing_fillcolor='green'
         ), row=1, col=1)
         
-        # 添加成交量柱状图
-        if 'Volume' in stock_data.columns:
-            # 根据涨跌设置成交量颜色
-            colors = []
-            for i in range(len(stock_data)):
-                if stock_data['Close'].iloc[i] >= stock_data['Open'].iloc[i]:
-                    colors.append('red')  # 上涨日成交量为红色
-                else:
-                    colors.append('green')  # 下跌日成交量为绿色
+        # 添加成交量柱状图（与K线使用相同的周期）
+        if 'Volume' in bars.columns:
+            # 根据涨跌设置成交量颜色：上涨日为红色，下跌日为绿色
+            # （用 0/1 数值配合两色色阶，plotly 校验数值数组比逐个校验颜色字符串快得多）
+            is_up = (bars['Close'].to_numpy() >= bars['Open'].to_numpy()).astype(np.int8)
             
             fig.add_trace(go.Bar(
-                x=stock_data.index,
-                y=stock_data['Volume'],
+                x=bars.index,
+                y=bars['Volume'],
                 name='成交量',
-                marker_color=colors,
+                marker=dict(color=is_up, colorscale=[[0, 'green'], [1, 'red']], cmin=0, cmax=1),
                 opacity=0.7
             ), row=2, col=1)
         
-        # 添加交易标记
-        buy_trades = stock_trades[stock_trades['direction'] == 1]
-        sell_trades = stock_trades[stock_trades['direction'] == 2]
-        
-        # 买入标记
+        # 添加交易标记（WebGL 渲染，交易很多时平移缩放仍然流畅）
+        # 买入标记（没有成交价时画在当日最低价）
         if not buy_trades.empty:
-            buy_prices = []
-            for _, trade in buy_trades.iterrows():
-                trade_date = trade['date']
-                # 找到最接近的交易日价格
-                closest_data = stock_data[stock_data.index >= trade_date]
-                if not closest_data.empty:
-                    price = trade['price'] if pd.notna(trade['price']) else closest_data.iloc[0]['Low']
-                    buy_prices.append(price)
-                else:
-                    buy_prices.append(None)
-            
-            fig.add_trace(go.Scatter(
+            fig.add_trace(go.Scattergl(
                 x=buy_trades['date'],
                 y=buy_prices,
                 mode='markers',
                 marker=dict(symbol='triangle-up', size=12, color='red'),
                 name='买入',
-                text=[f"买入 {price:.2f}" if price else "买入" for price in buy_prices],
-                hovertemplate='%{text}<br>日期: %{x}<extra></extra>'
+                hovertemplate='买入 %{y:.2f}<br>日期: %{x}<extra></extra>'
             ), row=1, col=1)
         
-        # 卖出标记
+        # 卖出标记（没有成交价时画在当日最高价）
         if not sell_trades.empty:
-            sell_prices = []
-            for _, trade in sell_trades.iterrows():
-                trade_date = trade['date']
-                # 找到最接近的交易日价格
-                closest_data = stock_data[stock_data.index >= trade_date]
-                if not closest_data.empty:
-                    price = trade['price'] if pd.notna(trade['price']) else closest_data.iloc[0]['High']
-                    sell_prices.append(price)
-                else:
-                    sell_prices.append(None)
-            
-            fig.add_trace(go.Scatter(
+            fig.add_trace(go.Scattergl(
                 x=sell_trades['date'],
                 y=sell_prices,
                 mode='markers',
                 marker=dict(symbol='triangle-down', size=12, color='green'),
                 name='卖出',
-                text=[f"卖出 {price:.2f}" if price else "卖出" for price in sell_prices],
-                hovertemplate='%{text}<br>日期: %{x}<extra></extra>'
+                hovertemplate='卖出 %{y:.2f}<br>日期: %{x}<extra></extra>'
             ), row=1, col=1)
         
         # 设置图表布局
         fig.update_layout(
-            title=f'股票 {stock_code} K线图及交易记录',
+            title=f'股票 {stock_code} K线图及交易记录（{period_label}，{len(bars)} 根）',
             xaxis_rangeslider_visible=False,
             height=800,  # 增加高度以容纳成交量图
             width=None,  # 让图表自适应容器宽度
@@ -602,86 +966,405 @@ class StockTradingVisualizer:
         fig.update_xaxes(title_text="日期", row=2, col=1)
         fig.update_yaxes(title_text="价格", row=1, col=1)
         fig.update_yaxes(title_text="成交量", row=2, col=1)
+        return fig
+
+def chart_date_range(stock_trades):
+    """K线图的日期范围：首笔交易前到末笔交易后各 KLINE_PADDING_DAYS 天"""
+    start_date = stock_trades['date'].min() - timedelta(days=KLINE_PADDING_DAYS)
+    end_date = stock_trades['date'].max() + timedelta(days=KLINE_PADDING_DAYS)
+    return start_date, end_date
+
+def chart_days(chart):
+    """返回缓存的图表内容中K线的 (第一天, 最后一天)"""
+    return date.fromisoformat(chart['first_day']), date.fromisoformat(chart['last_day'])
+
+def figure_cache_key(chart_key, date_range, period):
+    """图表缓存中某个显示区间和K线周期的图表的键"""
+    view = tuple(to_date(day).isoformat() for day in date_range) if date_range else None
+    return ('figure',) + chart_key + (view, period)
+
+def format_trades_detail(trades_detail):
+    """把配对交易记录列表整列格式化为显示用的表格"""
+    detail = pd.DataFrame(trades_detail)
+    table = pd.DataFrame({
+        '买入日期': pd.to_datetime(detail['buy_date']).dt.strftime('%Y-%m-%d'),
+        '买入价格': detail['buy_price'].map('{:.2f}'.format),
+        '卖出日期': pd.to_datetime(detail['sell_date']).dt.strftime('%Y-%m-%d'),
+        '卖出价格': detail['sell_price'].map('{:.2f}'.format),
+        '盈亏百分比': detail['profit_pct'].map('{:+.2f}%'.format),
+        '盈亏状态': np.where(detail['is_profit'].to_numpy(dtype=bool), '盈利', '亏损')
+    })
+    if 'pnl' in detail.columns:
+        # 按数量匹配时买入价格为所平批次的平均价
+        table['成交数量'] = detail['quantity'].map('{:.0f}'.format)
+        table['盈亏金额'] = detail['pnl'].map('{:+,.2f}'.format)
+    return table
+
+def show_trade_stats(stock_code, stats):
+    """显示交易统计和交易明细（stats 由 build_trade_stats 生成）"""
+    st.subheader(f"股票 {stock_code} 交易统计")
+    
+    performance = stats['performance']
+    if performance:
+        has_pnl = 'realized_pnl' in performance
+        col1, col2, col3, col4, col5, *pnl_col = st.columns(6 if has_pnl else 5)
         
-        # 使用全宽度显示图表
-        st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': True})
+        with col1:
+            st.metric("总交易次数", stats['total'])
+        with col2:
+            st.metric("买入次数", stats['buys'])
+        with col3:
+            st.metric("卖出次数", stats['sells'])
+        with col4:
+            st.metric("胜率", f"{performance['win_rate']:.1f}%")
+        with col5:
+            if performance['profit_loss_ratio'] == float('inf'):
+                ratio_text = "∞ (无亏损)"
+            else:
+                ratio_text = f"{performance['profit_loss_ratio']:.2f}"
+            st.metric("盈亏率", ratio_text)
+        if has_pnl:
+            with pnl_col[0]:
+                st.metric("已实现盈亏", f"{performance['realized_pnl']:+,.2f}")
+    else:
+        col1, col2, col3 = st.columns(3)
         
-        # 显示交易统计
-        st.subheader(f"股票 {stock_code} 交易统计")
+        with col1:
+            st.metric("总交易次数", stats['total'])
+        with col2:
+            st.metric("买入次数", stats['buys'])
+        with col3:
+            st.metric("卖出次数", stats['sells'])
         
-        # 获取交易表现数据
-        performance = self.calculate_trade_performance(stock_code)
+        st.info("💡 无价格数据，无法计算胜率和盈亏率")
+    
+    # 显示交易明细
+    st.subheader("交易明细")
+    
+    if stats['detail']:
+        # 显示配对的买卖交易及盈亏
+        st.write("**配对交易记录（含盈亏）：**")
         
-        if performance:
-            col1, col2, col3, col4, col5 = st.columns(5)
-            
-            with col1:
-                st.metric("总交易次数", len(stock_trades))
-            with col2:
-                st.metric("买入次数", len(buy_trades))
-            with col3:
-                st.metric("卖出次数", len(sell_trades))
-            with col4:
-                st.metric("胜率", f"{performance['win_rate']:.1f}%")
-            with col5:
-                if performance['profit_loss_ratio'] == float('inf'):
-                    ratio_text = "∞ (无亏损)"
-                else:
-                    ratio_text = f"{performance['profit_loss_ratio']:.2f}"
-                st.metric("盈亏率", ratio_text)
+        st.dataframe(pd.DataFrame(stats['detail']), use_container_width=True)
+        
+        st.write("**所有交易记录：**")
+    
+    # 显示所有交易记录
+    st.dataframe(pd.DataFrame(stats['trades']), use_container_width=True, hide_index=True)
+
+def marker_prices(trades, stock_data, fallback_column):
+    """
+    返回交易标记的纵坐标数组
+    
+    有成交价时用成交价，否则用交易日当天或之后最近一根K线的 fallback_column 价格；
+    交易日晚于最后一根K线时为 NaN（不画标记）。stock_data 需按日期升序
+    """
+    if stock_data.empty:
+        return np.full(len(trades), np.nan)
+    positions = stock_data.index.searchsorted(trades['date'].to_numpy(), side='left')
+    in_range = positions < len(stock_data)
+    fallback = stock_data[fallback_column].to_numpy(dtype=float)[np.minimum(positions, len(stock_data) - 1)]
+    prices = trades['price'].to_numpy(dtype=float, na_value=np.nan)
+    prices = np.where(np.isnan(prices), fallback, prices)
+    return np.where(in_range, prices, np.nan)
+
+@st.fragment
+def show_cache_panel():
+    """在侧边栏显示共享缓存状态，并提供清空按钮"""
+    with st.expander("🗄️ 共享缓存"):
+        stats = pd.DataFrame(all_cache_stats())
+        if not stats.empty:
+            stats = stats.rename(columns={
+                'name': '缓存',
+                'entries': '条目数',
+                'size_mb': '占用(MB)',
+                'max_mb': '上限(MB)',
+                'ttl': 'TTL(秒)',
+                'hits': '命中',
+                'misses': '未命中',
+                'hit_rate': '命中率',
+                'evictions': '淘汰'
+            })
+            st.dataframe(stats, use_container_width=True, hide_index=True)
+        
+        if st.button("清空共享缓存", key="clear_shared_cache"):
+            clear_all()
+            st.success("共享缓存已清空")
+
+@st.fragment
+def show_provider_panel():
+    """在侧边栏显示各数据源的耗时、错误率和熔断状态"""
+    with st.expander("📡 数据源调度"):
+        stats = pd.DataFrame(get_default_scheduler().stats())
+        if stats.empty:
+            st.caption("尚未请求任何数据源")
         else:
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                st.metric("总交易次数", len(stock_trades))
-            with col2:
-                st.metric("买入次数", len(buy_trades))
-            with col3:
-                st.metric("卖出次数", len(sell_trades))
-            
-            st.info("💡 无价格数据，无法计算胜率和盈亏率")
+            stats['name'] = stats['name'].map(lambda name: PROVIDER_LABELS.get(name, name))
+            stats = stats.rename(columns={
+                'name': '数据源',
+                'state': '状态',
+                'calls': '请求数',
+                'error_rate': '错误率',
+                'misses': '无数据',
+                'p50': 'p50(秒)',
+                'p95': 'p95(秒)',
+                'hedges': '对冲次数',
+                'hedge_wins': '对冲胜出',
+                'last_error': '最近错误'
+            })
+            st.dataframe(stats, use_container_width=True, hide_index=True)
+            st.caption("健康的数据源按 p50 耗时排序；连续失败会触发熔断，冷却后放行一次试探请求")
         
-        # 显示交易明细
-        st.subheader("交易明细")
+        limits = pd.DataFrame(rate_limiter.all_limiter_stats())
+        if not limits.empty:
+            st.markdown("**限流**")
+            limits = limits[['host', 'rate', 'tokens', 'queued_interactive', 'queued_background',
+                             'interactive_wait', 'background_wait', 'avg_wait', 'acquired', 'timeouts']]
+            limits = limits.rename(columns={
+                'host': '主机',
+                'rate': '每秒请求',
+                'tokens': '可用令牌',
+                'queued_interactive': '交互排队',
+                'queued_background': '后台排队',
+                'interactive_wait': '交互预计等待(秒)',
+                'background_wait': '后台预计等待(秒)',
+                'avg_wait': '平均等待(秒)',
+                'acquired': '已放行',
+                'timeouts': '等待超时'
+            })
+            st.dataframe(limits, use_container_width=True, hide_index=True)
         
-        if performance and performance['trades_detail']:
-            # 显示配对的买卖交易及盈亏
-            st.write("**配对交易记录（含盈亏）：**")
+        flight = get_default_single_flight().stats()
+        st.caption(f"合并请求：实际发送 {flight['executed']} 次，合并重复请求 {flight['coalesced']} 次，"
+                   f"进行中 {flight['in_flight']} 个")
+        
+        if st.button("重置数据源统计", key="reset_provider_stats"):
+            get_default_scheduler().reset()
+            st.success("数据源统计已重置")
+
+def format_bytes(size):
+    """把字节数格式化为 KB/MB"""
+    if size < 1024:
+        return f"{size} B"
+    if size < MB:
+        return f"{size / 1024:.1f} KB"
+    return f"{size / MB:.2f} MB"
+
+def build_waterfall_figure(spans, max_spans=60):
+    """把追踪中的阶段画成按开始时间排列的瀑布图，子阶段按层级缩进"""
+    spans = sorted(spans, key=lambda span: span['start'])[:max_spans]
+    depths = {}
+    for span in spans:
+        depths[span['id']] = depths.get(span['parent'], -1) + 1
+    
+    labels = []
+    hover = []
+    for span in spans:
+        detail = ', '.join(f"{key}={value}" for key, value in span['attrs'].items())
+        labels.append('\u3000' * depths[span['id']] + span['name'])
+        hover.append(f"{span['name']}<br>{span['duration'] * 1000:.1f} ms（{span['thread']}）"
+                     + (f"<br>{detail}" if detail else '') + (f"<br>错误: {span['error']}" if span['error'] else ''))
+    
+    fig = go.Figure(go.Bar(
+        y=list(range(len(spans))),
+        x=[span['duration'] * 1000 for span in spans],
+        base=[span['start'] * 1000 for span in spans],
+        orientation='h',
+        marker_color=['#d62728' if span['error'] else '#1f77b4' for span in spans],
+        hovertext=hover,
+        hoverinfo='text'
+    ))
+    fig.update_yaxes(tickvals=list(range(len(spans))), ticktext=labels, autorange='reversed')
+    fig.update_xaxes(title_text='毫秒')
+    fig.update_layout(height=22 * len(spans) + 80, margin=dict(l=10, r=10, t=10, b=40), showlegend=False)
+    return fig
+
+def show_perf_panel(trace):
+    """在侧边栏显示本次运行各阶段的耗时、缓存命中和下载量，并可导出为 JSON"""
+    with st.expander("⏱️ 性能追踪", expanded=True):
+        data = trace.to_dict()
+        counters = data['counters']
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("本次耗时", f"{data['elapsed']:.2f}秒")
+        with col2:
+            st.metric("HTTP请求", counters.get('http_requests', 0))
+        with col3:
+            st.metric("下载", format_bytes(counters.get('bytes_downloaded', 0)))
+        
+        if data['spans']:
+            st.plotly_chart(build_waterfall_figure(data['spans']), use_container_width=True,
+                            config={'displayModeBar': False})
+        else:
+            st.caption("本次运行没有记录到阶段")
+        
+        if data['caches']:
+            caches = pd.DataFrame(data['caches']).rename(columns={
+                'name': '缓存',
+                'hits': '命中',
+                'misses': '未命中',
+                'hit_rate': '命中率'
+            })
+            st.dataframe(caches, use_container_width=True, hide_index=True)
+        
+        st.download_button("导出本次追踪 (JSON)", trace.to_json(indent=2),
+                           file_name=f"perf_trace_{trace.id}.json", mime='application/json',
+                           key="download_perf_trace")
+        
+        recent = perf_trace.recent_traces()
+        if recent:
+            st.download_button(f"导出最近 {len(recent)} 次追踪 (JSON Lines)",
+                               '\n'.join(item.to_json() for item in recent) + '\n',
+                               file_name="perf_traces.jsonl", mime='application/x-ndjson',
+                               key="download_perf_traces")
+
+def show_profile_report(report):
+    """显示一次运行的分析结果：耗时最多的函数，并提供原始分析数据下载"""
+    st.markdown("---")
+    with st.expander("🔬 性能分析结果", expanded=True):
+        st.caption(f"{report.created:%H:%M:%S} 的运行在分析器下耗时 {report.elapsed:.2f} 秒"
+                   "（分析器本身会使耗时变长；只统计页面主线程，数据源工作线程的耗时体现为等待）")
+        
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            sort = st.radio("排序", ['cumulative', 'tottime', 'calls'], horizontal=True, key="profile_sort",
+                            format_func={'cumulative': '累计耗时', 'tottime': '自身耗时', 'calls': '调用次数'}.get)
+        with col2:
+            project_only = st.checkbox("只看本项目代码", key="profile_project_only")
+        with col3:
+            limit = st.number_input("显示函数数", min_value=10, max_value=200, value=30, step=10, key="profile_limit")
+        
+        rows = pd.DataFrame(report.top_functions(limit=int(limit), sort=sort, project_only=project_only))
+        if not rows.empty:
+            rows = rows[['function', 'location', 'calls', 'self_time', 'cumulative_time', 'per_call']].rename(columns={
+                'function': '函数',
+                'location': '位置',
+                'calls': '调用次数',
+                'self_time': '自身耗时(秒)',
+                'cumulative_time': '累计耗时(秒)',
+                'per_call': '每次耗时(秒)'
+            })
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("下载原始分析数据 (.prof)", report.raw, file_name=report.file_name,
+                               mime='application/octet-stream', key="download_profile",
+                               help="可用 python -m pstats 或 snakeviz 打开")
+        with col2:
+            if st.button("关闭分析结果", key="close_profile_report"):
+                st.session_state.pop('profile_report', None)
+                st.rerun()
+
+@st.fragment
+def show_stock_section(visualizer):
+    """股票选择和K线图（切换股票或点击生成K线图时只重新运行这一部分）"""
+    with perf_trace.trace_scope('stock_section') as trace:
+        stock_codes = visualizer.get_stock_codes()
+        
+        st.header("📊 股票选择")
+        
+        # 股票选择 - 使用更好的布局
+        col1, col2 = st.columns([3, 1])
+        
+        with col1:
+            # 选择框文本预先生成，股票名称和板块在后台获取，选择框不必等待
+            stock_labels = visualizer.get_stock_labels()
+            label_status = stock_labels.status()
             
-            trades_detail = []
-            for trade in performance['trades_detail']:
-                trades_detail.append({
-                    '买入日期': trade['buy_date'].strftime('%Y-%m-%d'),
-                    '买入价格': f"{trade['buy_price']:.2f}",
-                    '卖出日期': trade['sell_date'].strftime('%Y-%m-%d'),
-                    '卖出价格': f"{trade['sell_price']:.2f}",
-                    '盈亏百分比': f"{trade['profit_pct']:+.2f}%",
-                    '盈亏状态': '盈利' if trade['is_profit'] else '亏损'
-                })
+            # 选择框的状态按显示文本记录，文本更新后换一个 key 重新创建，并保持当前选中的股票
+            # （文本更新的同时用户刚好切换了股票时，以旧选择框上的选择为准）
+            selector_key = f"stock_selector_{label_status['loaded']}"
+            previous_key = st.session_state.get('stock_selector_key')
+            if previous_key != selector_key and previous_key in st.session_state:
+                last_selected = st.session_state[previous_key]
+            else:
+                last_selected = st.session_state.get('last_selected_stock')
+            st.session_state.stock_selector_key = selector_key
             
-            trades_df = pd.DataFrame(trades_detail)
-            st.dataframe(trades_df, use_container_width=True)
+            selected_stock = st.selectbox(
+                "选择要查看的股票",
+                stock_codes,
+                index=stock_codes.index(last_selected) if last_selected in stock_codes else 0,
+                format_func=stock_labels.label,
+                key=selector_key
+            )
             
-            st.write("**所有交易记录：**")
+            if not label_status['finished']:
+                show_label_progress(stock_labels, label_status['updated_at'])
         
-        # 显示所有交易记录
-        display_trades = stock_trades[['date', 'action', 'price']].copy()
-        display_trades['date'] = display_trades['date'].dt.strftime('%Y-%m-%d')
+        with col2:
+            # 点击按钮时重新运行本片段，重新生成K线图
+            st.button("生成K线图", type="secondary")
         
-        # 重命名列
-        display_trades = display_trades.rename(columns={
-            'date': '交易日期',
-            'action': '操作类型',
-            'price': '交易价格'
-        })
+        st.session_state.last_selected_stock = selected_stock
         
-        # 格式化价格显示
-        if not display_trades['交易价格'].isna().all():
-            display_trades['交易价格'] = display_trades['交易价格'].apply(
-                lambda x: f"{x:.2f}" if pd.notna(x) else "无价格数据"
-            )
+        # K线图显示区域 - 全宽度显示
+        st.markdown("---")
+        st.header(f"📈 股票 {selected_stock} K线图")
+        trace.attrs['stock'] = selected_stock
+        visualizer.plot_stock_with_trades(selected_stock)
         
-        st.dataframe(display_trades, use_container_width=True, hide_index=True)
+        # 在后台预热前后的股票，依次查看时无需等待
+        if st.session_state.get('warm_neighbours', True):
+            visualizer.warm_neighbours(selected_stock, st.session_state.get('chart_period', 'auto'))
+        else:
+            visualizer.cancel_warming()
+
+@st.fragment
+def show_summary_section(visualizer):
+    """所有股票的交易概览（勾选时只重新运行这一部分）"""
+    st.markdown("---")
+    st.subheader("📋 交易概览")
+    
+    if st.checkbox("显示所有股票交易统计"):
+        with perf_trace.trace_scope('summary_section'):
+            # 股票信息按批获取，每批完成后立即刷新表格
+            progress_bar = st.empty()
+            table = st.empty()
+            
+            def on_update(summary_df, done, total):
+                progress_bar.progress(done / total, text=f'正在加载股票信息... {done}/{total}')
+                table.dataframe(summary_df, use_container_width=True, height=400)
+            
+            summary_df = visualizer.get_summary_table(on_update=on_update)
+            
+            # 清除进度显示
+            progress_bar.empty()
+            table.dataframe(summary_df, use_container_width=True, height=400)
+
+@st.fragment(run_every=1)
+def show_label_progress(stock_labels, rendered_at):
+    """
+    显示后台获取股票信息的进度（每秒自动刷新）
+    
+    rendered_at 为选择框生成时的更新时间；之后有新数据且全部完成或距上次刷新超过
+    LABEL_REFRESH_SECONDS 秒时重新运行整个页面，让选择框显示最新的名称
+    """
+    status = stock_labels.status()
+    if status['updated_at'] > rendered_at:
+        if status['finished'] or time.monotonic() - rendered_at >= LABEL_REFRESH_SECONDS:
+            st.rerun()
+    st.caption(f"正在后台获取股票名称和板块... {status['loaded']}/{status['total']}")
+
+@st.fragment(run_every=1)
+def show_prefetch_progress(prefetcher):
+    """显示K线预取进度（每秒自动刷新）"""
+    status = prefetcher.status()
+    total = status['total'] or 1
+    
+    if status['finished']:
+        if status['cancelled']:
+            st.caption(f"K线预取已取消：完成 {status['done']}/{status['total']}")
+        else:
+            st.caption(f"✅ K线预取完成：{status['done']} 只股票，失败 {status['failed']} 只")
+        return
+    
+    st.progress(status['done'] / total, text=f"正在预取K线... {status['done']}/{status['total']}")
+    if status['cancelled']:
+        st.caption("正在取消...")
+    elif st.button("取消预取", key="cancel_prefetch"):
+        prefetcher.cancel()
 
 def main():
     st.set_page_config(page_title="股票交易可视化工具", layout="wide")
@@ -689,6 +1372,9 @@ def main():
     st.title("📈 股票交易可视化工具")
     st.markdown("---")
     
+    # 记录本次运行各阶段的耗时
+    trace = perf_trace.start_trace('rerun')
+    
     # 初始化可视化器
     if 'visualizer' not in st.session_state:
         st.session_state.visualizer = StockTradingVisualizer()
@@ -702,11 +1388,11 @@ def main():
         # 文件选择
         file_option = st.selectbox(
             "选择交易数据文件",
-            ["tdx_transaction_new.csv", "tdx_transaction2.csv", "自定义文件"]
+            ["tdx_transaction_new.csv", "tdx_transaction_new.stxc", "tdx_transaction2.csv", "自定义文件"]
         )
         
         if file_option == "自定义文件":
-            uploaded_file = st.file_uploader("上传CSV文件", type=['csv'])
+            uploaded_file = st.file_uploader("上传CSV或列式交易文件", type=['csv', 'stxc'])
             if uploaded_file is not None:
                 # 保存上传的文件
                 with open(f"temp_{uploaded_file.name}", "wb") as f:
@@ -717,138 +1403,65 @@ def main():
         else:
             file_path = f"c:\\Users\\X1 Yoga\\Saved Games\\AIcode\\{file_option}"
         
+        prefetch_enabled = st.checkbox("加载后预取所有股票K线", value=False,
+                                       help="在后台并发获取所有股票的K线并保存到本地，切换股票时无需等待")
+        
         if st.button("加载数据", type="primary") and file_path:
-            visualizer.load_transactions(file_path)
-            st.success("数据加载成功！")
+            if visualizer.load_transactions(file_path):
+                st.success("数据加载成功！")
+                # 取消上一次未完成的预取和预热
+                if st.session_state.get('prefetcher') is not None:
+                    st.session_state.prefetcher.cancel()
+                visualizer.cancel_warming()
+                st.session_state.prefetcher = visualizer.start_prefetch() if prefetch_enabled else None
+        
+        st.checkbox("预热相邻股票", value=True, key="warm_neighbours",
+                    help="选中股票后在后台准备选择框中前后几只股票和交易最多的股票的K线和图表")
+        
+        if st.session_state.get('prefetcher') is not None:
+            show_prefetch_progress(st.session_state.prefetcher)
+        
+        show_cache_panel()
+        show_provider_panel()
+        
+        show_perf = st.checkbox("显示性能追踪", value=False, key="show_perf_panel",
+                                help="显示本次运行各阶段的耗时瀑布图、缓存命中率和下载量")
+        # 面板在本次运行结束后填充
+        perf_slot = st.empty()
+        
+        if st.button("分析下一次运行", key="profile_next_run_button",
+                     help="用 cProfile 重新运行一次页面，列出耗时最多的函数；也可以在网址后加 ?profile=1"):
+            st.session_state.profile_next_run = True
+            st.rerun()
         
         # 显示数据表（如果数据已加载）
         if visualizer.transactions is not None:
             st.subheader("📋 交易数据预览")
             
-            # 显示数据统计信息
-            total_records = len(visualizer.transactions)
-            unique_stocks = visualizer.transactions['stock_code'].nunique()
-            date_range = f"{visualizer.transactions['date'].min().strftime('%Y-%m-%d')} 至 {visualizer.transactions['date'].max().strftime('%Y-%m-%d')}"
+            # 显示数据统计信息（与数据表一起按交易记录缓存）
+            preview = visualizer.get_preview()
             
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("总记录数", total_records)
+                st.metric("总记录数", preview['total_records'])
             with col2:
-                st.metric("股票数量", unique_stocks)
+                st.metric("股票数量", preview['unique_stocks'])
             with col3:
                 st.metric("日期范围", "")
-                st.caption(date_range)
+                st.caption(preview['date_range'])
             
             # 显示可拖动的数据表
-            display_data = visualizer.transactions[['date', 'stock_code', 'action', 'price']].copy()
-            display_data['date'] = display_data['date'].dt.strftime('%Y-%m-%d')
-            display_data = display_data.rename(columns={
-                'date': '日期',
-                'stock_code': '股票代码', 
-                'action': '操作',
-                'price': '价格'
-            })
-            
             st.dataframe(
-                display_data, 
+                preview['table'], 
                 use_container_width=True, 
                 height=400,  # 设置固定高度，启用滚动
                 hide_index=True
             )
     
-    # 主区域 - 股票选择和图表区域
+    # 主区域 - 股票选择和图表、交易概览各自作为片段运行，操作其中一部分时只重新运行该部分
     if visualizer.transactions is not None:
-        # 获取所有股票代码
-        stock_codes = sorted(visualizer.transactions['stock_code'].unique())
-        
-        st.header("📊 股票选择")
-        
-        # 股票选择 - 使用更好的布局
-        col1, col2 = st.columns([3, 1])
-        
-        with col1:
-            # 为股票选择框准备格式化函数
-            def format_stock_option(stock_code):
-                info = visualizer.get_stock_info(stock_code)
-                performance = visualizer.calculate_trade_performance(stock_code)
-                
-                name = info['name']
-                sector = info['sector']
-                
-                if performance:
-                    win_rate = f"{performance['win_rate']:.1f}%"
-                    profit_trades = f"{performance['profitable_trades']}/{performance['total_trades']}"
-                else:
-                    win_rate = "无价格数据"
-                    profit_trades = "--"
-                
-                return f"{stock_code} | {name} | {sector} | 胜率:{win_rate} ({profit_trades})"
-            
-            selected_stock = st.selectbox(
-                "选择要查看的股票",
-                stock_codes,
-                format_func=format_stock_option,
-                key="stock_selector"
-            )
-        
-        with col2:
-            generate_chart = st.button("生成K线图", type="secondary")
-        
-        # 检查股票选择是否发生变化，实现自动触发
-        if 'last_selected_stock' not in st.session_state:
-            st.session_state.last_selected_stock = None
-        
-        # 判断是否需要显示K线图（自动触发或手动点击）
-        show_chart = False
-        if selected_stock != st.session_state.last_selected_stock:
-            # 股票选择发生变化，自动触发
-            st.session_state.last_selected_stock = selected_stock
-            show_chart = True
-        elif generate_chart:
-            # 手动点击按钮触发
-            show_chart = True
-        
-        # 显示所有股票概览
-        st.subheader("📋 交易概览")
-        
-        if st.checkbox("显示所有股票交易统计"):
-            summary_data = []
-            
-            # 显示加载进度
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            for i, stock in enumerate(stock_codes):
-                status_text.text(f'正在加载股票信息... {i+1}/{len(stock_codes)}')
-                progress_bar.progress((i + 1) / len(stock_codes))
-                
-                stock_trades = visualizer.transactions[visualizer.transactions['stock_code'] == stock]
-                buy_count = len(stock_trades[stock_trades['direction'] == 1])
-                sell_count = len(stock_trades[stock_trades['direction'] == 2])
-                
-                # 获取股票基本信息
-                info = visualizer.get_stock_info(stock)
-                performance = visualizer.calculate_trade_performance(stock)
-                
-                summary_data.append({
-                    '股票代码': stock,
-                    '股票名称': info['name'],
-                    '所属板块': info['sector'],
-                    '总交易次数': len(stock_trades),
-                    '买入次数': buy_count,
-                    '卖出次数': sell_count,
-                    '胜率': f"{performance['win_rate']:.1f}%" if performance else "无价格数据",
-                    '盈亏率': f"{performance['profit_loss_ratio']:.2f}" if performance and performance['profit_loss_ratio'] != float('inf') else "∞" if performance else "--",
-                    '首次交易': stock_trades['date'].min().strftime('%Y-%m-%d'),
-                    '最后交易': stock_trades['date'].max().strftime('%Y-%m-%d')
-                })
-            
-            # 清除进度显示
-            progress_bar.empty()
-            status_text.empty()
-            
-            summary_df = pd.DataFrame(summary_data)
-            st.dataframe(summary_df, use_container_width=True, height=400)
+        show_stock_section(visualizer)
+        show_summary_section(visualizer)
     else:
         st.info("👈 请在左侧选择并加载交易数据文件")
         
@@ -876,16 +1489,37 @@ def main():
         - 第4列：交易价格（可选）
         """)
     
-    # K线图显示区域 - 全宽度显示
-    if visualizer.transactions is not None:
-        # 检查是否有选中的股票需要显示K线图
-        if 'last_selected_stock' in st.session_state and st.session_state.last_selected_stock:
-            selected_stock = st.session_state.last_selected_stock
-            st.markdown("---")
-            st.header(f"📈 股票 {selected_stock} K线图")
-            visualizer.plot_stock_with_trades(selected_stock)
+    trace.finish()
+    if show_perf:
+        with perf_slot.container():
+            show_perf_panel(trace)
+    
+
+
+def run():
+    """
+    运行页面
+    
+    网址带 ?profile=1 时每次运行、在侧边栏点击「分析下一次运行」时下一次运行在 cProfile 下进行，
+    分析结果保存在会话中，显示在页面底部直到关闭
+    """
+    profile_requested = st.query_params.get('profile') == '1'
+    profile_requested = st.session_state.pop('profile_next_run', False) or profile_requested
+    
+    if profile_requested:
+        # 本次运行以 st.rerun()/st.stop() 结束时也保存分析结果，下一次运行时显示
+        def save_report(report):
+            st.session_state.profile_report = report
+        
+        with rerun_profiler.profiling(save_report):
+            main()
+    else:
+        main()
     
+    report = st.session_state.get('profile_report')
+    if report is not None:
+        show_profile_report(report)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run()
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""kline_store 的覆盖区间记录和补齐逻辑"""
+
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+
+import kline_store
+from kline_store import MARKET_TIMEZONE, KlineStore, settled_date
+
+
+def market_time(*args):
+    return datetime(*args, tzinfo=MARKET_TIMEZONE)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # 固定为某个周三收盘后
+    monkeypatch.setattr(kline_store, 'market_now', lambda: market_time(2024, 3, 13, 16))
+    return KlineStore(str(tmp_path / 'klines.sqlite'))
+
+
+def bars(days, close=10.0):
+    index = pd.DatetimeIndex(pd.to_datetime(list(days)), name='Date')
+    values = [close] * len(index)
+    return pd.DataFrame({'Open': values, 'Close': values, 'High': values, 'Low': values,
+                         'Volume': [100] * len(index)}, index=index)
+
+
+def business_days(beg, end):
+    return pd.bdate_range(beg, end)
+
+
+def test_settled_date_uses_market_close_and_weekends():
+    assert settled_date(market_time(2024, 3, 13, 14)) == date(2024, 3, 12)
+    assert settled_date(market_time(2024, 3, 13, 15)) == date(2024, 3, 13)
+    # 周六上午也已确定
+    assert settled_date(market_time(2024, 3, 16, 9)) == date(2024, 3, 16)
+
+
+def test_missing_ranges_empty_store(store):
+    assert store.missing_ranges('000001', '1', '2024-01-01', '2024-02-01') == [(date(2024, 1, 1), date(2024, 2, 1))]
+
+
+def test_missing_ranges_reports_gaps(store):
+    store.save('000001', '1', bars(business_days('2024-01-10', '2024-01-20')), date(2024, 1, 10), date(2024, 1, 20))
+    store.save('000001', '1', bars(business_days('2024-02-01', '2024-02-10')), date(2024, 2, 1), date(2024, 2, 10))
+
+    assert store.missing_ranges('000001', '1', '2024-01-01', '2024-02-20') == [
+        (date(2024, 1, 1), date(2024, 1, 9)),
+        (date(2024, 1, 21), date(2024, 1, 31)),
+        (date(2024, 2, 11), date(2024, 2, 20))
+    ]
+    assert store.missing_ranges('000001', '1', '2024-01-12', '2024-01-18') == []
+    # 其他股票和复权方式不受影响
+    assert store.missing_ranges('000002', '1', '2024-01-12', '2024-01-18') == [(date(2024, 1, 12), date(2024, 1, 18))]
+    assert store.missing_ranges('000001', '0', '2024-01-12', '2024-01-18') == [(date(2024, 1, 12), date(2024, 1, 18))]
+
+
+def test_adjacent_and_overlapping_ranges_merge(store):
+    store.save('000001', '1', bars([]), date(2024, 1, 1), date(2024, 1, 10))
+    store.save('000001', '1', bars([]), date(2024, 1, 11), date(2024, 1, 20))  # 相邻
+    store.save('000001', '1', bars([]), date(2024, 1, 15), date(2024, 1, 25))  # 重叠
+    store.save('000001', '1', bars([]), date(2024, 2, 1), date(2024, 2, 5))    # 不相邻
+    assert store.covered_ranges('000001', '1') == [
+        (date(2024, 1, 1), date(2024, 1, 25)),
+        (date(2024, 2, 1), date(2024, 2, 5))
+    ]
+
+    # 填上中间的缺口后合并为一个区间
+    store.save('000001', '1', bars([]), date(2024, 1, 26), date(2024, 1, 31))
+    assert store.covered_ranges('000001', '1') == [(date(2024, 1, 1), date(2024, 2, 5))]
+
+
+def test_unsettled_tail_is_never_covered(store, monkeypatch):
+    monkeypatch.setattr(kline_store, 'market_now', lambda: market_time(2024, 3, 13, 11))
+    store.save('000001', '1', bars(business_days('2024-03-01', '2024-03-13')), date(2024, 3, 1), date(2024, 3, 13))
+
+    # 盘中的当天K线已保存，但仍需重新获取；结束日期晚于今天时截到今天
+    assert store.covered_ranges('000001', '1') == [(date(2024, 3, 1), date(2024, 3, 12))]
+    assert store.missing_ranges('000001', '1', '2024-03-01', '2024-04-01') == [(date(2024, 3, 13), date(2024, 3, 13))]
+
+    # 收盘后再次保存即登记为已覆盖
+    monkeypatch.setattr(kline_store, 'market_now', lambda: market_time(2024, 3, 13, 16))
+    store.save('000001', '1', bars(['2024-03-13']), date(2024, 3, 13), date(2024, 3, 13))
+    assert store.missing_ranges('000001', '1', '2024-03-01', '2024-04-01') == []
+
+
+def test_weekend_and_no_bar_days_become_covered(store, monkeypatch):
+    monkeypatch.setattr(kline_store, 'market_now', lambda: market_time(2024, 3, 16, 10))  # 周六
+    store.save('000001', '1', bars(business_days('2024-03-11', '2024-03-15')), date(2024, 3, 11), date(2024, 3, 16))
+    assert store.missing_ranges('000001', '1', '2024-03-11', '2024-03-16') == []
+
+    # 工作日开盘后数据源仍没有当天的K线：节假日或停牌
+    monkeypatch.setattr(kline_store, 'market_now', lambda: market_time(2024, 4, 4, 11))
+    store.save('000001', '1', bars(['2024-04-03']), date(2024, 4, 1), date(2024, 4, 4))
+    assert store.missing_ranges('000001', '1', '2024-04-01', '2024-04-04') == []
+
+    # 开盘前没有当天的K线不能说明是非交易日
+    monkeypatch.setattr(kline_store, 'market_now', lambda: market_time(2024, 4, 8, 9))
+    store.save('000001', '1', bars([]), date(2024, 4, 5), date(2024, 4, 8))
+    assert store.missing_ranges('000001', '1', '2024-04-01', '2024-04-08') == [(date(2024, 4, 8), date(2024, 4, 8))]
+
+
+def test_top_up_fetches_only_missing_ranges(store):
+    requested = []
+
+    def fetcher(beg, end):
+        requested.append((beg, end))
+        return bars(business_days(beg, end))
+
+    assert store.top_up('000001', '0', '2024-01-01', '2024-01-31', fetcher) == 1
+    assert store.top_up('000001', '0', '2024-01-01', '2024-01-31', fetcher) == 0
+    assert store.top_up('000001', '0', '2023-12-20', '2024-02-10', fetcher) == 2
+    assert requested == [
+        (date(2024, 1, 1), date(2024, 1, 31)),
+        (date(2023, 12, 20), date(2023, 12, 31)),
+        (date(2024, 2, 1), date(2024, 2, 10))
+    ]
+
+
+def test_top_up_refetches_forward_adjusted_history_after_rebase(store):
+    basis = {'close': 10.0}
+    requested = []
+
+    def fetcher(beg, end):
+        requested.append((beg, end))
+        return bars(business_days(beg, end), close=basis['close'])
+
+    store.top_up('000001', '1', '2024-01-01', '2024-01-31', fetcher)
+    version = store.version('000001', '1')
+
+    # 价格基准不变：补齐尾部时多请求一根相邻的已缓存K线用于核对
+    requested.clear()
+    store.top_up('000001', '1', '2024-01-01', '2024-02-09', fetcher)
+    assert requested == [(date(2024, 1, 31), date(2024, 2, 9))]
+
+    # 除权除息后历史K线整体变化：清除缓存并重新获取整个区间
+    basis['close'] = 9.0
+    requested.clear()
+    store.top_up('000001', '1', '2024-01-01', '2024-02-20', fetcher)
+    assert requested == [(date(2024, 2, 9), date(2024, 2, 20)), (date(2024, 1, 1), date(2024, 2, 20))]
+    assert store.load('000001', '1', '2024-01-01', '2024-02-20')['Close'].unique().tolist() == [9.0]
+    assert store.version('000001', '1') > version
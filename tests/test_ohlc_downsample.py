@@ -0,0 +1,85 @@
+"""ohlc_downsample 的周期聚合和自动模式"""
+
+import numpy as np
+import pandas as pd
+
+from ohlc_downsample import DEFAULT_MAX_BARS, aggregate_ohlc, downsample_ohlc
+
+
+def daily_bars(start, periods):
+    index = pd.bdate_range(start, periods=periods)
+    values = np.arange(periods, dtype=float)
+    return pd.DataFrame({
+        'Open': 100 + values,
+        'High': 110 + values * 2,
+        'Low': 90 - values,
+        'Close': 105 + values,
+        'Volume': 1000 + values
+    }, index=index)
+
+
+def check_periods(df, bars, period):
+    groups = df.groupby(df.index.to_period(period))
+    assert len(bars) == groups.ngroups
+    assert list(bars.index) == [group.index[0] for _, group in groups]
+    np.testing.assert_array_equal(bars['Open'], groups['Open'].first())
+    np.testing.assert_array_equal(bars['High'], groups['High'].max())
+    np.testing.assert_array_equal(bars['Low'], groups['Low'].min())
+    np.testing.assert_array_equal(bars['Close'], groups['Close'].last())
+    np.testing.assert_array_equal(bars['Volume'], groups['Volume'].sum())
+
+
+def test_weekly_aggregation():
+    # 2024-01-03 是周三，第一周不完整
+    df = daily_bars('2024-01-03', 23)
+    bars = aggregate_ohlc(df, 'W')
+    check_periods(df, bars, 'W')
+    first = bars.iloc[0]
+    assert bars.index[0] == pd.Timestamp('2024-01-03')
+    assert (first['Open'], first['High'], first['Low'], first['Close'], first['Volume']) == (100, 114, 88, 107, 3003)
+
+
+def test_monthly_aggregation():
+    df = daily_bars('2024-01-15', 60)
+    # 高低点不在周期的首尾
+    df.iloc[20, df.columns.get_loc('High')] = 500
+    df.iloc[21, df.columns.get_loc('Low')] = 1
+    bars = aggregate_ohlc(df, 'M')
+    check_periods(df, bars, 'M')
+    assert bars['High'].max() == 500 and bars['Low'].min() == 1
+
+
+def test_aggregation_without_volume():
+    df = daily_bars('2024-01-01', 30).drop(columns='Volume')
+    bars = aggregate_ohlc(df, 'W')
+    assert list(bars.columns) == ['Open', 'High', 'Low', 'Close']
+
+
+def test_auto_passes_through_at_threshold():
+    df = daily_bars('2020-01-01', 50)
+    bars, period = downsample_ohlc(df, max_bars=50)
+    assert period is None and bars is df
+
+    df = daily_bars('2020-01-01', DEFAULT_MAX_BARS)
+    bars, period = downsample_ohlc(df)
+    assert period is None and bars is df
+
+
+def test_auto_picks_shortest_period_within_limit():
+    df = daily_bars('2020-01-01', 51)
+    bars, period = downsample_ohlc(df, max_bars=50)
+    assert period == 'W' and len(bars) <= 50
+
+    # 约 4 年日K线：周K超过 100 根，月K不超过
+    df = daily_bars('2020-01-01', 1000)
+    bars, period = downsample_ohlc(df, max_bars=100)
+    assert period == 'M' and len(bars) <= 100
+    check_periods(df, bars, 'M')
+
+
+def test_explicit_and_disabled_periods():
+    df = daily_bars('2024-01-01', 10)
+    bars, period = downsample_ohlc(df, period=None)
+    assert period is None and bars is df
+    bars, period = downsample_ohlc(df, period='W')
+    assert period == 'W' and len(bars) == 2
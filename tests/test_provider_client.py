@@ -0,0 +1,110 @@
+"""provider_client 的K线解析和请求重试"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+import provider_client
+import rate_limiter
+from provider_client import KLINE_COLUMNS, KLINE_EXTRA_COLUMNS, Deadline, ProviderError, parse_eastmoney_klines
+
+TEST_HOST = 'retry-test.invalid'
+
+
+def test_parse_full_rows():
+    df = parse_eastmoney_klines([
+        '2024-01-02,10.0,10.5,10.8,9.9,12345,1.2e7,9.1,5.0,0.5,1.23',
+        '2024-01-03,10.5,10.2,10.6,10.1,2345,2.4e6,4.8,-2.86,-0.3,0.45'
+    ])
+    assert list(df.columns) == KLINE_COLUMNS + KLINE_EXTRA_COLUMNS
+    assert df.index.tolist() == [pd.Timestamp('2024-01-02'), pd.Timestamp('2024-01-03')]
+    assert df['Close'].tolist() == [10.5, 10.2]
+    assert df['Volume'].dtype == 'int64'
+    assert df['Turnover'].tolist() == [1.23, 0.45]
+
+
+def test_parse_rows_without_extra_fields():
+    df = parse_eastmoney_klines(['2024-01-02,1,2,3,0.5,100', '2024-01-03,1,2,3,0.5,100'])
+    assert len(df) == 2
+    assert df['Volume'].tolist() == [100, 100]
+    assert df[KLINE_EXTRA_COLUMNS].isna().all().all()
+
+
+def test_parse_mixed_widths_and_bad_rows():
+    df = parse_eastmoney_klines([
+        '2024-01-02,1,2,3,0.5,100',
+        '2024-01-03,1,2,3,0.5,100,1,2,3,4,5,6',  # 多出的字段被忽略
+        'not-a-date,1,2,3,0.5,100',
+        '2024-01-05,1,2',                        # 字段不足
+        '',
+        '2024-01-08,1,2,3,0.5,1.5'               # 成交量不是整数
+    ])
+    assert df.index.tolist() == [pd.Timestamp('2024-01-02'), pd.Timestamp('2024-01-03')]
+    assert df.loc['2024-01-03', 'Turnover'] == 5
+
+
+def test_unparseable_text_raises_provider_error():
+    with pytest.raises(ProviderError):
+        parse_eastmoney_klines(['"2024-01-02,1,2,3,0.5,100'])
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """本地 HTTP 服务器，按 responses 列表依次返回 (状态码, Retry-After)，之后都返回 200"""
+    state = {'responses': [], 'hits': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state['hits'] += 1
+            status, retry_after = state['responses'].pop(0) if state['responses'] else (200, None)
+            self.send_response(status)
+            if retry_after is not None:
+                self.send_header('Retry-After', retry_after)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'ok')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(provider_client, 'STUB_URL', f'http://127.0.0.1:{server.server_port}')
+    rate_limiter.configure(TEST_HOST, 1000.0, 100)
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+def test_retries_retryable_status_then_succeeds(upstream):
+    upstream['responses'] = [(503, '0'), (429, '0')]
+    response = provider_client.get(TEST_HOST, '/path')
+    assert response.status_code == 200
+    assert upstream['hits'] == 3
+
+
+def test_gives_up_after_max_retries(upstream):
+    upstream['responses'] = [(500, '0')] * 5
+    response = provider_client.get(TEST_HOST, '/path')
+    assert response.status_code == 500
+    assert upstream['hits'] == provider_client.MAX_RETRIES + 1
+
+
+def test_retry_after_beyond_deadline_is_not_waited(upstream):
+    upstream['responses'] = [(429, '4')] * 3
+    started = time.monotonic()
+    response = provider_client.get(TEST_HOST, '/path', timeout=15, deadline=Deadline(2))
+    assert time.monotonic() - started < 1
+    assert response.status_code == 429
+    assert upstream['hits'] == 1
+
+
+def test_every_attempt_takes_a_token(upstream):
+    bucket = rate_limiter.get_limiter(TEST_HOST)
+    acquired = bucket.acquired
+    upstream['responses'] = [(503, '0'), (503, '0')]
+    provider_client.get(TEST_HOST, '/path')
+    assert bucket.acquired - acquired == 3
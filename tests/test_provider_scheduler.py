@@ -0,0 +1,202 @@
+"""provider_scheduler 的熔断器、排序和对冲请求"""
+
+import threading
+import time
+
+import pytest
+
+import provider_client
+import provider_scheduler
+from provider_scheduler import CLOSED, HALF_OPEN, OPEN, ProviderScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(provider_scheduler.time, 'monotonic', clock.monotonic)
+    return clock
+
+
+def failing(message='上游错误'):
+    def fetch():
+        raise provider_client.ProviderError(message)
+    return fetch
+
+
+def returning(value, clock=None, latency=0.0):
+    def fetch():
+        if clock is not None:
+            clock.advance(latency)
+        return value
+    return fetch
+
+
+def state(scheduler, name):
+    return scheduler._get_stats(name).state
+
+
+def open_breaker(scheduler, name):
+    for _ in range(scheduler.failure_threshold):
+        scheduler.execute([(name, failing())])
+    assert state(scheduler, name) == OPEN
+
+
+def test_breaker_opens_after_failure_threshold(clock):
+    scheduler = ProviderScheduler(failure_threshold=3, cooldown=60, hedge=False)
+    for _ in range(2):
+        scheduler.execute([('a', failing())])
+    assert state(scheduler, 'a') == CLOSED
+
+    scheduler.execute([('a', failing())])
+    assert state(scheduler, 'a') == OPEN
+    order, skipped = scheduler.rank(['a', 'b'])
+    assert order == ['b'] and 'a' in skipped
+
+    # 熔断期间 execute 也不会请求
+    calls = []
+    result = scheduler.execute([('a', lambda: calls.append(1))])
+    assert calls == [] and result['skipped'] == ['a'] and result['tried'] == []
+
+
+def test_cooldown_allows_exactly_one_trial(clock):
+    scheduler = ProviderScheduler(failure_threshold=2, cooldown=60, hedge=False)
+    open_breaker(scheduler, 'a')
+    clock.advance(59)
+    assert scheduler.rank(['a'])[0] == []
+
+    clock.advance(1)
+    assert scheduler.rank(['a'])[0] == ['a']
+    assert state(scheduler, 'a') == HALF_OPEN
+
+    # 试探请求进行中时，其他并发的 execute 不会再发出试探
+    release = threading.Event()
+    started = threading.Event()
+    calls = []
+
+    def slow_trial():
+        calls.append('trial')
+        started.set()
+        release.wait(5)
+        return 'ok'
+
+    results = {}
+    thread = threading.Thread(target=lambda: results.update(first=scheduler.execute([('a', slow_trial)])))
+    thread.start()
+    assert started.wait(5)
+    for _ in range(3):
+        second = scheduler.execute([('a', returning('other'))])
+        assert second['skipped'] == ['a'] and second['data'] is None
+    assert 'a' in scheduler.rank(['a'])[1]
+    release.set()
+    thread.join(5)
+    assert calls == ['trial']
+    assert results['first']['data'] == 'ok'
+
+
+def test_successful_trial_closes_breaker(clock):
+    scheduler = ProviderScheduler(failure_threshold=2, cooldown=60, hedge=False)
+    open_breaker(scheduler, 'a')
+    clock.advance(60)
+    result = scheduler.execute([('a', returning('ok'))])
+    assert result['data'] == 'ok'
+    assert state(scheduler, 'a') == CLOSED
+    assert scheduler.rank(['a'])[0] == ['a']
+
+
+def test_failed_trial_reopens_breaker(clock):
+    scheduler = ProviderScheduler(failure_threshold=2, cooldown=60, hedge=False)
+    open_breaker(scheduler, 'a')
+    clock.advance(60)
+    scheduler.execute([('a', failing())])
+    assert state(scheduler, 'a') == OPEN
+    assert scheduler.rank(['a'])[0] == []
+    clock.advance(60)
+    assert scheduler.rank(['a'])[0] == ['a']
+
+
+def test_deadline_during_trial_releases_it(clock):
+    scheduler = ProviderScheduler(failure_threshold=2, cooldown=60, hedge=False)
+    open_breaker(scheduler, 'a')
+    clock.advance(60)
+
+    def deadline_exceeded():
+        raise provider_client.DeadlineExceeded("数据获取已超过总时限")
+
+    result = scheduler.execute([('a', deadline_exceeded)])
+    assert result['data'] is None
+    stats = scheduler._get_stats('a')
+    assert stats.state == HALF_OPEN and not stats.trial_in_flight
+    # 总时限用完不计入统计，下次可以重新试探
+    assert stats.calls == scheduler.failure_threshold
+    assert scheduler.rank(['a'])[0] == ['a']
+    assert scheduler.execute([('a', returning('ok'))])['data'] == 'ok'
+    assert state(scheduler, 'a') == CLOSED
+
+
+def test_rank_orders_by_p50_and_health(clock):
+    scheduler = ProviderScheduler(hedge=False)
+    for _ in range(provider_scheduler.MIN_SAMPLES):
+        scheduler.execute([('slow', returning('x', clock, 0.8))])
+        scheduler.execute([('fast', returning('x', clock, 0.1))])
+    scheduler.execute([('new', returning('x', clock, 0.01))])
+    # 样本不足的排在后面，保持传入顺序
+    assert scheduler.rank(['new', 'slow', 'fast', 'unknown'])[0] == ['fast', 'slow', 'new', 'unknown']
+
+    # 错误率过高的数据源排在健康数据源之后
+    for _ in range(provider_scheduler.MIN_SAMPLES + 1):
+        scheduler.record('fast', 0.1, 'error')
+        scheduler.record('fast', 0.1, 'ok')
+        scheduler.record('fast', 0.1, 'error')
+    assert scheduler.rank(['slow', 'fast'])[0] == ['slow', 'fast']
+
+
+def test_hedge_fires_after_p95_and_first_result_wins():
+    scheduler = ProviderScheduler()
+    for _ in range(provider_scheduler.MIN_SAMPLES):
+        scheduler.record('primary', 0.05, 'ok')
+    release = threading.Event()
+
+    def slow_primary():
+        release.wait(5)
+        return 'primary'
+
+    started = time.monotonic()
+    result = scheduler.execute([('primary', slow_primary), ('backup', returning('backup'))])
+    elapsed = time.monotonic() - started
+    release.set()
+
+    assert result['provider'] == 'backup' and result['data'] == 'backup'
+    assert result['hedged'] and result['tried'] == ['primary', 'backup']
+    # 对冲等待 max(MIN_HEDGE_DELAY, p95)
+    assert provider_scheduler.MIN_HEDGE_DELAY <= elapsed < 2
+    assert scheduler._get_stats('primary').hedges == 1
+    assert scheduler._get_stats('primary').hedge_wins == 1
+
+
+def test_no_hedge_without_latency_samples():
+    scheduler = ProviderScheduler()
+
+    def primary():
+        time.sleep(0.3)
+        return 'primary'
+
+    result = scheduler.execute([('primary', primary), ('backup', returning('backup'))])
+    assert result['provider'] == 'primary' and not result['hedged'] and result['tried'] == ['primary']
+
+
+def test_falls_through_to_next_provider_on_miss_or_error():
+    scheduler = ProviderScheduler(hedge=False)
+    result = scheduler.execute([('a', failing()), ('b', returning(None)), ('c', returning('c'))])
+    assert result['provider'] == 'c' and result['tried'] == ['a', 'b', 'c']
+    assert scheduler._get_stats('b').misses == 1
@@ -0,0 +1,98 @@
+"""rate_limiter 令牌桶的优先级排队和超时清理"""
+
+import threading
+import time
+
+import pytest
+
+import rate_limiter
+from rate_limiter import BACKGROUND, INTERACTIVE, RateLimitTimeout, TokenBucket
+
+
+def drain(bucket):
+    while bucket.tokens >= 1:
+        bucket.acquire()
+
+
+def wait_queued(bucket, count):
+    deadline = time.monotonic() + 5
+    while len(bucket._queue) < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_burst_then_rate():
+    bucket = TokenBucket('host', rate=20.0, burst=3)
+    started = time.monotonic()
+    waits = [bucket.acquire() for _ in range(5)]
+    assert waits[:3] == pytest.approx([0, 0, 0], abs=0.01)
+    # 突发容量用完后按每秒 20 个发放
+    assert time.monotonic() - started == pytest.approx(2 / 20, abs=0.05)
+    assert bucket.acquired == 5
+
+
+def test_interactive_requests_jump_ahead_of_background():
+    # 下一个令牌 0.2 秒后才生成，四个请求都在此之前排队
+    bucket = TokenBucket('host', rate=5.0, burst=1)
+    drain(bucket)
+    order = []
+
+    def request(level, name):
+        bucket.acquire(level=level)
+        order.append(name)
+
+    threads = []
+    for level, name in [(BACKGROUND, 'b1'), (BACKGROUND, 'b2'), (INTERACTIVE, 'i1'), (INTERACTIVE, 'i2')]:
+        thread = threading.Thread(target=request, args=(level, name))
+        thread.start()
+        threads.append(thread)
+        wait_queued(bucket, len(threads))
+    for thread in threads:
+        thread.join(5)
+
+    # 按 (优先级, 到达顺序) 取令牌，先到的后台请求也排在交互请求之后
+    assert order == ['i1', 'i2', 'b1', 'b2']
+
+
+def test_timeout_removes_ticket_and_wakes_next_waiter():
+    bucket = TokenBucket('host', rate=2.0, burst=1)
+    drain(bucket)
+
+    with pytest.raises(RateLimitTimeout):
+        bucket.acquire(timeout=0.05)
+    assert bucket._queue == []
+    assert bucket.timeouts == 1
+
+    # 排在队首的请求超时后，后面的请求不会被卡住
+    results = {}
+
+    def background():
+        try:
+            bucket.acquire(level=BACKGROUND, timeout=0.05)
+        except RateLimitTimeout:
+            results['background'] = 'timeout'
+
+    def later():
+        results['later'] = bucket.acquire(level=BACKGROUND)
+
+    first = threading.Thread(target=background)
+    first.start()
+    wait_queued(bucket, 1)
+    second = threading.Thread(target=later)
+    second.start()
+    first.join(5)
+    second.join(5)
+    assert results['background'] == 'timeout'
+    assert results['later'] < 1.0
+    assert bucket._queue == []
+
+
+def test_priority_context_sets_default_level():
+    assert rate_limiter.current_priority() == INTERACTIVE
+    with rate_limiter.priority(BACKGROUND):
+        assert rate_limiter.current_priority() == BACKGROUND
+    assert rate_limiter.current_priority() == INTERACTIVE
+
+
+def test_parse_rate_limits():
+    assert rate_limiter.parse_rate_limits('a.com=3:6, b.com=0.5') == {'a.com': (3.0, 6), 'b.com': (0.5, 1)}
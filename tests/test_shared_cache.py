@@ -0,0 +1,37 @@
+"""shared_cache 的过期、淘汰和命中统计"""
+
+import time
+
+from shared_cache import SharedCache
+
+
+def test_contains_does_not_count_lookups():
+    cache = SharedCache('test')
+    cache.set('a', 1)
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert cache.stats()['hits'] == 0 and cache.stats()['misses'] == 0
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_expired_entries_are_not_contained():
+    cache = SharedCache('test', ttl=0.05)
+    cache.set('a', 1)
+    assert 'a' in cache
+    time.sleep(0.06)
+    assert 'a' not in cache
+    assert cache.get('a') is None
+
+
+def test_lru_eviction_by_size():
+    cache = SharedCache('test', max_bytes=300)
+    cache.set('a', 'x' * 100)
+    cache.set('b', 'y' * 100)
+    cache.get('a')  # a 最近被使用
+    cache.set('c', 'z' * 100)
+    assert 'a' in cache and 'c' in cache
+    assert 'b' not in cache
+    assert cache.stats()['evictions'] == 1
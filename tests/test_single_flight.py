@@ -0,0 +1,113 @@
+"""single_flight 的调用合并、异常传递和等待超时"""
+
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def start_leader(flight, key, fn):
+    """在后台线程中以 leader 身份调用，返回 (线程, 结果字典)，等到 fn 开始执行后返回"""
+    started = threading.Event()
+    outcome = {}
+
+    def run():
+        try:
+            outcome['value'] = flight.do(key, lambda: (started.set(), fn())[1])
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert started.wait(5)
+    return thread, outcome
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {'rows': 3}
+
+    thread, outcome = start_leader(flight, 'k', fetch)
+    results = []
+    followers = [threading.Thread(target=lambda: results.append(flight.do('k', fetch))) for _ in range(5)]
+    for follower in followers:
+        follower.start()
+    while flight.stats()['coalesced'] < 5:
+        time.sleep(0.01)
+    release.set()
+    thread.join(5)
+    for follower in followers:
+        follower.join(5)
+
+    assert len(calls) == 1
+    assert all(result is outcome['value'] for result in results)
+    assert flight.stats() == {'in_flight': 0, 'executed': 1, 'coalesced': 5}
+
+
+def test_exception_reaches_leader_and_all_followers():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        raise ValueError('上游错误')
+
+    thread, outcome = start_leader(flight, 'k', fetch)
+    errors = []
+
+    def follow():
+        try:
+            flight.do('k', fetch)
+        except ValueError as e:
+            errors.append(e)
+
+    followers = [threading.Thread(target=follow) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    while flight.stats()['coalesced'] < 3:
+        time.sleep(0.01)
+    release.set()
+    thread.join(5)
+    for follower in followers:
+        follower.join(5)
+
+    assert isinstance(outcome['error'], ValueError)
+    assert len(errors) == 3 and all(error is outcome['error'] for error in errors)
+    # 失败的调用不会留下，下一次调用重新执行
+    assert flight.in_flight() == 0
+    assert flight.do('k', lambda: 'ok') == 'ok'
+
+
+def test_follower_timeout_does_not_affect_leader():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        return 'done'
+
+    thread, outcome = start_leader(flight, 'k', fetch)
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        flight.do('k', fetch, timeout=0.1)
+    assert time.monotonic() - started < 2
+
+    release.set()
+    thread.join(5)
+    assert outcome['value'] == 'done'
+    assert flight.in_flight() == 0
+
+
+def test_different_keys_run_independently():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 1) == 1
+    assert flight.do('b', lambda: 2) == 2
+    assert flight.stats()['executed'] == 2
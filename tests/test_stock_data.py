@@ -0,0 +1,61 @@
+"""stock_trading_visualizer 中东方财富K线的获取与共享缓存"""
+
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+
+import kline_store
+import provider_client
+import stock_trading_visualizer as stv
+from kline_store import MARKET_TIMEZONE, KlineStore
+
+
+def bars(days):
+    index = pd.DatetimeIndex(pd.to_datetime(list(days)), name='Date')
+    values = [10.0] * len(index)
+    return pd.DataFrame({'Open': values, 'Close': values, 'High': values, 'Low': values,
+                         'Volume': [100] * len(index)}, index=index)
+
+
+@pytest.fixture
+def visualizer(tmp_path, monkeypatch):
+    monkeypatch.setattr(kline_store, 'market_now', lambda: datetime(2024, 3, 13, 16, tzinfo=MARKET_TIMEZONE))
+    store = KlineStore(str(tmp_path / 'klines.sqlite'))
+    monkeypatch.setattr(stv, 'get_default_store', lambda: store)
+    monkeypatch.setattr(stv, 'get_default_figure_cache', lambda: None)
+    stv.KLINE_CACHE.clear()
+    yield stv.StockTradingVisualizer()
+    stv.KLINE_CACHE.clear()
+
+
+def test_partial_top_up_is_not_cached(visualizer, monkeypatch):
+    # 本地已有1月的K线，2月的区间请求失败
+    visualizer.kline_store.save('000001', stv.EASTMONEY_FQT, bars(pd.bdate_range('2024-01-02', '2024-01-31')),
+                                date(2024, 1, 1), date(2024, 1, 31))
+
+    def failing_fetch(*args, **kwargs):
+        raise provider_client.ProviderError("东方财富接口请求超时")
+
+    monkeypatch.setattr(provider_client, 'fetch_eastmoney_klines', failing_fetch)
+    df = visualizer.get_stock_data_eastmoney('000001', '2024-01-01', '2024-02-29')
+    assert df.index.max() == pd.Timestamp('2024-01-31')
+    cache_key = ('000001', stv.EASTMONEY_FQT, date(2024, 1, 1), date(2024, 2, 29))
+    assert cache_key not in stv.KLINE_CACHE
+
+    # 恢复后补齐缺失的区间，完整结果才进入共享缓存
+    monkeypatch.setattr(provider_client, 'fetch_eastmoney_klines',
+                        lambda code, beg, end, **kwargs: bars(pd.bdate_range(beg, end)))
+    df = visualizer.get_stock_data_eastmoney('000001', '2024-01-01', '2024-02-29')
+    assert df.index.max() == pd.Timestamp('2024-02-29')
+    assert cache_key in stv.KLINE_CACHE
+
+
+def test_failure_without_local_bars_raises(visualizer, monkeypatch):
+    def failing_fetch(*args, **kwargs):
+        raise provider_client.ProviderError("东方财富接口连接失败")
+
+    monkeypatch.setattr(provider_client, 'fetch_eastmoney_klines', failing_fetch)
+    with pytest.raises(provider_client.ProviderError):
+        visualizer.get_stock_data_eastmoney('000001', '2024-01-01', '2024-02-29')
+    assert len(stv.KLINE_CACHE._entries) == 0
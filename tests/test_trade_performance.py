@@ -0,0 +1,138 @@
+"""trade_performance 的 FIFO 配对和持仓批次匹配"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from trade_performance import PAIR_COLUMNS, TradePerformance, match_lots, pair_trades
+
+
+def reference_pairs(transactions):
+    """原来逐行 iterrows 的 FIFO 配对，作为对照"""
+    records = []
+    for stock_code, stock_trades in transactions.groupby('stock_code', sort=True):
+        buy_stack = []
+        for _, trade in stock_trades.sort_values('date', kind='mergesort').iterrows():
+            if trade['direction'] == 1:
+                buy_stack.append(trade)
+            elif trade['direction'] == 2 and buy_stack:
+                buy_trade = buy_stack.pop(0)
+                profit_pct = (trade['price'] - buy_trade['price']) / buy_trade['price'] * 100
+                records.append({
+                    'stock_code': stock_code,
+                    'buy_date': buy_trade['date'],
+                    'sell_date': trade['date'],
+                    'buy_price': buy_trade['price'],
+                    'sell_price': trade['price'],
+                    'profit_pct': profit_pct,
+                    'is_profit': profit_pct > 0
+                })
+    return pd.DataFrame(records, columns=PAIR_COLUMNS)
+
+
+def random_transactions(seed, rows=400, codes=6):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        # 日期有重复，检验同一天内保持文件中的顺序
+        'date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 60, rows), unit='D'),
+        'stock_code': [f"{code:06d}" for code in rng.integers(1, codes + 1, rows)],
+        'direction': rng.choice([1, 2], rows, p=[0.55, 0.45]),
+        'price': np.round(rng.uniform(5, 50, rows), 2)
+    })
+
+
+def trades(*rows, columns=('date', 'stock_code', 'direction', 'price', 'quantity', 'fee')):
+    df = pd.DataFrame(list(rows), columns=list(columns))
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_pair_trades_matches_reference_fifo(seed):
+    transactions = random_transactions(seed)
+    expected = reference_pairs(transactions)
+    actual = pair_trades(transactions)
+
+    sort_keys = ['stock_code', 'sell_date', 'buy_date', 'buy_price', 'sell_price']
+    expected = expected.sort_values(sort_keys, kind='mergesort').reset_index(drop=True)
+    actual = actual.sort_values(sort_keys, kind='mergesort').reset_index(drop=True)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def test_pair_trades_ignores_unmatched_sells():
+    transactions = trades(
+        ('2024-01-02', '000001', 2, 10.0, None, None),  # 没有持仓的卖出
+        ('2024-01-03', '000001', 1, 10.0, None, None),
+        ('2024-01-04', '000001', 1, 12.0, None, None),
+        ('2024-01-05', '000001', 2, 11.0, None, None),
+        ('2024-01-06', '000001', 2, 11.0, None, None),
+        ('2024-01-07', '000001', 2, 20.0, None, None)   # 买入已全部配对
+    )
+    pairs = pair_trades(transactions)
+    assert pairs['buy_price'].tolist() == [10.0, 12.0]
+    assert pairs['is_profit'].tolist() == [True, False]
+
+
+def test_match_lots_partial_fill():
+    lots = match_lots(trades(
+        ('2024-01-02', '000001', 1, 10.0, 300, 0.0),
+        ('2024-01-03', '000001', 2, 12.0, 100, 0.0),
+        ('2024-01-04', '000001', 2, 13.0, 100, 0.0)
+    ))
+    assert lots['quantity'].tolist() == [100, 100]
+    assert lots['buy_date'].tolist() == [pd.Timestamp('2024-01-02')] * 2
+    assert lots['pnl'].tolist() == pytest.approx([200.0, 300.0])
+
+
+def test_match_lots_sell_closes_several_lots():
+    lots = match_lots(trades(
+        ('2024-01-02', '000001', 1, 10.0, 100, 0.0),
+        ('2024-01-03', '000001', 1, 14.0, 100, 0.0),
+        ('2024-01-04', '000001', 1, 20.0, 100, 0.0),
+        ('2024-01-05', '000001', 2, 15.0, 150, 0.0),
+        ('2024-01-06', '000001', 2, 15.0, 500, 0.0)  # 超出持仓的数量被忽略
+    ))
+    first, second = lots.to_dict('records')
+    assert first['quantity'] == 150
+    assert first['buy_date'] == pd.Timestamp('2024-01-02')
+    assert first['buy_price'] == pytest.approx((100 * 10.0 + 50 * 14.0) / 150)
+    assert first['pnl'] == pytest.approx(150 * 15.0 - 1700.0)
+    assert second['quantity'] == 150
+    assert second['buy_price'] == pytest.approx((50 * 14.0 + 100 * 20.0) / 150)
+
+
+def test_match_lots_allocates_fees():
+    lots = match_lots(trades(
+        ('2024-01-02', '000001', 1, 10.0, 200, 10.0),
+        ('2024-01-03', '000001', 2, 11.0, 100, 6.0),
+        ('2024-01-04', '000001', 2, 11.0, 100, 6.0)
+    ))
+    # 买入手续费按数量摊入成本，卖出手续费从卖出金额中扣除
+    assert lots['cost'].tolist() == pytest.approx([1005.0, 1005.0])
+    assert lots['proceeds'].tolist() == pytest.approx([1094.0, 1094.0])
+    assert lots['pnl'].tolist() == pytest.approx([89.0, 89.0])
+    assert lots['profit_pct'].tolist() == pytest.approx([89.0 / 1005.0 * 100] * 2)
+
+
+def test_match_lots_without_quantity_equals_pair_trades():
+    transactions = random_transactions(7)
+    lots = match_lots(transactions)
+    pairs = pair_trades(transactions)
+    sort_keys = ['stock_code', 'sell_date', 'buy_date', 'buy_price']
+    lots = lots.sort_values(sort_keys, kind='mergesort').reset_index(drop=True)
+    pairs = pairs.sort_values(sort_keys, kind='mergesort').reset_index(drop=True)
+    assert lots['buy_price'].tolist() == pytest.approx(pairs['buy_price'].tolist())
+    assert lots['profit_pct'].tolist() == pytest.approx(pairs['profit_pct'].tolist())
+
+
+def test_trade_performance_realized_pnl():
+    performance = TradePerformance(trades(
+        ('2024-01-02', '000001', 1, 10.0, 200, 10.0),
+        ('2024-01-03', '000001', 2, 11.0, 200, 12.0),
+        ('2024-01-02', '000002', 1, 10.0, None, None)  # 没有卖出
+    ))
+    result = performance.get('000001')
+    assert result['total_trades'] == 1
+    assert result['win_rate'] == 100.0
+    assert result['realized_pnl'] == pytest.approx(2200.0 - 12.0 - 2010.0)
+    assert performance.get('000002') is None
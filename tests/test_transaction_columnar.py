@@ -0,0 +1,121 @@
+"""transaction_columnar 的读写和格式校验"""
+
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import transaction_columnar
+from transaction_columnar import ColumnarFormatError, read_header, read_transactions, write_transactions
+from transaction_loader import load_csv, load_transactions
+
+CSV_TEXT = (
+    '日期,代码,方向,价格,数量,金额,手续费\n'
+    '20240102,1,1,10.5,100,1050,5\n'
+    '20240103,600519,2,1700.25,,3400.5,\n'
+    '20240105,300750,1,,200,,1.5\n'
+    '20240108,1,3,11,100,1100,5\n'
+    '20240109,000001,2,11.2,100,1120,5\n'
+)
+
+
+def write_csv(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def assert_same_transactions(actual, expected):
+    assert list(actual.columns) == list(expected.columns)
+    assert list(actual['date']) == list(expected['date'])
+    assert list(actual['stock_code'].cat.categories) == list(expected['stock_code'].cat.categories)
+    np.testing.assert_array_equal(actual['stock_code'].cat.codes, expected['stock_code'].cat.codes)
+    np.testing.assert_array_equal(actual['direction'], expected['direction'])
+    assert list(actual['action']) == list(expected['action'])
+    for name in ('price', 'quantity', 'amount', 'fee'):
+        if name in expected.columns:
+            np.testing.assert_array_equal(actual[name].to_numpy(), expected[name].to_numpy())
+
+
+def test_round_trip_matches_load_csv(tmp_path):
+    expected = load_csv(write_csv(tmp_path, 'trades.csv', CSV_TEXT))
+    path = str(tmp_path / 'trades.stxc')
+    assert write_transactions(expected, path) == len(expected) == 4
+
+    actual = read_transactions(path)
+    assert_same_transactions(actual, expected)
+    assert list(actual['stock_code']) == ['000001', '600519', '300750', '000001']
+    assert list(actual['action']) == ['买入', '卖出', '买入', '卖出']
+    assert np.isnan(actual['price'].iloc[2])
+    assert np.isnan(actual['quantity'].iloc[1]) and np.isnan(actual['fee'].iloc[1])
+
+
+def test_round_trip_without_price_column(tmp_path):
+    expected = load_csv(write_csv(tmp_path, 'trades.csv', '20240102,1,1\n20240103,2,2\n'))
+    path = str(tmp_path / 'trades.stxc')
+    write_transactions(expected, path)
+    actual = read_transactions(path)
+    assert_same_transactions(actual, expected)
+    assert actual['price'].isna().all()
+
+
+def test_empty_file_round_trip(tmp_path):
+    df = pd.DataFrame({'date': [20240102], 'stock_code': ['1'], 'direction': [3], 'price': [1.0]})
+    path = str(tmp_path / 'empty.stxc')
+    assert write_transactions(df, path) == 0
+    assert read_transactions(path).empty
+
+
+def test_rejects_bad_magic(tmp_path):
+    path = tmp_path / 'bad.stxc'
+    path.write_bytes(b'XXXX' + b'\0' * 64)
+    with pytest.raises(ColumnarFormatError, match='不是列式交易文件'):
+        read_transactions(str(path))
+
+    # 比标识还短的文件
+    path.write_bytes(b'ST')
+    with pytest.raises(ColumnarFormatError):
+        read_header(str(path))
+
+
+def test_rejects_unsupported_version(tmp_path):
+    header = json.dumps({'version': transaction_columnar.FORMAT_VERSION + 1, 'rows': 0, 'codes': [], 'columns': []}).encode()
+    path = tmp_path / 'future.stxc'
+    path.write_bytes(transaction_columnar.MAGIC + struct.pack('<I', len(header)) + header)
+    with pytest.raises(ColumnarFormatError, match='不支持的格式版本'):
+        read_transactions(str(path))
+
+
+def test_rejects_corrupt_header(tmp_path):
+    path = tmp_path / 'corrupt.stxc'
+    path.write_bytes(transaction_columnar.MAGIC + struct.pack('<I', 10) + b'{not json}')
+    with pytest.raises(ColumnarFormatError, match='文件头损坏'):
+        read_transactions(str(path))
+
+
+def test_rejects_truncated_file(tmp_path):
+    expected = load_csv(write_csv(tmp_path, 'trades.csv', CSV_TEXT))
+    path = tmp_path / 'trades.stxc'
+    write_transactions(expected, str(path))
+    data = path.read_bytes()
+    path.write_bytes(data[:-16])
+    with pytest.raises(ColumnarFormatError, match='文件不完整'):
+        read_transactions(str(path))
+
+
+def test_load_transactions_dispatches_on_content(tmp_path):
+    csv_path = write_csv(tmp_path, 'trades.csv', CSV_TEXT)
+    expected = load_csv(csv_path)
+
+    # 没有 .stxc 扩展名的列式文件按文件开头的标识识别
+    columnar_path = str(tmp_path / 'export.dat')
+    write_transactions(expected, columnar_path)
+    assert transaction_columnar.is_columnar_file(columnar_path)
+    assert_same_transactions(load_transactions(columnar_path), expected)
+
+    # 没有扩展名的 CSV 仍按 CSV 解析
+    plain_path = write_csv(tmp_path, 'export', CSV_TEXT)
+    assert not transaction_columnar.is_columnar_file(plain_path)
+    assert_same_transactions(load_transactions(plain_path), expected)
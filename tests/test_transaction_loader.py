@@ -0,0 +1,62 @@
+"""transaction_loader 的格式判断和日期转换"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from transaction_loader import TransactionFormatError, load_transactions, sniff, yyyymmdd_to_datetime
+
+
+def test_yyyymmdd_to_datetime_valid_dates():
+    dates = yyyymmdd_to_datetime(np.array([20240102, 20240229, 19991231, 20001231]))
+    assert list(pd.DatetimeIndex(dates)) == [
+        pd.Timestamp('2024-01-02'), pd.Timestamp('2024-02-29'),
+        pd.Timestamp('1999-12-31'), pd.Timestamp('2000-12-31')
+    ]
+
+
+@pytest.mark.parametrize('value', [20240230, 20230229, 20241301, 20240001, 20240100, 20240431, 20240132])
+def test_yyyymmdd_to_datetime_rejects_invalid_dates(value):
+    with pytest.raises(TransactionFormatError, match=str(value)):
+        yyyymmdd_to_datetime(np.array([20240102, value]))
+
+
+def test_yyyymmdd_to_datetime_accepts_float_input():
+    # 按数值读入的日期列为 float64
+    dates = yyyymmdd_to_datetime(np.array([20240102.0]))
+    assert pd.Timestamp(dates[0]) == pd.Timestamp('2024-01-02')
+
+
+def write(tmp_path, name, text, encoding='utf-8'):
+    path = tmp_path / name
+    path.write_bytes(text.encode(encoding))
+    return str(path)
+
+
+def test_sniff_header_and_columns(tmp_path):
+    path = write(tmp_path, 'a.csv', '日期,代码,方向,价格\n20240102,1,1,10.5\n')
+    file_format = sniff(path)
+    assert file_format.has_header
+    assert file_format.columns == ['date', 'stock_code', 'direction', 'price']
+    assert file_format.date_format == 'yyyymmdd'
+
+
+def test_load_without_header_keeps_first_row(tmp_path):
+    path = write(tmp_path, 'b.csv', '2024-01-02,600000,1\n2024-01-03,600000,2\n')
+    df = load_transactions(path)
+    assert len(df) == 2
+    assert df['date'].tolist() == [pd.Timestamp('2024-01-02'), pd.Timestamp('2024-01-03')]
+    assert df['price'].isna().all()
+
+
+def test_load_pads_stock_codes_and_drops_invalid_rows(tmp_path):
+    path = write(tmp_path, 'c.csv', '日期,代码,方向,价格\n20240102,1,1,10.5\n20240103,000001,2,11\n20240104,2,3,9\n', 'gbk')
+    df = load_transactions(path)
+    assert df['stock_code'].astype(str).tolist() == ['000001', '000001']
+    assert df['action'].astype(str).tolist() == ['买入', '卖出']
+
+
+def test_load_rejects_invalid_yyyymmdd(tmp_path):
+    path = write(tmp_path, 'd.csv', '20240102,600000,1,10\n20240230,600000,2,11\n')
+    with pytest.raises(TransactionFormatError):
+        load_transactions(path)
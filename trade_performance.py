@@ -0,0 +1,212 @@
+"""
+交易表现计算
+
+对整个交易记录只排序一次，按股票分组后用向量化运算完成 FIFO 买卖配对，
+一次得到所有股票的配对明细、胜率和盈亏率。
+交易记录带成交数量时改用按数量和手续费匹配持仓批次的 FIFO 引擎，同时给出以金额计的已实现盈亏。
+"""
+
+import numpy as np
+import pandas as pd
+
+PAIR_COLUMNS = ['stock_code', 'buy_date', 'sell_date', 'buy_price', 'sell_price', 'profit_pct', 'is_profit']
+SUMMARY_COLUMNS = ['total_trades', 'profitable_trades', 'win_rate', 'profit_loss_ratio']
+LOT_COLUMNS = ['stock_code', 'buy_date', 'sell_date', 'quantity', 'buy_price', 'sell_price',
+               'cost', 'proceeds', 'pnl', 'profit_pct']
+
+# 数量比较的容差，避免浮点误差留下极小的剩余持仓
+LOT_EPSILON = 1e-9
+
+
+def pair_trades(transactions):
+    """
+    按 FIFO 把每只股票的卖出与最早未配对的买入一一配对，没有可配对买入的卖出会被忽略
+
+    第 k 次卖出后已配对数 m_k = min(m_{k-1} + 1, B_k)（B_k 为此前买入次数），
+    展开得 m_k = k + min(0, min_{j<=k}(B_j - j))，因此可以用分组累计最小值一次算出
+    """
+    df = transactions[['stock_code', 'date', 'direction', 'price']]
+    df = df.sort_values(['stock_code', 'date'], kind='mergesort')
+    codes = df['stock_code']
+
+    is_buy = df['direction'] == 1
+    is_sell = df['direction'] == 2
+    buy_rank = is_buy.astype('int64').groupby(codes).cumsum()
+    sell_rank = is_sell.astype('int64').groupby(codes).cumsum()
+
+    sells = df[is_sell]
+    sell_codes = codes[is_sell]
+    k = sell_rank[is_sell]
+    gap = (buy_rank[is_sell] - k).groupby(sell_codes).cummin()
+    matched_count = k + gap.clip(upper=0)
+    previous_count = matched_count.groupby(sell_codes).shift(fill_value=0)
+    is_matched = matched_count > previous_count
+
+    matched_sells = pd.DataFrame({
+        'stock_code': sell_codes[is_matched].to_numpy(),
+        'rank': matched_count[is_matched].to_numpy(),
+        'sell_date': sells['date'][is_matched].to_numpy(),
+        'sell_price': sells['price'][is_matched].to_numpy(dtype=float)
+    })
+    buys = pd.DataFrame({
+        'stock_code': codes[is_buy].to_numpy(),
+        'rank': buy_rank[is_buy].to_numpy(),
+        'buy_date': df['date'][is_buy].to_numpy(),
+        'buy_price': df['price'][is_buy].to_numpy(dtype=float)
+    })
+
+    pairs = matched_sells.merge(buys, on=['stock_code', 'rank'], how='inner', sort=False)
+    pairs['profit_pct'] = (pairs['sell_price'] - pairs['buy_price']) / pairs['buy_price'] * 100
+    pairs['is_profit'] = pairs['profit_pct'] > 0
+    return pairs[PAIR_COLUMNS]
+
+
+def match_lots(transactions):
+    """
+    按成交数量和手续费做 FIFO 持仓批次匹配
+
+    每笔卖出依次消耗最早的买入批次，支持部分成交和一笔卖出平掉多笔买入；
+    买入手续费按数量摊入成本，卖出手续费从卖出金额中扣除。没有持仓可平的卖出数量会被忽略。
+    每笔卖出返回一行：平仓数量、平均买入价、成本、净卖出金额、已实现盈亏（金额和百分比）
+    """
+    df = transactions.sort_values(['stock_code', 'date'], kind='mergesort')
+    n = len(df)
+
+    codes = df['stock_code'].tolist()
+    # 日期以 int64 纳秒参与循环，避免逐个创建 Timestamp
+    dates = df['date'].to_numpy(dtype='datetime64[ns]').view('int64').tolist()
+    directions = df['direction'].tolist()
+    prices = df['price'].to_numpy(dtype=float).tolist()
+    # 没有数量时每笔按1股处理，结果与一一配对相同
+    quantities = df['quantity'].to_numpy(dtype=float) if 'quantity' in df.columns else np.ones(n)
+    quantities = np.where(np.isnan(quantities), 1.0, quantities).tolist()
+    fees = df['fee'].to_numpy(dtype=float) if 'fee' in df.columns else np.zeros(n)
+    fees = np.where(np.isnan(fees), 0.0, fees).tolist()
+
+    # 以列表实现的持仓队列：head 之前的批次已全部平仓
+    lot_qty = [0.0] * n
+    lot_cost = [0.0] * n  # 每股成本（含买入手续费）
+    lot_price = [0.0] * n
+    lot_date = [0] * n
+    head = tail = 0
+    current_code = None
+
+    records = {column: [] for column in LOT_COLUMNS}
+    for i in range(n):
+        if codes[i] != current_code:
+            current_code = codes[i]
+            head = tail = 0
+
+        qty = quantities[i]
+        if qty <= 0:
+            continue
+
+        if directions[i] == 1:
+            lot_qty[tail] = qty
+            lot_price[tail] = prices[i]
+            lot_cost[tail] = prices[i] + fees[i] / qty
+            lot_date[tail] = dates[i]
+            tail += 1
+        elif directions[i] == 2 and head < tail:
+            remaining = qty
+            matched = 0.0
+            cost = 0.0
+            buy_amount = 0.0
+            buy_date = lot_date[head]
+            while remaining > LOT_EPSILON and head < tail:
+                take = min(remaining, lot_qty[head])
+                cost += take * lot_cost[head]
+                buy_amount += take * lot_price[head]
+                matched += take
+                remaining -= take
+                lot_qty[head] -= take
+                if lot_qty[head] <= LOT_EPSILON:
+                    head += 1
+
+            proceeds = matched * (prices[i] - fees[i] / qty)
+            pnl = proceeds - cost
+            records['stock_code'].append(codes[i])
+            records['buy_date'].append(buy_date)
+            records['sell_date'].append(dates[i])
+            records['quantity'].append(matched)
+            records['buy_price'].append(buy_amount / matched)
+            records['sell_price'].append(prices[i])
+            records['cost'].append(cost)
+            records['proceeds'].append(proceeds)
+            records['pnl'].append(pnl)
+            records['profit_pct'].append(pnl / cost * 100 if cost else np.nan)
+
+    lots = pd.DataFrame(records, columns=LOT_COLUMNS)
+    lots['buy_date'] = pd.to_datetime(lots['buy_date'])
+    lots['sell_date'] = pd.to_datetime(lots['sell_date'])
+    lots['is_profit'] = lots['profit_pct'] > 0
+    return lots
+
+
+def summarize_pairs(pairs):
+    """按股票汇总配对交易，返回以 stock_code 为索引的胜率、盈亏率表"""
+    profit = pairs['profit_pct'].where(pairs['is_profit'], 0.0)
+    loss = pairs['profit_pct'].where(~pairs['is_profit'], 0.0)
+    grouped = pd.DataFrame({
+        'stock_code': pairs['stock_code'],
+        'is_profit': pairs['is_profit'],
+        'profit': profit,
+        'loss': loss
+    }).groupby('stock_code', sort=True)
+
+    summary = pd.DataFrame({
+        'total_trades': grouped.size(),
+        'profitable_trades': grouped['is_profit'].sum().astype('int64'),
+        'total_profit': grouped['profit'].sum(),
+        'total_loss': grouped['loss'].sum().abs()
+    })
+    if 'pnl' in pairs.columns:
+        summary['realized_pnl'] = pairs.groupby('stock_code', sort=True)['pnl'].sum()
+    summary['win_rate'] = summary['profitable_trades'] / summary['total_trades'] * 100
+    summary['profit_loss_ratio'] = np.where(
+        summary['total_loss'] > 0,
+        summary['total_profit'] / summary['total_loss'].where(summary['total_loss'] > 0, 1.0),
+        float('inf')
+    )
+    columns = SUMMARY_COLUMNS + (['realized_pnl'] if 'realized_pnl' in summary.columns else [])
+    return summary[columns]
+
+
+class TradePerformance:
+    """所有股票的交易表现，按股票代码 O(1) 查询"""
+
+    def __init__(self, transactions):
+        # 完全没有价格数据的股票无法计算盈亏
+        has_price = transactions['price'].notna().groupby(transactions['stock_code']).any()
+        priced = transactions[transactions['stock_code'].map(has_price)]
+
+        # 有成交数量时按持仓批次匹配，否则一买一卖配对
+        self.has_quantity = 'quantity' in transactions.columns and transactions['quantity'].notna().any()
+        if self.has_quantity:
+            self.pairs = match_lots(priced)
+        else:
+            self.pairs = pair_trades(priced)
+        self.summary = summarize_pairs(self.pairs)
+        self._pair_positions = self.pairs.groupby('stock_code', sort=False).indices
+
+    def cache_size(self):
+        """占用内存字节数，供共享缓存统计"""
+        return int(self.pairs.memory_usage(deep=True).sum() + self.summary.memory_usage(deep=True).sum())
+
+    def get(self, stock_code):
+        """返回某只股票的交易表现字典，无配对交易时返回None"""
+        if stock_code not in self.summary.index:
+            return None
+
+        row = self.summary.loc[stock_code]
+        detail = self.pairs.iloc[self._pair_positions[stock_code]]
+        performance = {
+            'total_trades': int(row['total_trades']),
+            'profitable_trades': int(row['profitable_trades']),
+            'win_rate': float(row['win_rate']),
+            'profit_loss_ratio': float(row['profit_loss_ratio']),
+            'trades_detail': detail.drop(columns='stock_code').to_dict('records')
+        }
+        if self.has_quantity:
+            performance['realized_pnl'] = float(row['realized_pnl'])
+        return performance
@@ -0,0 +1,178 @@
+"""
+交易记录的列式二进制格式（.stxc）
+
+CSV 每次加载都要逐行解析文本，多年的交易导出文件需要几秒。这里把交易记录按列保存为定长的
+NumPy 数组：日期为 1970-01-01 起的天数（int32），股票代码为字典序号（uint32，字典保存在文件头），
+方向为 int8，成交价、成交数量、成交额、手续费（有时）为 float64
+（float32 只有约 7 位有效数字，按成交价计算的盈亏会差几分钱）。
+加载时用内存映射直接引用文件中的数组，大文件也能在毫秒级打开，同一文件被多个进程加载时共享页缓存。
+
+文件结构：
+    b'STXC' | 文件头长度（uint32，小端） | 文件头（UTF-8 JSON） | 对齐填充 | 各列数据（每列起点按 64 字节对齐）
+文件头记录格式版本、行数、股票代码字典，以及每列的名称、dtype 和相对数据区起点的偏移。
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'STXC'
+FORMAT_VERSION = 1
+
+# 文件扩展名
+SUFFIX = '.stxc'
+
+# 各列起点的对齐字节数
+ALIGNMENT = 64
+
+# 列名及保存的类型（成交数量、成交额、手续费可选）
+COLUMN_DTYPES = {
+    'date': '<i4',
+    'stock_code': '<u4',
+    'direction': 'i1',
+    'price': '<f8',
+    'quantity': '<f8',
+    'amount': '<f8',
+    'fee': '<f8'
+}
+REQUIRED_COLUMNS = ['date', 'stock_code', 'direction', 'price']
+
+# 方向编码对应的操作名称
+ACTION_LABELS = ['买入', '卖出']
+
+
+class ColumnarFormatError(ValueError):
+    """文件不是有效的列式交易文件"""
+
+
+def is_columnar_file(path):
+    """按扩展名或文件开头的标识判断是否为列式交易文件"""
+    if str(path).lower().endswith(SUFFIX):
+        return True
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _to_days(dates):
+    """把 datetime 列或 YYYYMMDD 整数/字符串列转换为 1970-01-01 起的天数"""
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates.astype(str), format='%Y%m%d')
+    return dates.to_numpy().astype('datetime64[D]').astype(np.int32)
+
+
+def write_transactions(df, path):
+    """
+    把交易记录写为列式文件
+
+    df 需有 date、stock_code、direction 列（date 为日期或 YYYYMMDD），可选 price、quantity、amount、fee 列；
+    方向不是 1（买入）或 2（卖出）的记录会被丢弃
+    """
+    df = df[df['direction'].isin([1, 2])]
+    codes, dictionary = pd.factorize(df['stock_code'].astype(str).str.zfill(6), sort=True)
+
+    arrays = {
+        'date': _to_days(df['date']),
+        'stock_code': codes.astype(np.uint32),
+        'direction': df['direction'].to_numpy().astype(np.int8)
+    }
+    if 'price' in df.columns:
+        arrays['price'] = pd.to_numeric(df['price'], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    else:
+        arrays['price'] = np.full(len(df), np.nan)
+    for name in ('quantity', 'amount', 'fee'):
+        if name in df.columns:
+            arrays[name] = pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+    columns = []
+    offset = 0
+    for name, values in arrays.items():
+        values = np.ascontiguousarray(values, dtype=COLUMN_DTYPES[name])
+        arrays[name] = values
+        columns.append({'name': name, 'dtype': COLUMN_DTYPES[name], 'offset': offset})
+        offset = _align(offset + values.nbytes)
+
+    header = json.dumps({
+        'version': FORMAT_VERSION,
+        'rows': len(df),
+        'codes': dictionary.tolist(),
+        'columns': columns
+    }, ensure_ascii=False).encode('utf-8')
+    data_start = _align(len(MAGIC) + 4 + len(header))
+
+    # 先写临时文件再替换，正在映射旧文件的进程不受影响
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for column in columns:
+            f.write(b'\0' * (data_start + column['offset'] - f.tell()))
+            f.write(arrays[column['name']].tobytes())
+    os.replace(tmp_path, path)
+    return len(df)
+
+
+def read_header(path):
+    """读取文件头，返回 (文件头字典, 数据区起点)"""
+    with open(path, 'rb') as f:
+        prefix = f.read(len(MAGIC) + 4)
+        if len(prefix) < len(MAGIC) + 4 or prefix[:len(MAGIC)] != MAGIC:
+            raise ColumnarFormatError(f"{path} 不是列式交易文件")
+        header_length = struct.unpack('<I', prefix[len(MAGIC):])[0]
+        try:
+            header = json.loads(f.read(header_length).decode('utf-8'))
+        except ValueError as e:
+            raise ColumnarFormatError(f"文件头损坏: {str(e)}")
+    if header.get('version') != FORMAT_VERSION:
+        raise ColumnarFormatError(f"不支持的格式版本: {header.get('version')}")
+    return header, _align(len(MAGIC) + 4 + header_length)
+
+
+def read_transactions(path):
+    """
+    以内存映射方式读取列式文件，返回与 CSV 加载结果相同列的 DataFrame
+
+    方向、成交价等数值列直接引用映射的文件内容（只读），股票代码和操作为分类类型，
+    只有日期需要转换为 datetime 而复制一份
+    """
+    header, data_start = read_header(path)
+    rows = header['rows']
+    names = [column['name'] for column in header['columns']]
+    missing = [name for name in REQUIRED_COLUMNS if name not in names]
+    if missing:
+        raise ColumnarFormatError(f"缺少列: {', '.join(missing)}")
+
+    buffer = np.memmap(path, dtype=np.uint8, mode='r') if rows else np.zeros(0, dtype=np.uint8)
+    arrays = {}
+    for column in header['columns']:
+        dtype = np.dtype(column['dtype'])
+        start = data_start + column['offset']
+        end = start + rows * dtype.itemsize
+        if end > len(buffer) and rows:
+            raise ColumnarFormatError(f"文件不完整: 列 {column['name']} 超出文件末尾")
+        arrays[column['name']] = buffer[start:end].view(dtype) if rows else np.zeros(0, dtype=dtype)
+
+    direction = arrays['direction']
+    data = {
+        'date': arrays['date'].astype('datetime64[D]').astype('datetime64[us]'),
+        'stock_code': pd.Categorical.from_codes(
+            arrays['stock_code'].astype(np.int32), categories=pd.Index(header['codes'], dtype=str)
+        ),
+        'direction': direction,
+        'price': arrays['price']
+    }
+    for name in ('quantity', 'amount', 'fee'):
+        if name in arrays:
+            data[name] = arrays[name]
+    data['action'] = pd.Categorical.from_codes(direction.astype(np.int8) - 1, categories=ACTION_LABELS)
+    return pd.DataFrame(data, copy=False)
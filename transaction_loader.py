@@ -0,0 +1,220 @@
+"""
+交易文件的流式加载
+
+原来的加载方式按文件名选择列格式，每种编码都完整读一遍文件，日期再依次尝试三种格式解析。
+这里只读取文件开头的一小段，从内容判断编码、是否有标题行、列数和日期格式，
+然后按固定行数分块解析（每块只保留筛选后的结果），YYYYMMDD 日期用整数运算一次性转换，
+大文件的加载速度接近读盘速度，内存占用不随文件中的无效行和文本缓冲增长。
+列式二进制文件（.stxc）直接以内存映射方式读取。
+"""
+
+import codecs
+import re
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+import transaction_columnar
+
+# 交易文件各列：日期、股票代码、方向、成交价、成交数量、成交额、手续费（后四列可选）
+TRANSACTION_COLUMNS = ['date', 'stock_code', 'direction', 'price', 'quantity', 'amount', 'fee']
+
+# 依次尝试的编码
+ENCODINGS = ['utf-8', 'gbk', 'gb2312']
+
+# 判断格式时读取的文件开头字节数
+SNIFF_BYTES = 64 * 1024
+
+# 每块解析的行数
+CHUNK_ROWS = 200_000
+
+# 方向编码对应的操作名称
+ACTION_LABELS = {1: '买入', 2: '卖出'}
+
+_YYYYMMDD = re.compile(r'^\d{8}$')
+_ISO_DATE = re.compile(r'^\d{4}-\d{1,2}-\d{1,2}$')
+
+
+class TransactionFormatError(ValueError):
+    """无法识别或解析的交易文件"""
+
+
+class FileFormat:
+    """从文件开头判断出的格式"""
+
+    def __init__(self, encoding, has_header, columns, date_format):
+        self.encoding = encoding
+        self.has_header = has_header
+        self.columns = columns
+        self.date_format = date_format  # 'yyyymmdd'、'%Y-%m-%d' 或 None（由 pandas 推断）
+
+    @property
+    def has_price(self):
+        return 'price' in self.columns
+
+    def __repr__(self):
+        return (f"FileFormat(encoding={self.encoding!r}, has_header={self.has_header}, "
+                f"columns={self.columns}, date_format={self.date_format!r})")
+
+
+def sniff(path, sniff_bytes=SNIFF_BYTES):
+    """读取文件开头，判断编码、是否有标题行、列数和日期格式"""
+    with open(path, 'rb') as f:
+        prefix = f.read(sniff_bytes)
+        complete = len(prefix) < sniff_bytes
+
+    if prefix.startswith(codecs.BOM_UTF8):
+        encoding, text = 'utf-8-sig', prefix[len(codecs.BOM_UTF8):]
+    else:
+        encoding, text = None, prefix
+    if not complete and b'\n' in text:
+        # 去掉可能被截断在多字节字符中间的最后一行
+        text = text[:text.rindex(b'\n') + 1]
+
+    for candidate in ([encoding] if encoding else ENCODINGS):
+        try:
+            text = text.decode(candidate)
+        except UnicodeDecodeError:
+            continue
+        encoding = candidate
+        break
+    else:
+        raise TransactionFormatError("无法读取文件，请检查文件编码")
+
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if not lines:
+        raise TransactionFormatError("文件中没有有效的交易记录")
+
+    # 第一行第一列不是数字或日期时视为标题行
+    first_field = lines[0].split(',')[0].strip()
+    has_header = not (first_field.isdigit() or _ISO_DATE.match(first_field))
+    data_lines = lines[1:] if has_header else lines
+    sample = data_lines[0] if data_lines else lines[0]
+    fields = sample.split(',')
+
+    # 按列数判断：至少4列时第4列为成交价，再往后依次为成交数量、成交额、手续费
+    if len(fields) >= 4:
+        columns = TRANSACTION_COLUMNS[:min(len(fields), len(TRANSACTION_COLUMNS))]
+    else:
+        columns = TRANSACTION_COLUMNS[:3]
+
+    first_date = fields[0].strip()
+    if _YYYYMMDD.match(first_date):
+        date_format = 'yyyymmdd'
+    elif _ISO_DATE.match(first_date):
+        date_format = '%Y-%m-%d'
+    else:
+        date_format = None
+    return FileFormat(encoding, has_header, columns, date_format)
+
+
+def yyyymmdd_to_datetime(values):
+    """把 YYYYMMDD 整数数组一次性转换为 datetime64，无效日期抛出 TransactionFormatError"""
+    values = np.asarray(values, dtype=np.int64)
+    years = values // 10000
+    months = values // 100 % 100
+    days = values % 100
+    dates = ((years - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (months - 1)).astype('datetime64[D]')
+    dates = dates + (days - 1)
+
+    # 月、日超出范围（如 20240230）时换算后的年月会变化
+    valid = (months >= 1) & (months <= 12) & (days >= 1) & (days <= 31)
+    valid &= dates.astype('datetime64[M]') == (years - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (months - 1)
+    if not valid.all():
+        bad = values[~valid][0]
+        raise TransactionFormatError(f"日期格式解析失败: 无效日期 {bad}")
+    return dates.astype('datetime64[us]')
+
+
+def _parse_dates(dates, date_format):
+    if date_format == 'yyyymmdd':
+        return yyyymmdd_to_datetime(dates.to_numpy())
+    try:
+        return pd.to_datetime(dates.astype(str), format=date_format)
+    except ValueError as e:
+        raise TransactionFormatError(f"日期格式解析失败: {str(e)}")
+
+
+def _clean_chunk(chunk, file_format):
+    """过滤一块中的无效行并转换各列"""
+    direction = chunk['direction'].to_numpy()
+    valid = (direction == 1) | (direction == 2)
+    chunk = chunk[valid & chunk['date'].notna().to_numpy() & chunk['stock_code'].notna().to_numpy()]
+    if chunk.empty:
+        return chunk
+
+    # 股票代码只有几千种，先编号再对每种代码补齐被截断的前导零，结果为分类类型
+    codes, uniques = pd.factorize(chunk['stock_code'])
+    fixed_codes, categories = pd.factorize(pd.Index(uniques).str.strip().str.zfill(6), sort=True)
+    stock_codes = pd.Categorical.from_codes(fixed_codes[codes], categories=categories)
+    direction = chunk['direction'].to_numpy().astype(np.int8)
+
+    chunk = chunk.assign(
+        date=_parse_dates(chunk['date'], file_format.date_format),
+        stock_code=stock_codes,
+        direction=direction
+    )
+    if not file_format.has_price:
+        chunk['price'] = np.nan
+    chunk['action'] = pd.Categorical.from_codes(direction - 1, categories=list(ACTION_LABELS.values()))
+    return chunk
+
+
+def iter_chunks(path, file_format=None, chunk_rows=CHUNK_ROWS):
+    """逐块返回清洗后的交易记录，file_format 为空时先调用 sniff()"""
+    file_format = file_format or sniff(path)
+    dtype = {'stock_code': str, 'direction': np.float64}
+    if file_format.date_format == 'yyyymmdd':
+        # 整数日期按数值读入，空值为 NaN
+        dtype['date'] = np.float64
+    else:
+        dtype['date'] = str
+
+    reader = pd.read_csv(
+        path,
+        encoding=file_format.encoding,
+        header=None,
+        skiprows=1 if file_format.has_header else 0,
+        names=file_format.columns,
+        usecols=range(len(file_format.columns)),
+        dtype=dtype,
+        skipinitialspace=True,
+        chunksize=chunk_rows
+    )
+    with reader:
+        for chunk in reader:
+            chunk = _clean_chunk(chunk, file_format)
+            if not chunk.empty:
+                yield chunk
+
+
+def load_csv(path, chunk_rows=CHUNK_ROWS):
+    """流式加载 CSV 交易文件，返回 DataFrame（含 action 列）"""
+    file_format = sniff(path)
+    try:
+        chunks = list(iter_chunks(path, file_format, chunk_rows))
+    except UnicodeDecodeError:
+        # 文件开头是合法的 UTF-8 但后面不是，按下一种编码重新读取
+        if file_format.encoding != 'utf-8':
+            raise TransactionFormatError("无法读取文件，请检查文件编码")
+        file_format.encoding = ENCODINGS[1]
+        chunks = list(iter_chunks(path, file_format, chunk_rows))
+
+    if not chunks:
+        return pd.DataFrame(columns=file_format.columns + (['price'] if not file_format.has_price else []) + ['action'])
+    if len(chunks) == 1:
+        return chunks[0]
+
+    # 各块的股票代码分类不同，直接拼接会退化为字符串列，合并分类后再放回
+    stock_codes = union_categoricals([chunk['stock_code'] for chunk in chunks], sort_categories=True)
+    df = pd.concat([chunk.drop(columns='stock_code') for chunk in chunks])
+    df.insert(1, 'stock_code', stock_codes)
+    return df
+
+
+def load_transactions(path, chunk_rows=CHUNK_ROWS):
+    """按文件内容加载交易记录：列式文件以内存映射方式读取，其余按 CSV 流式解析"""
+    if transaction_columnar.is_columnar_file(path):
+        return transaction_columnar.read_transactions(path)
+    return load_csv(path, chunk_rows)